@@ -25,29 +25,37 @@
 
 import os
 import re
+import sys
 import glob
+import logging
 import stat
 import subprocess
 import textwrap
 
-from pathlib import Path
-from collections import OrderedDict
 from lxml import etree
 
-from org.boltlinux.error import UnmetDependency, PackagingError
+from org.boltlinux.error import UnmetDependency, PackagingError, \
+        BoltValueError
 from org.boltlinux.package.platform import Platform
 from org.boltlinux.package.packagemanager import PackageManager
 from org.boltlinux.package.basepackage import BasePackage
 from org.boltlinux.package.packagedesc import PackageDescription
 from org.boltlinux.package.filestats import FileStats
+from org.boltlinux.package.installtree import InstallTree
 
 from org.boltlinux.toolbox.braceexpand import braceexpand
 from org.boltlinux.toolbox.switch import switch
+from org.boltlinux.toolbox.elffile import ElfFile
+
+LOGGER = logging.getLogger(__name__)
 
 class BinaryPackage(BasePackage):
 
     class EntryAttributes:
 
+        __slots__ = ["deftype", "mode", "owner", "group", "conffile",
+                "stats", "dbg_info"]
+
         def __init__(self, spec={}):
             self.deftype  = spec.get("deftype", "file")
             self.mode     = spec.get("mode")
@@ -62,12 +70,16 @@ class BinaryPackage(BasePackage):
                         else False
             if isinstance(self.mode, str):
                 self.mode = int("0o%s" % self.mode, 8)
+            if self.owner:
+                self.owner = sys.intern(self.owner)
+            if self.group:
+                self.group = sys.intern(self.group)
         #end function
 
     #end class
 
     def __init__(self, xml_config, **kwargs):
-        parms = {"debug_pkgs": True}
+        parms = {"debug_pkgs": True, "compress_debug": None}
         parms.update(kwargs)
 
         if isinstance(xml_config, etree._Element):
@@ -115,6 +127,8 @@ class BinaryPackage(BasePackage):
 
         self.make_debug_pkgs = \
             parms["debug_pkgs"]
+        self.compress_debug = \
+            parms["compress_debug"]
         self.install_prefix = \
             parms["install_prefix"]
         self.host_type = \
@@ -275,19 +289,17 @@ class BinaryPackage(BasePackage):
     def output_dir(self, output_dir):
         self._output_dir = os.path.realpath(output_dir)
 
-    def prepare(self):
+    def prepare(self, install_tree=None):
         try:
-            self.generate_file_list()
+            self.generate_file_list(install_tree=install_tree)
         except ValueError as e:
             raise PackagingError("error generating file list: " + str(e))
     #end function
 
-    def pack(self, shlib_cache, bin_pkgs):
-        self.shlib_deps(shlib_cache, bin_pkgs)
-        self.do_pack()
-    #end function
+    def generate_file_list(self, install_tree=None):
+        if install_tree is None:
+            install_tree = InstallTree()
 
-    def generate_file_list(self):
         contents = {}
 
         for src, attr in self.content_spec.items():
@@ -316,31 +328,29 @@ class BinaryPackage(BasePackage):
                             expansions = [rel_path]
                         #end if
                         for pattern in expansions:
-                            listing += list(Path(self.basedir).glob(pattern))
-                    elif os.path.isdir(abs_path) and not \
-                            os.path.islink(abs_path):
+                            listing += install_tree.glob(self.basedir,
+                                    pattern)
+                    elif install_tree.is_dir(abs_path) and not \
+                            install_tree.is_link(abs_path):
                         # entry is a real directory
-                        listing = list(
-                            Path(self.basedir).rglob(rel_path + "/**/*")
-                        )
+                        listing = install_tree.rglob(self.basedir,
+                                rel_path + "/**/*")
                         if src not in contents:
-                            attr.stats = \
-                                FileStats.detect_from_filename(abs_path)
+                            attr.stats = install_tree.stats(abs_path)
                             contents.setdefault(src, attr)
                     else:
                         # entry is a symlink or file
-                        attr.stats = FileStats.detect_from_filename(abs_path)
+                        attr.stats = install_tree.stats(abs_path)
                         contents[src] = attr
                     break
                 #end if
             #end switch
 
-            for path in listing:
-                abs_path = path.as_posix()
-                pkg_path = os.sep + path.relative_to(self.basedir).as_posix()
+            for abs_path in listing:
+                pkg_path = abs_path[len(self.basedir):]
                 if pkg_path in contents:
                     continue
-                stats = FileStats.detect_from_filename(abs_path)
+                stats = install_tree.stats(abs_path)
                 contents[pkg_path] = BinaryPackage.EntryAttributes({
                     "deftype":  "file",
                     "mode":     mode,
@@ -361,14 +371,14 @@ class BinaryPackage(BasePackage):
                 for letter in ["c", "o"]:
                     k_opt = k + letter
                     abs_path = self.basedir + os.sep + k_opt
-                    if not os.path.isfile(abs_path):
+                    if not install_tree.is_file(abs_path):
                         continue
                     py2_style = True
                     if (k_opt in contents) or (k_opt in extra_contents):
                         continue
                     extra_contents[k_opt] = BinaryPackage.EntryAttributes({
                         "deftype": "file",
-                        "stats":   FileStats.detect_from_filename(abs_path)
+                        "stats":   install_tree.stats(abs_path)
                     })
                 #end for
 
@@ -377,11 +387,12 @@ class BinaryPackage(BasePackage):
 
                 k_cache_dir = os.path.dirname(k) + os.sep + "__pycache__"
                 k_base_name = os.path.basename(k)[0:-3]
-                if not os.path.isdir(self.basedir + os.sep + k_cache_dir):
+                if not install_tree.is_dir(self.basedir + os.sep +
+                        k_cache_dir):
                     continue
-                listing = list(Path(self.basedir).glob(
+                listing = install_tree.glob(self.basedir,
                     k_cache_dir.lstrip(os.sep) + os.sep + k_base_name +
-                        ".cpython*.pyc"))
+                        ".cpython*.pyc")
                 if not listing:
                     continue
 
@@ -390,15 +401,13 @@ class BinaryPackage(BasePackage):
                     "stats":   FileStats.default_dir_stats()
                 })
 
-                for path in listing:
-                    abs_path = path.as_posix()
-                    pkg_path = os.sep + path.relative_to(self.basedir)\
-                            .as_posix()
+                for abs_path in listing:
+                    pkg_path = abs_path[len(self.basedir):]
                     if pkg_path in contents:
                         continue
                     extra_contents[pkg_path] = BinaryPackage.EntryAttributes({
                         "deftype": "file",
-                        "stats":   FileStats.detect_from_filename(abs_path)
+                        "stats":   install_tree.stats(abs_path)
                     })
                 #end for
             #end if
@@ -408,10 +417,10 @@ class BinaryPackage(BasePackage):
 
                 if (k not in contents) and (k not in extra_contents):
                     abs_path = self.basedir + os.sep + k
-                    if os.path.exists(abs_path):
+                    if install_tree.exists(abs_path):
                         extra_contents[k] = BinaryPackage.EntryAttributes({
                             "deftype": "dir",
-                            "stats": FileStats.detect_from_filename(abs_path)
+                            "stats": install_tree.stats(abs_path)
                         })
                     #end if
                 #end if
@@ -425,22 +434,33 @@ class BinaryPackage(BasePackage):
                 return False if item[0][0:4] in ["/etc", "/var"] \
                         else True
             #end inline function
-            self.contents = OrderedDict(sorted(filter(filter_etc_var,
-                set(contents.items())), key=lambda x: x[0]))
+            self.contents = dict(sorted(filter(filter_etc_var,
+                contents.items()), key=lambda x: x[0]))
         else:
             self.contents = \
-                OrderedDict(sorted(set(contents.items()), key=lambda x: x[0]))
+                dict(sorted(contents.items(), key=lambda x: x[0]))
         #end if
 
         return self.contents
     #end function
 
-    def strip_debug_symbols_and_delete_rpath(self):
-        objcopy   = Platform.find_executable(self.host_type + "-objcopy")
-        chrpath   = Platform.find_executable("chrpath")
-        hardlinks = {}
+    def strip_objects(self, executor=None, hardlinks=None, dbg_files=None,
+            strip_cache=None):
+        # Objects to strip and the locations of their debug files are
+        # picked in contents order, only the tool invocations are run
+        # concurrently. Pass the same hardlinks dict and dbg_files set for
+        # all packages, so that shared content is only processed once. With
+        # a StripCache, objects stripped in an earlier run are restored.
+        objcopy = Platform.find_executable(self.host_type + "-objcopy")
         install_prefix = self.install_prefix.lstrip("/")
 
+        if hardlinks is None:
+            hardlinks = {}
+        if dbg_files is None:
+            dbg_files = set()
+
+        jobs = []
+
         # strip unstripped objects
         for src, attr in self.contents.items():
             if not (attr.stats.is_file and attr.stats.is_elf_binary):
@@ -461,84 +481,184 @@ class BinaryPackage(BasePackage):
                     ".build-id", build_id[0:2], build_id[2:] + ".debug")
             dbg_path = os.path.normpath(os.sep.join([self.basedir, pkg_path]))
 
+            # identical objects share one debug file, write it only once
+            if dbg_path in dbg_files:
+                dbg_path = None
+            else:
+                dbg_files.add(dbg_path)
+
             hardlinks[dev][ino] = 1
             attr.dbg_info = pkg_path
 
-            os.makedirs(os.path.dirname(dbg_path), exist_ok=True)
+            jobs.append((src_path, dbg_path, attr))
+        #end for
 
-            # if u+w bit is missing objcopy will bail out
-            if not (attr.stats.mode & stat.S_IWUSR):
-                os.chmod(src_path, attr.stats.mode | stat.S_IWUSR)
+        def strip(job):
+            return self._strip_object(*job, objcopy=objcopy,
+                    strip_cache=strip_cache)
 
-            # separate debug information
-            cmd_list = [
-                ([objcopy, "--only-keep-debug", src_path, dbg_path], True),
-                ([objcopy, "--strip-unneeded",  src_path          ], True),
-                ([chrpath, "-d", src_path                         ], False)
-            ]
+        return executor.map(strip, jobs) if executor else map(strip, jobs)
+    #end function
+
+    @staticmethod
+    def check_strip_results(results):
+        errors = [msg for msg in results if msg]
+
+        if errors:
+            raise PackagingError(
+                "failed to strip {} object(s):\n".format(len(errors)) +
+                "\n".join(errors)
+            )
+        #end if
+    #end function
+
+    def publish_debug_info(self, symbol_store):
+        for src, attr in self.contents.items():
+            if not attr.dbg_info:
+                continue
 
-            for cmd, check_retval in cmd_list:
-                subprocess.run(cmd, stderr=subprocess.STDOUT,
-                        check=check_retval)
+            obj_path = os.path.normpath(os.sep.join([self.basedir, src]))
+            dbg_path = os.path.normpath(os.sep.join([self.basedir,
+                attr.dbg_info]))
 
-            # file size has changed
-            attr.stats.restat(src_path)
+            symbol_store.publish(attr.stats.build_id, dbg_path,
+                    obj_path=obj_path)
         #end for
     #end function
 
     def shlib_deps(self, shlib_cache, bin_pkgs):
-        objdump = Platform.find_executable(self.host_type + "-objdump")
+        self.register_shlib_deps(self.lookup_shlib_deps(shlib_cache),
+                bin_pkgs)
+    #end function
+
+    def lookup_shlib_deps(self, shlib_cache):
+        # Returns the candidate providers for the objects in contents order,
+        # see register_shlib_deps().
+        lookups = []
 
         for src, attr in self.contents.items():
-            fallback = None
+            is_so_link = attr.stats.is_symbolic_link and src.endswith(".so")
+            is_object  = attr.stats.is_file and attr.stats.is_elf_binary
 
-            if attr.stats.is_symbolic_link and src.endswith(".so"):
-                link_target = attr.stats.link_target
+            if is_so_link or is_object:
+                lookups.append(
+                    self._lookup_object_deps(src, attr, shlib_cache))
+        #end for
 
-                if not os.path.isabs(link_target):
-                    link_target = os.path.normpath(os.path.dirname(src) +
-                            os.sep + link_target)
-                else:
-                    fallback = "/usr"
-                #end if
+        return lookups
+    #end function
 
-                self._find_and_register_dependency(link_target, shlib_cache,
-                        bin_pkgs, hard_relation=True, fallback=fallback)
-                continue
+    def register_shlib_deps(self, lookups, bin_pkgs):
+        for object_deps in lookups:
+            for lib_name, candidates, hard_relation in object_deps:
+                self._register_dependency(lib_name, candidates, bin_pkgs,
+                        hard_relation=hard_relation)
+            #end for
+        #end for
+    #end function
 
-            if not attr.stats.is_file or not attr.stats.is_elf_binary:
-                continue
+    # PRIVATE
+
+    def _strip_object(self, src_path, dbg_path, attr, objcopy,
+            strip_cache=None):
+        # if u+w bit is missing objcopy will bail out
+        if not (attr.stats.mode & stat.S_IWUSR):
+            os.chmod(src_path, attr.stats.mode | stat.S_IWUSR)
+
+        build_id = attr.stats.build_id
+        digest   = None
+
+        if strip_cache:
+            try:
+                digest = strip_cache.digest(src_path)
+            except OSError:
+                pass
+
+            if digest and strip_cache.restore(build_id, digest, src_path,
+                    dbg_path):
+                attr.stats.restat(src_path)
+                return None
+            #end if
+        #end if
 
-            abs_path  = os.path.normpath(self.basedir + os.sep + src)
-            word_size = attr.stats.arch_word_size
-            cmd       = [objdump, "-p", abs_path]
+        # separate debug information
+        cmd_list = [
+            ([objcopy, "--strip-unneeded", src_path], True)
+        ]
 
-            with subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT, universal_newlines=True) as proc:
-                while True:
-                    line = proc.stdout.readline()
-                    if not line:
-                        break
+        if dbg_path:
+            os.makedirs(os.path.dirname(dbg_path), exist_ok=True)
 
-                    m = re.match(r"^\s*NEEDED\s+(\S+)", line)
-                    if not m:
-                        continue
-                    lib_name = m.group(1)
-                    self._find_and_register_dependency(lib_name, shlib_cache,
-                            bin_pkgs, word_size=word_size)
-                #end for
-            #end with
+            cmd = [objcopy, "--only-keep-debug", src_path, dbg_path]
+            if self.compress_debug:
+                cmd.insert(1, "--compress-debug-sections=" +
+                        self.compress_debug)
+
+            cmd_list.insert(0, (cmd, True))
+        #end if
+
+        for cmd, check_retval in cmd_list:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT)
+
+            if check_retval and proc.returncode != 0:
+                output = proc.stdout.decode("utf-8", errors="replace")
+                return "{}: {} exited with status {}: {}".format(src_path,
+                    os.path.basename(cmd[0]), proc.returncode,
+                        output.strip())
+            #end if
         #end for
+
+        try:
+            if ElfFile(src_path).delete_rpath():
+                LOGGER.info("removed rpath from {}".format(src_path))
+        except (OSError, BoltValueError) as e:
+            return "{}: failed to remove rpath: {}".format(src_path, str(e))
+
+        if digest and dbg_path:
+            strip_cache.store(build_id, digest, src_path, dbg_path)
+
+        # file size has changed
+        attr.stats.restat(src_path)
+        return None
     #end function
 
-    # PRIVATE
+    def _lookup_object_deps(self, src, attr, shlib_cache):
+        result = []
 
-    def _find_and_register_dependency(self, lib_name, shlib_cache,
-            bin_pkgs, word_size=None, hard_relation=False, fallback=None):
-        found  = False
-        relation = "=" if hard_relation else ">="
+        if attr.stats.is_symbolic_link:
+            fallback    = None
+            link_target = attr.stats.link_target
+
+            if not os.path.isabs(link_target):
+                link_target = os.path.normpath(os.path.dirname(src) +
+                        os.sep + link_target)
+            else:
+                fallback = "/usr"
+            #end if
+
+            candidates = self._lookup_dependency(link_target, shlib_cache,
+                    fallback=fallback)
+            result.append((link_target, candidates, True))
+        else:
+            elf_file = attr.stats.elf_file
+
+            if elf_file:
+                for lib_name in elf_file.needed:
+                    candidates = self._lookup_dependency(lib_name,
+                            shlib_cache, word_size=elf_file.word_size)
+                    result.append((lib_name, candidates, False))
+                #end for
+            #end if
+        #end if
+
+        return result
+    #end function
+
+    def _lookup_dependency(self, lib_name, shlib_cache, word_size=None,
+            fallback=None):
+        candidates = []
 
-        # in 99% of all cases, we should find the object here
         for shared_obj in shlib_cache.get(lib_name, [], fallback=fallback):
             if word_size and shared_obj.arch_word_size() != word_size:
                 continue
@@ -547,6 +667,20 @@ class BinaryPackage(BasePackage):
 
             if not pkg_name or not version:
                 continue
+
+            candidates.append((pkg_name, version))
+        #end for
+
+        return candidates
+    #end function
+
+    def _register_dependency(self, lib_name, candidates, bin_pkgs,
+            hard_relation=False):
+        found  = False
+        relation = "=" if hard_relation else ">="
+
+        # in 99% of all cases, we should find the object here
+        for pkg_name, version in candidates:
             if pkg_name == self.name:
                 found = True
                 break
@@ -572,8 +706,8 @@ class BinaryPackage(BasePackage):
                     if "requires" not in self.relations:
                         self.relations["requires"] = \
                                 BasePackage.DependencySpecification()
-                    self.relations["requires"][pkg_name] = \
-                            BasePackage.Dependency(pkg_name, "%s %s" %
+                    self.relations["requires"][pkg.name] = \
+                            BasePackage.Dependency(pkg.name, "%s %s" %
                                     (relation, self.version))
                 #end if
 
@@ -27,18 +27,20 @@ import os
 import stat
 import time
 
-from tempfile import TemporaryDirectory
-from collections import OrderedDict
+from io import BytesIO
 
 import org.boltlinux.toolbox.libarchive as libarchive
 from org.boltlinux.toolbox.libarchive import ArchiveEntry, ArchiveFileWriter
 
+from org.boltlinux.error import PackagingError
 from org.boltlinux.package.filestats import FileStats
 from org.boltlinux.package.binarypackage import BinaryPackage
 from org.boltlinux.package.debianpackagemetadata import DebianPackageMetaData
 
 class DebianPackage(BinaryPackage):
 
+    AR_MAGIC = b"!<arch>\n"
+
     @property
     def debian_binary_version(self):
         return "2.0"
@@ -108,65 +110,64 @@ class DebianPackage(BinaryPackage):
                     default_dir_attrs
             contents[self.install_prefix + "/lib/debug/.build-id"] = \
                     default_dir_attrs
-            contents = OrderedDict(sorted(set(contents.items()),
-                key=lambda x: x[0]))
+            contents = dict(sorted(contents.items(), key=lambda x: x[0]))
         #end if
 
         self.assemble_parts(meta_data, contents, pkg_abspath)
     #end function
 
     def assemble_parts(self, meta_data, pkg_contents, pkg_filename):
-        with TemporaryDirectory(prefix="bolt-") as tmpdir:
-            installed_size = self.write_data_part(pkg_contents,
-                    os.path.join(tmpdir, "data.tar.gz"))
+        # According to Debian Policy Manual Installed-Size is in KB
+        installed_size = int(self.installed_size(pkg_contents) / 1024 + 0.5)
+
+        meta_data["Installed-Size"] = "{}".format(installed_size)
+
+        with BytesIO() as control_part:
+            self.write_control_part(meta_data, pkg_contents, control_part)
+            control_part = control_part.getvalue()
+
+        debian_binary = (self.debian_binary_version + "\n").encode("utf-8")
+        timestamp     = int(time.time())
+
+        # The data part is the last member of the ar archive, so it can be
+        # streamed into the package file and its size filled in afterwards.
+        try:
+            with open(pkg_filename, "wb") as fp:
+                fp.write(DebianPackage.AR_MAGIC)
+
+                for entry_name, entry_contents in [
+                        ("debian-binary", debian_binary),
+                        ("control.tar.gz", control_part)]:
+                    fp.write(self._ar_member_header(entry_name,
+                        len(entry_contents), timestamp))
+                    fp.write(entry_contents)
+                    if len(entry_contents) % 2:
+                        fp.write(b"\n")
+                #end for
 
-            # According to Debian Policy Manual Installed-Size is in KB
-            installed_size = int(installed_size / 1024 + 0.5)
+                header_offset = fp.tell()
+                fp.write(self._ar_member_header("data.tar.gz", 0, timestamp))
 
-            meta_data["Installed-Size"] = "{}".format(installed_size)
+                data_offset = fp.tell()
+                self.write_data_part(pkg_contents, fp)
+                data_size = fp.tell() - data_offset
 
-            self.write_control_part(meta_data, pkg_contents,
-                    os.path.join(tmpdir, "control.tar.gz"))
+                if data_size % 2:
+                    fp.write(b"\n")
 
-            with open(os.path.join(tmpdir, "debian-binary"), "w+",
-                    encoding="utf-8") as fp:
-                fp.write(self.debian_binary_version + "\n")
+                fp.seek(header_offset)
+                fp.write(self._ar_member_header("data.tar.gz", data_size,
+                    timestamp))
             #end with
-
-            with ArchiveFileWriter(pkg_filename, libarchive.FORMAT_AR_SVR4,
-                    libarchive.COMPRESSION_NONE) as archive:
-                with ArchiveEntry() as archive_entry:
-                    for entry_name in ["debian-binary", "control.tar.gz",
-                            "data.tar.gz"]:
-                        archive_entry.clear()
-
-                        full_path = os.path.normpath(os.sep.join([tmpdir,
-                            entry_name]))
-                        archive_entry.copy_stat(full_path)
-                        archive_entry.pathname = entry_name
-                        archive_entry.mode = stat.S_IFREG | 0o644
-                        archive_entry.uid = 0
-                        archive_entry.gid = 0
-                        archive_entry.uname = "root"
-                        archive_entry.gname = "root"
-                        archive.write_entry(archive_entry)
-
-                        with open(full_path, "rb") as fp:
-                            while True:
-                                buf = fp.read(4096)
-                                if not buf:
-                                    break
-                                archive.write_data(buf)
-                            #end while
-                        #end with
-                    #end for
-                #end with
-            #end with
-        #end with
+        except Exception:
+            if os.path.exists(pkg_filename):
+                os.unlink(pkg_filename)
+            raise
+        #end try
     #end function
 
-    def write_control_part(self, meta_data, pkg_contents, ctrl_abspath):
-        with ArchiveFileWriter(ctrl_abspath, libarchive.FORMAT_TAR_USTAR,
+    def write_control_part(self, meta_data, pkg_contents, ctrl_fileobj):
+        with ArchiveFileWriter(ctrl_fileobj, libarchive.FORMAT_TAR_USTAR,
                 libarchive.COMPRESSION_GZIP) as archive:
 
             control_contents = [("control", str(meta_data), 0o644)]
@@ -201,10 +202,22 @@ class DebianPackage(BinaryPackage):
         #end with
     #end function
 
-    def write_data_part(self, pkg_contents, data_abspath):
+    def installed_size(self, pkg_contents):
         installed_size = 0
 
-        with ArchiveFileWriter(data_abspath, libarchive.FORMAT_TAR_USTAR,
+        # imitate behavior of dpkg-gencontrol
+        for src, attr in pkg_contents.items():
+            if attr.stats.is_file or attr.stats.is_symbolic_link:
+                installed_size += attr.stats.st_size
+            else:
+                installed_size += 1024
+        #end for
+
+        return installed_size
+    #end function
+
+    def write_data_part(self, pkg_contents, data_fileobj):
+        with ArchiveFileWriter(data_fileobj, libarchive.FORMAT_TAR_USTAR,
                 libarchive.COMPRESSION_GZIP) as archive:
 
             timestamp = int(time.time())
@@ -242,24 +255,16 @@ class DebianPackage(BinaryPackage):
                     if archive_entry.is_file:
                         with open(real_path, "rb") as fp:
                             while True:
-                                buf = fp.read(4096)
+                                buf = fp.read(1024 * 1024)
                                 if not buf:
                                     break
                                 archive.write_data(buf)
                             #end while
                         #end with
                     #end if
-
-                    # imitate behavior of dpkg-gencontrol
-                    if attr.stats.is_file or attr.stats.is_symbolic_link:
-                        installed_size += attr.stats.st_size
-                    else:
-                        installed_size += 1024
                 #end for
             #end with
         #end with
-
-        return installed_size
     #end function
 
     def meta_data(self, debug_pkg=False):
@@ -321,4 +326,17 @@ class DebianPackage(BinaryPackage):
         return result
     #end function
 
+    # PRIVATE
+
+    def _ar_member_header(self, name, size, mtime):
+        # The size field holds at most 10 decimal digits.
+        if len(str(size)) > 10:
+            raise PackagingError(
+                "ar member '{}' is too large: {} bytes.".format(name, size))
+
+        # Same layout libarchive writes for FORMAT_AR_SVR4.
+        return "{:<16}{:<12}{:<6}{:<6}{:<8o}{:<10}`\n".format(name + "/",
+                mtime, 0, 0, stat.S_IFREG | 0o644, size).encode("ascii")
+    #end function
+
 #end class
@@ -28,7 +28,7 @@ import re
 from xml.sax.saxutils import escape as xml_escape
 
 from org.boltlinux.error import BoltError
-from org.boltlinux.package.xpkg import BaseXpkg
+from org.boltlinux.package.versionkey import VersionKey
 from org.boltlinux.deb2bolt.packageutils import PackageUtilsMixin
 
 class DebianPackageVersion:
@@ -50,13 +50,14 @@ class DebianPackageVersion:
 
         self.epoch, self.version, self.revision = \
             m.groups(default="")
+        self.key = VersionKey.parse(version)
     #end function
 
     def __str__(self):
         return self.full
 
     def __lt__(self, other):
-        return BaseXpkg.compare_versions(self.full, other.full) == -1
+        return self.key < other.key
 
 #end class
 
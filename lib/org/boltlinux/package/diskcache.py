@@ -0,0 +1,114 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import json
+
+from tempfile import NamedTemporaryFile
+
+from org.boltlinux.package.appconfig import AppConfig
+
+# A JSON document in ~/.bolt/cache that stays valid for as long as the key it
+# was stored under, usually the stat_key() of the files it was derived from.
+# The cache is an optimization, so failing to read or write it is not an
+# error.
+class DiskCache:
+
+    @staticmethod
+    def stat_key(*filenames):
+        key = []
+
+        for filename in filenames:
+            try:
+                stats = os.stat(filename)
+            except OSError:
+                key.append([filename, None])
+                continue
+
+            key.append([filename, stats.st_mtime_ns, stats.st_size,
+                stats.st_ino])
+        #end for
+
+        return key
+    #end function
+
+    def __init__(self, name, version):
+        self.filename = os.path.join(AppConfig.get_config_folder(), "cache",
+                name + ".json")
+        self.version  = version
+    #end function
+
+    def get(self, key, build_func):
+        data = self.load(key)
+
+        if data is None:
+            data = build_func()
+            self.store(key, data)
+        #end if
+
+        return data
+    #end function
+
+    def load(self, key):
+        try:
+            with open(self.filename, "r", encoding="utf-8") as fp:
+                doc = json.load(fp)
+
+            if doc.get("version") == self.version and doc.get("key") == key:
+                return doc["data"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+        #end try
+
+        return None
+    #end function
+
+    def store(self, key, data):
+        doc = {
+            "version": self.version,
+            "key": key,
+            "data": data
+        }
+
+        cache_dir = os.path.dirname(self.filename)
+        tempfile  = None
+
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+
+            with NamedTemporaryFile(mode="w+", encoding="utf-8",
+                    dir=cache_dir, delete=False) as tempfile:
+                json.dump(doc, tempfile, separators=(",", ":"))
+
+            os.rename(tempfile.name, self.filename)
+        except OSError:
+            pass
+        finally:
+            if tempfile and os.path.exists(tempfile.name):
+                os.unlink(tempfile.name)
+        #end try
+    #end function
+
+#end class
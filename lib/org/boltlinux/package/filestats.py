@@ -24,7 +24,6 @@
 #
 
 import os
-import re
 import time
 import stat
 import magic
@@ -36,81 +35,109 @@ except ImportError:
 
 from collections import namedtuple
 
+from org.boltlinux.error import BoltValueError
+from org.boltlinux.toolbox.elffile import ElfFile, ET_EXEC, ET_DYN
+
+Magic = namedtuple("Magic", ["name", "mime_type", "encoding"])
+
+# Values that repeat across a whole install tree, stored only once.
+_interned = {}
+
+def _intern(value):
+    return _interned.setdefault(value, value)
+
+
+Stats = namedtuple("Stats", [
+    "st_mode",
+    "st_ino",
+    "st_dev",
+    "st_nlink",
+    "st_uid",
+    "st_gid",
+    "st_size",
+    "st_atime",
+    "st_mtime",
+    "st_ctime"
+])
+
 class FileStats:
 
+    # ELF properties are read from the object's headers once. libmagic is
+    # only consulted when the magic description of a file is requested. The
+    # stat fields are copied out of os.stat_result, which is several times
+    # larger than what is needed for packaging.
+    __slots__ = ["_magic_obj", "_filename", "_elf_file", "link_target"] + \
+            list(Stats._fields)
+
     @staticmethod
     def default_dir_stats():
-        magic_obj = {
-            "name":      "directory",
-            "mime_type": "inode/directory",
-            "encoding":  "binary"
-        }
-
         timestamp = int(time.time())
 
-        stats_obj = {
-            "st_mode":  stat.S_IFDIR | 0o0755,
-            "st_ino":   0,
-            "st_dev":   0,
-            "st_nlink": 3,
-            "st_uid":   0,
-            "st_gid":   0,
-            "st_size":  0,
-            "st_atime": timestamp,
-            "st_mtime": timestamp,
-            "st_ctime": timestamp
-        }
-
-        return FileStats(
-            namedtuple("Magic", magic_obj.keys())(**magic_obj),
-            namedtuple("Stats", stats_obj.keys())(**stats_obj)
+        magic_obj = Magic(
+            name="directory",
+            mime_type="inode/directory",
+            encoding="binary"
         )
+
+        stats_obj = Stats(
+            st_mode=stat.S_IFDIR | 0o0755,
+            st_ino=0,
+            st_dev=0,
+            st_nlink=3,
+            st_uid=0,
+            st_gid=0,
+            st_size=0,
+            st_atime=timestamp,
+            st_mtime=timestamp,
+            st_ctime=timestamp
+        )
+
+        return FileStats(magic_obj, stats_obj)
     #end function
 
     @staticmethod
     def default_file_stats():
-        magic_obj = {
-            "name":      "data",
-            "mime_type": "application/octet-stream",
-            "encoding":  "binary"
-        }
-
         timestamp = int(time.time())
 
-        stats_obj = {
-            "st_mode":  stat.S_IFREG | 0o0644,
-            "st_ino":   0,
-            "st_dev":   0,
-            "st_nlink": 1,
-            "st_uid":   0,
-            "st_gid":   0,
-            "st_size":  0,
-            "st_atime": timestamp,
-            "st_mtime": timestamp,
-            "st_ctime": timestamp
-        }
-
-        return FileStats(
-            namedtuple("Magic", magic_obj.keys())(**magic_obj),
-            namedtuple("Stats", stats_obj.keys())(**stats_obj)
+        magic_obj = Magic(
+            name="data",
+            mime_type="application/octet-stream",
+            encoding="binary"
         )
+
+        stats_obj = Stats(
+            st_mode=stat.S_IFREG | 0o0644,
+            st_ino=0,
+            st_dev=0,
+            st_nlink=1,
+            st_uid=0,
+            st_gid=0,
+            st_size=0,
+            st_atime=timestamp,
+            st_mtime=timestamp,
+            st_ctime=timestamp
+        )
+
+        return FileStats(magic_obj, stats_obj)
     #end function
 
     @staticmethod
     def detect_from_filename(filename):
-        if os.path.islink(filename):
+        try:
+            stats_obj = os.lstat(filename)
+        except FileNotFoundError:
+            raise ValueError("no such file '%s'" % filename)
+
+        magic_obj = None
+
+        if stat.S_ISLNK(stats_obj.st_mode):
             link_target = os.readlink(filename)
             magic_obj = FileMagic(
                     mime_type='inode/symlink', encoding='binary',
                     name='symbolic link to ' + link_target)
-        else:
-            if not os.path.exists(filename):
-                raise ValueError("no such file '%s'" % filename)
-            magic_obj = magic.detect_from_filename(filename)
         #end if
 
-        stats_obj = os.lstat(filename)
-        filestats = FileStats(magic_obj, stats_obj)
+        filestats = FileStats(magic_obj, stats_obj, filename=filename)
 
         if filestats.is_symbolic_link:
             filestats.link_target = link_target
@@ -118,138 +145,154 @@ class FileStats:
         return filestats
     #end function
 
-    def __init__(self, magic_obj, stats_obj):
+    def __init__(self, magic_obj, stats_obj, filename=None):
         self._magic_obj = magic_obj
-        self._stats_obj = stats_obj
+        self._filename  = filename
+        self._set_stats(stats_obj)
+        self._elf_file  = self._detect_elf()
         self.link_target = ""
     #end function
 
     def restat(self, filename):
-        self._stats_obj = os.lstat(filename)
+        self._filename  = filename
+        self._set_stats(os.lstat(filename))
+        self._elf_file  = self._detect_elf()
+    #end function
+
+    @property
+    def elf_file(self):
+        return self._elf_file
+
+    @property
+    def magic(self):
+        if self._magic_obj is None:
+            self._magic_obj = magic.detect_from_filename(self._filename)
+        return self._magic_obj
     #end function
 
     @property
     def mode(self):
-        return stat.S_IMODE(self._stats_obj.st_mode)
+        return stat.S_IMODE(self.st_mode)
     #end function
 
     @property
     def device(self):
-        return self._stats_obj.st_dev
+        return self.st_dev
     #end function
 
     @property
     def inode(self):
-        return self._stats_obj.st_ino
+        return self.st_ino
     #end function
 
     @property
     def num_links(self):
-        return self._stats_obj.st_nlink
+        return self.st_nlink
     #end function
 
     @property
     def build_id(self):
-        regexp_build_id = \
-            r"ELF \d+-bit .SB .*, BuildID\[sha1\]=([0-9a-fA-F]+).*"
-        m = re.match(regexp_build_id, self._magic_obj.name)
-        if m:
-            return m.group(1)
-        return None
+        elf_file = self._elf_file
+        return elf_file.build_id if elf_file else None
     #end function
 
     @property
     def is_elf_binary(self):
-        regexp = r"ELF \d+-bit .SB .*"
-        if re.match(regexp, self._magic_obj.name):
-            return True
-        return False
+        return self._elf_file is not None
     #end function
 
     @property
     def is_stripped(self):
-        regexp = r"ELF \d+-bit .SB .*, .* linked.*, .*not stripped"
-        if re.match(regexp, self._magic_obj.name):
-            return False
+        # Like file(1), only linked objects count as unstripped.
+        elf_file = self._elf_file
+        if elf_file and elf_file.elf_type in (ET_EXEC, ET_DYN):
+            return not elf_file.has_symtab
         return True
     #end function
 
     @property
     def is_dynamically_linked(self):
-        regexp_bin = \
-            r"ELF \d+-bit .SB .*?executable.*, dynamically linked.*"
-        regexp_lib = \
-            r"ELF \d+-bit .SB .*?shared object.*, dynamically linked.*"
-
-        magic = self._magic_obj.name
-        if re.match(regexp_bin, magic) or re.match(regexp_lib, magic):
-            return True
-
+        elf_file = self._elf_file
+        if elf_file and elf_file.elf_type in (ET_EXEC, ET_DYN):
+            return elf_file.is_dynamically_linked
         return False
     #end function
 
     @property
     def arch_word_size(self):
-        regexp_elf = r"ELF (\d+)-bit .SB.*"
-        m = re.match(regexp_elf, self._magic_obj.name)
-        if m:
-            return m.group(1)
-        return None
+        elf_file = self._elf_file
+        return elf_file.word_size if elf_file else None
     #end function
 
     @property
     def is_file(self):
-        return stat.S_ISREG(self._stats_obj.st_mode) != 0
+        return stat.S_ISREG(self.st_mode) != 0
     #end function
 
     @property
     def is_directory(self):
-        return stat.S_ISDIR(self._stats_obj.st_mode) != 0
+        return stat.S_ISDIR(self.st_mode) != 0
     #end function
 
     @property
     def is_symbolic_link(self):
-        return stat.S_ISLNK(self._stats_obj.st_mode) != 0
+        return stat.S_ISLNK(self.st_mode) != 0
     #end function
 
     @property
     def is_block_device(self):
-        return stat.S_ISBLK(self._stats_obj.st_mode) != 0
+        return stat.S_ISBLK(self.st_mode) != 0
     #end function
 
     @property
     def is_char_device(self):
-        return stat.S_ISCHR(self._stats_obj.st_mode) != 0
+        return stat.S_ISCHR(self.st_mode) != 0
     #end function
 
     @property
     def is_fifo(self):
-        return stat.S_ISFIFO(self._stats_obj.st_mode) != 0
+        return stat.S_ISFIFO(self.st_mode) != 0
     #end function
 
     @property
     def is_socket(self):
-        return stat.S_ISSOCK(self._stats_obj.st_mode) != 0
+        return stat.S_ISSOCK(self.st_mode) != 0
     #end function
 
     def __getattr__(self, name):
-        stat_attributes = [
-            "st_mode",
-            "st_ino",
-            "st_dev",
-            "st_nlink",
-            "st_uid",
-            "st_gid",
-            "st_size",
-            "st_atime",
-            "st_mtime",
-            "st_ctime"
-        ]
-
-        if name in stat_attributes:
-            return self._stats_obj.__getattribute__(name)
-        else:
-            return self._magic_obj.__getattribute__(name)
+        if name in Magic._fields:
+            return getattr(self.magic, name)
+        raise AttributeError(name)
+    #end function
+
+    # PRIVATE
+
+    def _set_stats(self, stats_obj):
+        self.st_mode  = _intern(stats_obj.st_mode)
+        self.st_ino   = stats_obj.st_ino
+        self.st_dev   = _intern(stats_obj.st_dev)
+        self.st_nlink = stats_obj.st_nlink
+        self.st_uid   = _intern(stats_obj.st_uid)
+        self.st_gid   = _intern(stats_obj.st_gid)
+        self.st_size  = stats_obj.st_size
+        self.st_atime = int(stats_obj.st_atime)
+        self.st_mtime = int(stats_obj.st_mtime)
+        self.st_ctime = int(stats_obj.st_ctime)
+    #end function
+
+    def _detect_elf(self):
+        if not (self._filename and self.is_file):
+            return None
+        # Too small to hold an ELF header.
+        if self.st_size < 52:
+            return None
+        if not ElfFile.is_elf(self._filename):
+            return None
+
+        try:
+            return ElfFile(self._filename)
+        except (OSError, BoltValueError):
+            return None
     #end function
 
 #end class
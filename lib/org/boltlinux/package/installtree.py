@@ -0,0 +1,200 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import re
+import fnmatch
+
+from org.boltlinux.package.filestats import FileStats
+
+# Answers the existence, type and glob queries that binary packages make
+# against the install directory. Every directory is scanned at most once and
+# the FileStats of every path are detected at most once, no matter how many
+# packages ask for them.
+class InstallTree:
+
+    class Entry:
+
+        __slots__ = ["is_dir", "is_file", "is_link", "exists"]
+
+        def __init__(self, dir_entry):
+            self.is_link = dir_entry.is_symlink()
+
+            try:
+                self.is_dir  = dir_entry.is_dir()
+                self.is_file = dir_entry.is_file()
+            except OSError:
+                self.is_dir  = False
+                self.is_file = False
+            #end try
+
+            self.exists = self.is_dir or self.is_file or not self.is_link or \
+                    os.path.exists(dir_entry.path)
+        #end function
+
+    #end class
+
+    def __init__(self):
+        self._listings = {}
+        self._patterns = {}
+        self._stats    = {}
+    #end function
+
+    def listdir(self, path):
+        listing = self._listings.get(path)
+
+        if listing is None:
+            listing = {}
+
+            try:
+                with os.scandir(path) as it:
+                    for dir_entry in it:
+                        listing[dir_entry.name] = InstallTree.Entry(dir_entry)
+                #end with
+            except OSError:
+                pass
+
+            self._listings[path] = listing
+        #end if
+
+        return listing
+    #end function
+
+    def exists(self, path):
+        entry = self._lookup(path)
+        return entry is not None and entry.exists
+
+    def is_dir(self, path):
+        entry = self._lookup(path)
+        return entry is not None and entry.is_dir
+
+    def is_file(self, path):
+        entry = self._lookup(path)
+        return entry is not None and entry.is_file
+
+    def is_link(self, path):
+        entry = self._lookup(path)
+        return entry is not None and entry.is_link
+
+    def stats(self, path):
+        file_stats = self._stats.get(path)
+
+        if file_stats is None:
+            file_stats = FileStats.detect_from_filename(path)
+            self._stats[path] = file_stats
+        #end if
+
+        return file_stats
+    #end function
+
+    # Same matches as pathlib.Path(basedir).glob(pattern), but returned as
+    # strings that start with basedir + os.sep.
+    def glob(self, basedir, pattern):
+        parts = [p for p in pattern.split(os.sep) if p and p != "."]
+
+        if pattern.endswith(os.sep):
+            parts.append("")
+        if not self.is_dir(basedir):
+            return []
+
+        return list(self._select(basedir, parts))
+    #end function
+
+    def rglob(self, basedir, pattern):
+        return self.glob(basedir, "**" + os.sep + pattern)
+
+    # PRIVATE
+
+    def _lookup(self, path):
+        path = os.path.normpath(path)
+
+        if path == os.sep:
+            return None
+
+        dirname, basename = os.path.split(path)
+        return self.listdir(dirname).get(basename)
+    #end function
+
+    def _select(self, path, parts):
+        if not parts or not parts[0]:
+            yield path
+            return
+        #end if
+
+        pattern, rest = parts[0], parts[1:]
+        dirs_only = bool(rest)
+
+        if pattern == "**":
+            yielded = set()
+
+            for start in self._iterate_directories(path):
+                for p in self._select(start, rest):
+                    if p not in yielded:
+                        yielded.add(p)
+                        yield p
+                #end for
+            #end for
+        elif "**" in pattern:
+            raise ValueError("invalid pattern: '**' can only be an entire "
+                    "path component")
+        elif "*" in pattern or "?" in pattern or "[" in pattern:
+            match = self._compile(pattern)
+
+            for name, entry in self.listdir(path).items():
+                if dirs_only and not entry.is_dir:
+                    continue
+                if match(name):
+                    yield from self._select(path + os.sep + name, rest)
+            #end for
+        else:
+            child = path + os.sep + pattern
+
+            if (self.is_dir if dirs_only else self.exists)(child):
+                yield from self._select(child, rest)
+        #end if
+    #end function
+
+    def _iterate_directories(self, path):
+        yield path
+
+        # Like pathlib, don't descend into symlinked directories.
+        for name, entry in self.listdir(path).items():
+            if entry.is_dir and not entry.is_link:
+                yield from self._iterate_directories(path + os.sep + name)
+        #end for
+    #end function
+
+    def _compile(self, pattern):
+        match = self._patterns.get(pattern)
+
+        if match is None:
+            match = re.compile(fnmatch.translate(pattern)).fullmatch
+            self._patterns[pattern] = match
+        #end if
+
+        return match
+    #end function
+
+#end class
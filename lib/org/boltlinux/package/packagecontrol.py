@@ -25,12 +25,18 @@
 
 import os
 import shutil
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor
 
 from org.boltlinux.error import UnmetDependency, InvocationError
 from org.boltlinux.package.basepackage import BasePackage
 from org.boltlinux.package.sourcepackage import SourcePackage
 from org.boltlinux.package.debianpackage import DebianPackage
 from org.boltlinux.package.shlibcache import ShlibCache
+from org.boltlinux.package.installtree import InstallTree
+from org.boltlinux.package.stripcache import StripCache
+from org.boltlinux.package.symbolstore import SymbolStore
 from org.boltlinux.package.specfile import Specfile
 from org.boltlinux.package.changelog import Changelog
 from org.boltlinux.package.sourcecache import SourceCache
@@ -48,6 +54,8 @@ class PackageControl:
             "format": "deb",
             "ignore_deps": False,
             "outdir": None,
+            "compress_debug": None,
+            "symbol_store": None,
         }
         self.parms.update(kwargs)
 
@@ -166,6 +174,7 @@ class PackageControl:
             pkg = DebianPackage(
                 node,
                 debug_pkgs=self.parms["debug_pkgs"],
+                compress_debug=self.parms["compress_debug"],
                 install_prefix=self.defines["BOLT_INSTALL_PREFIX"],
                 host_type=self.defines["BOLT_HOST_TYPE"],
                 build_for=self.parms["build_for"]
@@ -256,15 +265,50 @@ class PackageControl:
     #end function
 
     def package(self):
-        shlib_cache = ShlibCache(prefix=self.defines["BOLT_INSTALL_PREFIX"])
-        for pkg in self.bin_pkgs:
-            pkg.prepare()
+        shlib_cache  = ShlibCache(prefix=self.defines["BOLT_INSTALL_PREFIX"])
+        install_tree = InstallTree()
         for pkg in self.bin_pkgs:
-            pkg.strip_debug_symbols_and_delete_rpath()
+            pkg.prepare(install_tree=install_tree)
+
+        # num_cpus() returns 0 where /proc/cpuinfo has no "processor : N"
+        # lines, e.g. on s390x.
+        max_workers = max(1, Platform.num_cpus())
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Strip the objects of all packages concurrently and report all
+            # failures at once.
+            hardlinks   = {}
+            dbg_files   = set()
+            strip_cache = StripCache(
+                tool_id="{}:{}".format(
+                    StripCache.tool_version(Platform.find_executable(
+                        self.defines["BOLT_HOST_TYPE"] + "-objcopy")),
+                    self.parms["compress_debug"]
+                )
+            )
+
+            results = [
+                pkg.strip_objects(executor=executor, hardlinks=hardlinks,
+                    dbg_files=dbg_files, strip_cache=strip_cache)
+                        for pkg in self.bin_pkgs
+            ]
+            DebianPackage.check_strip_results(itertools.chain(*results))
+            strip_cache.prune()
+
+            if self.parms["symbol_store"]:
+                symbol_store = SymbolStore(self.parms["symbol_store"])
+                for pkg in self.bin_pkgs:
+                    pkg.publish_debug_info(symbol_store)
+            #end if
+
+        #end with
+
         for pkg in self.bin_pkgs:
             shlib_cache.overlay_package(pkg)
         for pkg in self.bin_pkgs:
-            pkg.pack(shlib_cache, self.bin_pkgs)
+            pkg.shlib_deps(shlib_cache, self.bin_pkgs)
+        for pkg in self.bin_pkgs:
+            pkg.do_pack()
     #end function
 
     def repackage(self):
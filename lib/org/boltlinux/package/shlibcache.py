@@ -25,17 +25,26 @@
 
 import os
 import re
-import locale
-import subprocess
-from org.boltlinux.package.platform import Platform
+import struct
+import threading
+from org.boltlinux.error import BoltValueError
+from org.boltlinux.package.diskcache import DiskCache
 from org.boltlinux.package.filestats import FileStats
 from org.boltlinux.package.packagemanager import PackageManager
+from org.boltlinux.toolbox.elffile import ElfFile
 
 class ShlibCache:
 
+    LD_SO_CACHE   = "/etc/ld.so.cache"
+    CACHE_VERSION = 1
+
+    OLD_CACHE_MAGIC = b"ld.so-1.7.0"
+    NEW_CACHE_MAGIC = b"glibc-ld.so.cache1.1"
+
     class SharedObject:
 
-        def __init__(self, lib_path):
+        def __init__(self, lib_path, lock):
+            self.lock        = lock
             self.lib_path    = lib_path
             self.pkg_name    = None
             self.pkg_version = None
@@ -43,105 +52,94 @@ class ShlibCache:
         #end function
 
         def package_name(self):
-            if self.pkg_name is None:
-                pkg_manager = PackageManager.instance()
-                self.pkg_name = \
-                        pkg_manager.which_package_provides(self.lib_path)
-            return self.pkg_name
+            with self.lock:
+                if self.pkg_name is None:
+                    pkg_manager = PackageManager.instance()
+                    self.pkg_name = \
+                            pkg_manager.which_package_provides(self.lib_path)
+                return self.pkg_name
+            #end with
         #end function
 
         def package_version(self):
-            if self.pkg_version is None:
-                pkg_manager = PackageManager.instance()
-                self.pkg_version = pkg_manager\
-                        .installed_version_of_package(self.package_name())
-            return self.pkg_version
+            with self.lock:
+                if self.pkg_version is None:
+                    pkg_manager = PackageManager.instance()
+                    self.pkg_version = pkg_manager\
+                            .installed_version_of_package(self.package_name())
+                return self.pkg_version
+            #end with
         #end function
 
         def package_name_and_version(self):
             return self.package_name(), self.package_version()
 
         def arch_word_size(self):
-            if self.word_size is None:
-                self.word_size = FileStats\
-                        .detect_from_filename(os.path.realpath(self.lib_path))\
-                        .arch_word_size
-            return self.word_size
+            with self.lock:
+                if self.word_size is None:
+                    try:
+                        self.word_size = ElfFile(
+                            os.path.realpath(self.lib_path)).word_size
+                    except (OSError, BoltValueError):
+                        pass
+                #end if
+                return self.word_size
+            #end with
         #end function
 
     #end class
 
     def __init__(self, prefix="/usr"):
+        # Guards the map and the lazily resolved SharedObject fields, so that
+        # a cache can be shared between the threads resolving dependencies.
+        self.lock = threading.RLock()
         self.prefixes = [prefix]
         self.map = {}
-        self.have_ldconfig = False
+        self.scanned_dirs = set()
+        self.have_ld_so_cache = os.path.isfile(ShlibCache.LD_SO_CACHE)
 
-        ldconfig = Platform.find_executable("ldconfig")
-        if ldconfig:
-            self.have_ldconfig = True
-
-            try:
-                procinfo = subprocess.run(
-                    [ldconfig, "-p"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    check=True
-                )
-            except subprocess.CalledProcessError as e:
-                raise RuntimeError(
-                    "failed to initialize shlib cache: " + str(e)
-                )
-
-            output_lines = procinfo\
-                    .stdout\
-                    .decode(locale.getpreferredencoding(False))\
-                    .splitlines()
-
-            for line in output_lines:
-                m = re.match(r"^\s*(\S+) \((.*)\) => (\S+)", line)
-                if not m:
-                    continue
-                if "hwcap" in m.group(2):
-                    continue
-
-                lib_name = m.group(1)
-                lib_path = m.group(3)
-
-                if "libx" in lib_path:
-                    continue
+        # On glibc systems the linker cache lists all libraries, otherwise
+        # (musl, tools) the prefix library directories are scanned.
+        if self.have_ld_so_cache:
+            sources = [ShlibCache.LD_SO_CACHE]
+        else:
+            sources = [p + os.sep + "lib" for p in self.prefixes]
+
+        pkg_manager = self._package_manager()
+        if pkg_manager:
+            sources.append(pkg_manager.STATUS_FILE)
+
+        # Word sizes and owning packages are resolved up front and kept on
+        # disk until the linker cache or the package database change.
+        cache   = DiskCache("shlib-cache", ShlibCache.CACHE_VERSION)
+        entries = cache.get(DiskCache.stat_key(*sources),
+                lambda: self._build_entries(pkg_manager))
+
+        for lib_name, lib_path, pkg_name, pkg_version, word_size in entries:
+            shared_obj             = ShlibCache.SharedObject(lib_path,
+                    self.lock)
+            shared_obj.pkg_name    = pkg_name
+            shared_obj.pkg_version = pkg_version
+            shared_obj.word_size   = word_size
+
+            self.map.setdefault(lib_name, []).append(shared_obj)
+        #end for
 
-                self.map.setdefault(lib_name, [])\
-                        .append(ShlibCache.SharedObject(lib_path))
-            #end for
-        #end if
+        if not self.have_ld_so_cache:
+            self.scanned_dirs.update(sources)
     #end function
 
     def get(self, lib_name, default=None, fallback=None):
-        if os.path.isabs(lib_name):
-            lib_path = lib_name
-            lib_name = os.path.basename(lib_name)
-        else:
-            lib_path = None
-        #end if
-
-        try:
-            if self.have_ldconfig:
-                return self.map[lib_name]
-            else:
-                if lib_path:
-                    for shared_obj in self._find_object(lib_name, fallback):
-                        if shared_obj.lib_path == lib_path:
-                            return [shared_obj]
-                else:
-                    return self.map.get(lib_name) or \
-                            self._find_object(lib_name)
-        except KeyError:
-            pass
-
-        return default
-    #end function
+        with self.lock:
+            return self._get(lib_name, default=default, fallback=fallback)
 
     def overlay_package(self, binary_package):
+        with self.lock:
+            self._overlay_package(binary_package)
+
+    # PRIVATE
+
+    def _overlay_package(self, binary_package):
         for src, attr in binary_package.contents.items():
             lib_name = os.path.basename(src)
 
@@ -162,7 +160,8 @@ class ShlibCache:
             if not stats.is_dynamically_linked:
                 continue
 
-            new_shared_obj             = ShlibCache.SharedObject(src)
+            new_shared_obj             = ShlibCache.SharedObject(src,
+                    self.lock)
             new_shared_obj.pkg_name    = binary_package.name
             new_shared_obj.pkg_version = binary_package.version
             new_shared_obj.word_size   = stats.arch_word_size
@@ -186,23 +185,169 @@ class ShlibCache:
         #end for
     #end function
 
-    # PRIVATE
+    def _get(self, lib_name, default=None, fallback=None):
+        if os.path.isabs(lib_name):
+            lib_path = lib_name
+            lib_name = os.path.basename(lib_name)
+        else:
+            lib_path = None
+        #end if
+
+        # Hand out copies, the lists may grow while callers iterate.
+        if self.have_ld_so_cache:
+            return list(self.map[lib_name]) if lib_name in self.map \
+                    else default
+
+        if lib_path:
+            if fallback and fallback not in self.prefixes:
+                self._scan_dir(fallback + os.sep + "lib")
 
-    def _find_object(self, lib_name, fallback=None):
-        lib_path = [p + os.sep + "lib" for p in self.prefixes]
+            for shared_obj in self.map.get(lib_name, []):
+                if shared_obj.lib_path == lib_path:
+                    return [shared_obj]
+            #end for
 
-        if fallback and fallback not in self.prefixes:
-            lib_path.append(fallback + os.sep + "lib")
+            return default
+        #end if
 
-        for path in lib_path:
-            object_path = path + os.sep + lib_name
-            if os.path.isfile(object_path):
-                self.map.setdefault(lib_name, []) \
-                        .append(ShlibCache.SharedObject(object_path))
+        return list(self.map.get(lib_name, [])) or default
+    #end function
+
+    def _package_manager(self):
+        try:
+            return PackageManager.instance()
+        except RuntimeError:
+            return None
+    #end function
+
+    def _build_entries(self, pkg_manager):
+        if self.have_ld_so_cache:
+            found = self._read_ld_so_cache(ShlibCache.LD_SO_CACHE)
+        else:
+            found = []
+            for p in self.prefixes:
+                found.extend(self._list_dir(p + os.sep + "lib"))
+        #end if
+
+        entries = []
+
+        for lib_name, lib_path in found:
+            pkg_name    = None
+            pkg_version = None
+            word_size   = None
+
+            if pkg_manager:
+                pkg_name = pkg_manager.which_package_provides(lib_path)
+                if pkg_name:
+                    pkg_version = pkg_manager\
+                            .installed_version_of_package(pkg_name)
             #end if
+
+            try:
+                word_size = ElfFile(os.path.realpath(lib_path)).word_size
+            except (OSError, BoltValueError):
+                pass
+
+            entries.append(
+                [lib_name, lib_path, pkg_name, pkg_version, word_size]
+            )
         #end for
 
-        return self.map[lib_name]
+        return entries
+    #end function
+
+    def _read_ld_so_cache(self, filename):
+        with open(filename, "rb") as fp:
+            buf = fp.read()
+
+        offset  = 0
+        entries = []
+
+        try:
+            # The old format may be followed by the new one, with the string
+            # offsets relative to the end of the old table.
+            if buf.startswith(ShlibCache.OLD_CACHE_MAGIC):
+                nlibs, = struct.unpack_from("=I", buf, 12)
+                offset = 16 + nlibs * 12
+
+                for i in range(nlibs):
+                    flags, key, value = struct.unpack_from("=iII", buf,
+                            16 + i * 12)
+                    entries.append((offset + key, offset + value, 0))
+                #end for
+            #end if
+
+            new_offset = buf.find(ShlibCache.NEW_CACHE_MAGIC, offset,
+                    offset + 8 + len(ShlibCache.NEW_CACHE_MAGIC))
+
+            if new_offset >= 0:
+                entries = []
+                nlibs, = struct.unpack_from("=I", buf, new_offset + 20)
+
+                for i in range(nlibs):
+                    flags, key, value, osversion, hwcap = struct.unpack_from(
+                        "=iIIIQ", buf, new_offset + 48 + i * 24)
+                    entries.append((new_offset + key, new_offset + value,
+                        hwcap))
+                #end for
+            elif offset == 0:
+                raise BoltValueError("unknown format")
+            #end if
+
+            result = []
+
+            for key, value, hwcap in entries:
+                if hwcap:
+                    continue
+
+                lib_name = buf[key:buf.index(b"\0", key)].decode("utf-8")
+                lib_path = buf[value:buf.index(b"\0", value)].decode("utf-8")
+
+                if "libx" in lib_path:
+                    continue
+
+                result.append((lib_name, lib_path))
+            #end for
+        except (struct.error, ValueError, BoltValueError) as e:
+            raise RuntimeError(
+                "failed to initialize shlib cache: {}: {}"
+                    .format(filename, str(e))
+            )
+        #end try
+
+        return result
+    #end function
+
+    def _list_dir(self, path):
+        result = []
+
+        try:
+            names = sorted(os.listdir(path))
+        except OSError:
+            return result
+
+        for lib_name in names:
+            if not re.search(r"\.so(?:\.|$)", lib_name):
+                continue
+
+            lib_path = path + os.sep + lib_name
+            if os.path.isfile(lib_path):
+                result.append((lib_name, lib_path))
+        #end for
+
+        return result
+    #end function
+
+    def _scan_dir(self, path):
+        if path in self.scanned_dirs:
+            return
+
+        self.scanned_dirs.add(path)
+
+        for lib_name, lib_path in self._list_dir(path):
+            shared_obj = ShlibCache.SharedObject(lib_path, self.lock)
+            self.map.setdefault(lib_name, []).append(shared_obj)
+        #end for
     #end function
 
 #end class
@@ -0,0 +1,260 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import fcntl
+import shutil
+import hashlib
+import subprocess
+
+from tempfile import mkdtemp, NamedTemporaryFile
+
+from org.boltlinux.error import PackagingError
+from org.boltlinux.package.appconfig import AppConfig
+
+# Keeps the stripped object and the debug file produced for an unstripped
+# ELF object in ~/.bolt/cache/strip, indexed by build-id and the hash of the
+# unstripped object. Objects that have not changed since the last packaging
+# run are then restored instead of being stripped again. prune() bounds the
+# size of the cache. Like DiskCache this is an optimization only, errors
+# reading or writing the cache are ignored.
+class StripCache:
+
+    VERSION = 1
+
+    # from linux/fs.h
+    FICLONE = 0x40049409
+
+    # Default bound for the total size of the cache in bytes.
+    MAX_SIZE = 4 * 1024 * 1024 * 1024
+
+    def __init__(self, tool_id="", max_size=None):
+        self.cache_dir = os.path.join(AppConfig.get_config_folder(), "cache",
+                "strip")
+        self.tool_id   = tool_id
+        self.max_size  = StripCache.MAX_SIZE if max_size is None \
+                else max_size
+    #end function
+
+    @staticmethod
+    def tool_version(objcopy):
+        # The path and version of objcopy, so that upgrading binutils
+        # invalidates objects stripped by the old one.
+        try:
+            proc = subprocess.run([objcopy, "--version"],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            version = proc.stdout.decode("utf-8", errors="replace").strip()
+        except (OSError, TypeError):
+            version = ""
+        #end try
+
+        return "{}:{}".format(objcopy, version)
+    #end function
+
+    def digest(self, filename):
+        h = hashlib.sha256()
+
+        h.update("{}:{}\0".format(StripCache.VERSION, self.tool_id)
+                .encode("utf-8"))
+
+        with open(filename, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+                h.update(chunk)
+
+        return h.hexdigest()
+    #end function
+
+    def restore(self, build_id, digest, obj_path, dbg_path=None):
+        # Returns False if the object could not be restored, in which case
+        # it is left untouched. Raises PackagingError if the object was
+        # damaged while writing it in place.
+        entry_dir = self._entry_dir(build_id, digest)
+        obj_temp  = None
+
+        try:
+            if not os.path.isdir(entry_dir):
+                return False
+
+            if dbg_path:
+                os.makedirs(os.path.dirname(dbg_path), exist_ok=True)
+                self._replace_file(self._clone_temp(
+                    os.path.join(entry_dir, "debug"), dbg_path), dbg_path)
+            #end if
+
+            obj_temp = self._clone_temp(os.path.join(entry_dir, "object"),
+                    obj_path)
+
+            # GNU objcopy writes into an existing output file, so that
+            # hardlinks to it see the stripped content. Only do that where
+            # it matters, otherwise replace the object atomically.
+            if os.stat(obj_path).st_nlink > 1:
+                self._copy_in_place(obj_temp, obj_path)
+            else:
+                self._replace_file(obj_temp, obj_path)
+                obj_temp = None
+            #end if
+
+            # Mark the entry as recently used for prune().
+            os.utime(entry_dir)
+        except OSError:
+            return False
+        finally:
+            if obj_temp and os.path.exists(obj_temp):
+                os.unlink(obj_temp)
+        #end try
+
+        return True
+    #end function
+
+    def store(self, build_id, digest, obj_path, dbg_path):
+        entry_dir = self._entry_dir(build_id, digest)
+        temp_dir  = None
+
+        if os.path.isdir(entry_dir):
+            return
+
+        try:
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            temp_dir = mkdtemp(dir=os.path.dirname(entry_dir))
+
+            shutil.copyfile(obj_path, os.path.join(temp_dir, "object"))
+            shutil.copy(dbg_path, os.path.join(temp_dir, "debug"))
+
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            pass
+        finally:
+            if temp_dir and os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        #end try
+    #end function
+
+    def prune(self):
+        # Removes the least recently used entries until the cache takes up
+        # no more than max_size bytes.
+        entries    = []
+        total_size = 0
+
+        try:
+            prefixes = os.listdir(self.cache_dir)
+        except OSError:
+            return
+
+        for prefix in prefixes:
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+
+            try:
+                names = os.listdir(prefix_dir)
+            except OSError:
+                continue
+
+            for name in names:
+                entry_dir = os.path.join(prefix_dir, name)
+
+                try:
+                    size = sum(
+                        os.lstat(os.path.join(entry_dir, f)).st_size
+                            for f in os.listdir(entry_dir)
+                    )
+                    mtime = os.stat(entry_dir).st_mtime
+                except OSError:
+                    continue
+
+                entries.append((mtime, size, entry_dir))
+                total_size += size
+            #end for
+        #end for
+
+        entries.sort()
+
+        for mtime, size, entry_dir in entries:
+            if total_size <= self.max_size:
+                break
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+        #end for
+    #end function
+
+    # PRIVATE
+
+    def _entry_dir(self, build_id, digest):
+        return os.path.join(self.cache_dir, build_id[0:2],
+                build_id[2:] + "-" + digest)
+
+    def _clone_temp(self, src, dst):
+        # Returns a temporary copy of src next to dst, cloned where the
+        # filesystem supports it. The copy gets the mode of dst, or that of
+        # src if dst does not exist.
+        tempfile = None
+
+        try:
+            with open(src, "rb") as src_fp, NamedTemporaryFile(
+                    dir=os.path.dirname(dst), delete=False) as tempfile:
+                try:
+                    fcntl.ioctl(tempfile.fileno(), StripCache.FICLONE,
+                            src_fp.fileno())
+                except OSError:
+                    shutil.copyfileobj(src_fp, tempfile, 1024 * 1024)
+            #end with
+
+            shutil.copymode(dst if os.path.exists(dst) else src,
+                    tempfile.name)
+        except OSError:
+            if tempfile and os.path.exists(tempfile.name):
+                os.unlink(tempfile.name)
+            raise
+        #end try
+
+        return tempfile.name
+    #end function
+
+    def _replace_file(self, temp_path, dst):
+        try:
+            os.replace(temp_path, dst)
+        except OSError:
+            os.unlink(temp_path)
+            raise
+        #end try
+    #end function
+
+    def _copy_in_place(self, src, dst):
+        # Once dst is truncated there is no going back, so failures are
+        # fatal rather than falling back to stripping a damaged object.
+        size = os.stat(src).st_size
+
+        try:
+            with open(src, "rb") as src_fp, open(dst, "wb") as dst_fp:
+                shutil.copyfileobj(src_fp, dst_fp, 1024 * 1024)
+
+            if os.stat(dst).st_size != size:
+                raise OSError("short write")
+        except OSError as e:
+            raise PackagingError("failed to restore '{}' from strip cache: {}"
+                    .format(dst, str(e)))
+        #end try
+    #end function
+
+#end class
@@ -0,0 +1,85 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import shutil
+
+from tempfile import NamedTemporaryFile
+
+from org.boltlinux.error import PackagingError
+
+# A directory of debug files laid out like the debuginfod web API, i.e.
+# buildid/<build-id>/debuginfo and buildid/<build-id>/executable. Served by
+# any static web server, it can be listed in DEBUGINFOD_URLS so that
+# debuggers fetch symbols per build-id instead of installing -dbg packages.
+class SymbolStore:
+
+    def __init__(self, directory):
+        self.directory = os.path.realpath(directory)
+
+    def publish(self, build_id, dbg_path, obj_path=None):
+        if not build_id:
+            return
+
+        entry_dir = os.path.join(self.directory, "buildid", build_id)
+
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+
+            # Files are addressed by build-id, existing entries are kept.
+            self._add_file(dbg_path, os.path.join(entry_dir, "debuginfo"))
+            if obj_path:
+                self._add_file(obj_path, os.path.join(entry_dir,
+                    "executable"))
+        except OSError as e:
+            raise PackagingError(
+                "failed to publish debug info for build-id {}: {}"
+                    .format(build_id, str(e))
+            )
+        #end try
+    #end function
+
+    # PRIVATE
+
+    def _add_file(self, src, dst):
+        if os.path.exists(dst):
+            return
+
+        tempfile = None
+
+        try:
+            with open(src, "rb") as src_fp, NamedTemporaryFile(
+                    dir=os.path.dirname(dst), delete=False) as tempfile:
+                shutil.copyfileobj(src_fp, tempfile, 1024 * 1024)
+
+            os.chmod(tempfile.name, 0o644)
+            os.rename(tempfile.name, dst)
+        finally:
+            if tempfile and os.path.exists(tempfile.name):
+                os.unlink(tempfile.name)
+        #end try
+    #end function
+
+#end class
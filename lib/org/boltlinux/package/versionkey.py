@@ -0,0 +1,190 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+
+import re
+import string
+import functools
+
+from org.boltlinux.error import BoltValueError
+
+_RUNS = re.compile(r"([^0-9]*)([0-9]*)")
+
+def _order(c):
+    if c in string.ascii_letters:
+        return ord(c)
+    if c == "~":
+        return -1
+    return ord(c) + 256
+#end function
+
+class VersionKey:
+
+    # Parsed Debian version. Keys compare exactly like
+    # `dpkg --compare-versions`, use VersionKey.parse() to get a memoized
+    # instance instead of parsing the same string over and over.
+
+    __slots__ = ["version", "key"]
+
+    CACHE_SIZE = 64 * 1024
+
+    # An empty (non-digit, digit) pair, see _split() below.
+    EMPTY_PART = ((0,), 0)
+
+    def __init__(self, version):
+        self.version = version
+        self.key     = VersionKey._make_key(version)
+    #end function
+
+    @staticmethod
+    @functools.lru_cache(maxsize=CACHE_SIZE)
+    def parse(version):
+        return VersionKey(version)
+
+    def encode(self):
+        # Returns an ASCII string that sorts byte-wise like the key, so that
+        # versions can be ordered by a database. Each non-digit order becomes
+        # three hex digits, each number its length followed by its decimal
+        # digits. The length takes two hex digits, or "ff" and four hex
+        # digits for runs of 255 digits and more.
+        epoch, upstream, revision = self.key
+        result = [VersionKey._encode_number(epoch)]
+
+        for parts in [upstream, revision]:
+            for orders, number in parts:
+                result.extend(["{:03x}".format(o + 2) for o in orders])
+                result.append(VersionKey._encode_number(number))
+            #end for
+        #end for
+
+        return "".join(result)
+    #end function
+
+    def __str__(self):
+        return self.version
+
+    def __repr__(self):
+        return "VersionKey('{}')".format(self.version)
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return self.key != other.key
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    def __le__(self, other):
+        return self.key <= other.key
+
+    def __gt__(self, other):
+        return self.key > other.key
+
+    def __ge__(self, other):
+        return self.key >= other.key
+
+    # PRIVATE
+
+    @staticmethod
+    def _encode_number(number):
+        digits = str(number) if number else ""
+        length = len(digits)
+
+        # Lengths below 0xff keep their two-digit form, so keys which are
+        # already stored stay valid. "ff" sorts after all of them.
+        if length < 0xff:
+            return "{:02x}{}".format(length, digits)
+        if length <= 0xffff:
+            return "ff{:04x}{}".format(length, digits)
+
+        raise BoltValueError(
+            "cannot encode a number of {} digits in a version key."
+                .format(length))
+    #end function
+
+    @staticmethod
+    def _make_key(version):
+        epoch, sep, rest = version.partition(":")
+
+        if sep and epoch and not epoch.strip(string.digits):
+            epoch = int(epoch)
+        else:
+            epoch, rest = 0, version
+        #end if
+
+        upstream, sep, revision = rest.rpartition("-")
+        if not sep:
+            upstream, revision = rest, ""
+
+        return (
+            epoch,
+            VersionKey._split(upstream),
+            VersionKey._split(revision)
+        )
+    #end function
+
+    @staticmethod
+    def _split(s):
+        # dpkg compares alternating runs of non-digits and digits. Each pair
+        # of runs becomes a tuple (orders, number). The non-digit run is
+        # terminated with 0, which is what dpkg compares against when one
+        # run is shorter than the other.
+        parts = [
+            (tuple([_order(c) for c in non_digits]) + (0,),
+                int(digits) if digits else 0)
+            for non_digits, digits in _RUNS.findall(s)
+        ]
+
+        while parts and parts[-1] == VersionKey.EMPTY_PART:
+            parts.pop()
+
+        # Two trailing empty pairs make a shorter key compare like one padded
+        # with empty pairs, even where the other key starts with "0".
+        return tuple(parts) + (VersionKey.EMPTY_PART, VersionKey.EMPTY_PART)
+    #end function
+
+#end class
+
+def version_key(version):
+    return VersionKey.parse(version).key
+
+def encode_version(version):
+    return VersionKey.parse(version).encode()
+
+def compare_versions(a, b):
+    key_a = version_key(a)
+    key_b = version_key(b)
+    return (key_a > key_b) - (key_a < key_b)
+#end function
+
+def sort_versions(versions, reverse=False):
+    return sorted(versions, key=version_key, reverse=reverse)
+
+def latest_version(versions):
+    return max(versions, key=version_key, default=None)
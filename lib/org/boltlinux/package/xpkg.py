@@ -25,65 +25,62 @@
 
 import os
 import re
-import subprocess
 import locale
 
-class BaseXpkg:
+from org.boltlinux.package.diskcache import DiskCache
+from org.boltlinux.package.versionkey import compare_versions
 
-    # FOR VERSION COMPARISON
+class BaseXpkg:
 
-    CHAR_VALUES = {
-        "~": 0,
-        " ": 1,
-        "-": 2,
-        "+": 3,
-        ".": 4
-    }
+    STATUS_CACHE_VERSION = 1
+    FILES_CACHE_VERSION  = 1
 
-    for ascii_val in range(ord("A"), ord("Z") + 1):
-        CHAR_VALUES[chr(ascii_val)] = ascii_val
-    for ascii_val in range(ord("a"), ord("z") + 1):
-        CHAR_VALUES[chr(ascii_val)] = ascii_val
+    STATUS_FIELDS = re.compile(
+        r"^(Package|Version|Provides|Status):[ \t]*(.*?)[ \t]*$",
+        flags=re.MULTILINE
+    )
 
     def __init__(self):
-        # PACKAGE LIST
-
-        self.packages = {}
         self.preferred_encoding = locale.getpreferredencoding(False)
+        self._packages = None
+        self._file_index = None
+        self._real_index = None
+    #end function
 
-        with open(self.STATUS_FILE, "r", encoding="utf-8") as fp:
-            buf = fp.read()
+    @property
+    def packages(self):
+        # Loaded on first use, from the cache if the status file is
+        # unchanged.
+        if self._packages is None:
+            self._packages = self._load_packages()
+        return self._packages
+    #end function
 
-        package_list = re.split(r"\n\n+", buf, flags=re.MULTILINE)
+    @property
+    def file_index(self):
+        # Maps absolute paths to the installed package shipping them. Built
+        # from the *.list files on first use, from the cache if the info
+        # directory is unchanged.
+        if self._file_index is None:
+            self._file_index = self._load_file_index()
+        return self._file_index
+    #end function
 
-        for pkg in package_list:
-            meta_data = {}
+    def which_package_provides(self, filename):
+        abspath = os.path.abspath(filename)
+        index   = self.file_index
 
-            for line in pkg.splitlines():
-                m = re.match(
-                    r"^(Package|Version|Provides|Status):\s*(.*)",
-                    line
-                )
-                if m:
-                    meta_data[m.group(1).lower()] = m.group(2).strip()
-            #end for
+        pkg_name = index.get(abspath)
 
-            if re.match(r"install\s+(?:ok|user)\s+installed",
-                    meta_data.get("status", "")):
-                self.packages[meta_data["package"]] = meta_data["version"]
-
-                if "provides" in meta_data:
-                    provides = [
-                        p.strip() for p in meta_data["provides"].split(",")
-                    ]
-                    for name in provides:
-                        if name not in self.packages:
-                            self.packages[name] = meta_data["version"]
-                    #end for
-                #end if
-            #end if
-        #end for
+        # The package database and the caller may refer to the file through
+        # different symlinked directories (e.g. /lib vs. /usr/lib).
+        if pkg_name is None:
+            if self._real_index is None:
+                self._real_index = self._build_real_index(index)
+            pkg_name = self._real_index.get(self._real_path(abspath))
+        #end if
 
+        return pkg_name
     #end function
 
     def installed_version_of_package(self, package_name):
@@ -91,77 +88,7 @@ class BaseXpkg:
 
     @classmethod
     def compare_versions(cls, a, b):
-        m = re.match(r"^(?:(\d+):)?([-+:~.a-zA-Z0-9]+?)(?:-([^-]+))?$", a)
-        epoch_a, version_a, rev_a = m.groups(default="") if m else ("", "", "")
-        m = re.match(r"^(?:(\d+):)?([-+:~.a-zA-Z0-9]+?)(?:-([^-]+))?$", b)
-        epoch_b, version_b, rev_b = m.groups(default="") if m else ("", "", "")
-
-        epoch_a = int(epoch_a) if epoch_a else 0
-        epoch_b = int(epoch_b) if epoch_b else 0
-
-        # compare epochs
-        if epoch_a > epoch_b:
-            return +1
-        if epoch_a < epoch_b:
-            return -1
-
-        nondigit  = 0
-        digit     = 1
-
-        mode = nondigit
-        for v_a, v_b in [(version_a, version_b), (rev_a, rev_b)]:
-            while v_a or v_b:
-                if mode == nondigit:
-                    m = re.match(r"^\D+", v_a)
-                    p_a = m.group() if m else ""
-                    m = re.match(r"^\D+", v_b)
-                    p_b = m.group() if m else ""
-
-                    len_a = len(p_a)
-                    len_b = len(p_b)
-                    v_a = v_a[len_a:]
-                    v_b = v_b[len_b:]
-
-                    if len_a != len_b:
-                        if len_a > len_b:
-                            p_b += " " * (len_a - len_b)
-                        else:
-                            p_a += " " * (len_b - len_a)
-                    #end if
-
-                    for c_a, c_b in zip(p_a, p_b):
-                        if BaseXpkg.CHAR_VALUES[c_a] > \
-                                BaseXpkg.CHAR_VALUES[c_b]:
-                            return +1
-                        if BaseXpkg.CHAR_VALUES[c_a] < \
-                                BaseXpkg.CHAR_VALUES[c_b]:
-                            return -1
-                    #end for
-
-                    mode = digit
-                else:
-                    m = re.match(r"^\d+", v_a)
-                    p_a = m.group() if m else "0"
-                    m = re.match(r"^\d+", v_b)
-                    p_b = m.group() if m else "0"
-
-                    v_a = v_a[len(p_a):]
-                    v_b = v_b[len(p_b):]
-                    val_a = int(p_a)
-                    val_b = int(p_b)
-
-                    if val_a > val_b:
-                        return +1
-                    if val_a < val_b:
-                        return -1
-
-                    mode = nondigit
-                #end if
-            #end while
-        #end for
-
-        return 0
-    #end function
+        return compare_versions(a, b)
 
     def installed_version_meets_condition(self, package_name, condition=None):
         installed_version = self.installed_version_of_package(package_name)
@@ -198,54 +125,136 @@ class BaseXpkg:
         return False
     #end function
 
+    # PRIVATE
+
+    def _load_packages(self):
+        return self._load_cached("status", BaseXpkg.STATUS_CACHE_VERSION,
+                self.STATUS_FILE, self._parse_status_file)
+
+    def _load_file_index(self):
+        if not os.path.isdir(self.INFO_DIR):
+            return {}
+
+        packages, files = self._load_cached("files",
+                BaseXpkg.FILES_CACHE_VERSION, self.INFO_DIR,
+                self._parse_info_dir)
+
+        return dict((path, packages[i]) for path, i in files.items())
+    #end function
+
+    def _build_real_index(self, index):
+        real_index = {}
+        real_dirs  = {}
+
+        for path, pkg_name in index.items():
+            dirname, basename = os.path.split(path)
+
+            if dirname not in real_dirs:
+                real_dirs[dirname] = os.path.realpath(dirname)
+
+            real_index.setdefault(
+                os.path.join(real_dirs[dirname], basename), pkg_name)
+        #end for
+
+        return real_index
+    #end function
+
+    def _real_path(self, path):
+        dirname, basename = os.path.split(path)
+        return os.path.join(os.path.realpath(dirname), basename)
+    #end function
+
+    def _load_cached(self, kind, version, source, parse_func):
+        if not os.path.exists(source):
+            return parse_func()
+
+        cache = DiskCache(os.path.join("xpkg", "{}-{}".format(
+            self.__class__.__name__.lower(), kind)), version)
+
+        return cache.get(DiskCache.stat_key(source), parse_func)
+    #end function
+
+    def _parse_status_file(self):
+        packages = {}
+
+        with open(self.STATUS_FILE, "r", encoding="utf-8") as fp:
+            buf = fp.read()
+
+        for pkg in re.split(r"\n\n+", buf):
+            meta_data = dict([
+                (key.lower(), value) for key, value in
+                    BaseXpkg.STATUS_FIELDS.findall(pkg)
+            ])
+
+            if not re.match(r"install\s+(?:ok|user)\s+installed",
+                    meta_data.get("status", "")):
+                continue
+
+            packages[meta_data["package"]] = meta_data["version"]
+
+            if "provides" in meta_data:
+                provides = [
+                    p.strip() for p in meta_data["provides"].split(",")
+                ]
+                for name in provides:
+                    if name not in packages:
+                        packages[name] = meta_data["version"]
+                #end for
+            #end if
+        #end for
+
+        return packages
+    #end function
+
+    def _parse_info_dir(self):
+        # Package names are stored once, files refer to them by index to
+        # keep the cache small.
+        packages = []
+        files    = {}
+
+        list_files = sorted(
+            entry.name for entry in os.scandir(self.INFO_DIR)
+                if entry.name.endswith(".list")
+        )
+
+        for list_file in list_files:
+            # dpkg appends the architecture for multi-arch packages.
+            pkg_name = list_file[:-5].split(":", 1)[0]
+            pkg_index = len(packages)
+            packages.append(pkg_name)
+
+            try:
+                with open(os.path.join(self.INFO_DIR, list_file), "r",
+                        encoding="utf-8", errors="surrogateescape") as fp:
+                    for line in fp:
+                        path = line.rstrip("\n")
+                        if path and path not in files:
+                            files[path] = pkg_index
+                    #end for
+                #end with
+            except OSError:
+                continue
+        #end for
+
+        return packages, files
+    #end function
+
 #end class
 
 class Dpkg(BaseXpkg):
     STATUS_FILE = '/var/lib/dpkg/status'
+    INFO_DIR    = '/var/lib/dpkg/info'
 
     def __init__(self):
         super().__init__()
 
-    def which_package_provides(self, filename):
-        abspath = os.path.abspath(filename)
-        cmd     = ["dpkg", "-S", abspath]
-
-        try:
-            procinfo = subprocess.run(cmd, stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT, check=True)
-        except subprocess.CalledProcessError:
-            return None
-        #end try
-
-        return procinfo.stdout\
-            .decode(self.preferred_encoding)\
-            .strip()\
-            .split(":", 1)[0]
-    #end function
-
 #end class
 
 class Opkg(BaseXpkg):
     STATUS_FILE = '/var/lib/opkg/status'
+    INFO_DIR    = '/var/lib/opkg/info'
 
     def __init__(self):
         super().__init__()
 
-    def which_package_provides(self, filename):
-        abspath = os.path.abspath(filename)
-        cmd     = ["opkg", "search", abspath]
-
-        try:
-            procinfo = subprocess.run(cmd, stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT, check=True)
-        except subprocess.CalledProcessError:
-            return None
-        #end try
-
-        return procinfo.stdout\
-            .decode(self.preferred_encoding)\
-            .strip()\
-            .split(" - ", 1)[0]
-    #end function
-
 #end class
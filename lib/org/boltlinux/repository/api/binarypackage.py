@@ -78,7 +78,7 @@ class BinaryPackage(Resource):
             s1 = db.aliased(BinaryPackageModel)
             s2 = db.aliased(BinaryPackageModel)
 
-            subquery = db.session.query(db.func.max(s1.sortkey))\
+            subquery = db.session.query(db.func.max(s1.version_key))\
                 .filter_by(repo_name=repo)\
                 .filter_by(libc=s2.libc)\
                 .filter_by(arch=s2.arch)\
@@ -87,7 +87,7 @@ class BinaryPackage(Resource):
             package_list = db.session.query(s2)\
                 .filter_by(repo_name=repo)\
                 .filter_by(name=name)\
-                .filter_by(sortkey=subquery)\
+                .filter_by(version_key=subquery)\
                 .all()
         #end if
 
@@ -134,11 +134,13 @@ class BinaryPackage(Resource):
         ######################################################################
 
         obj["versions"] = [
-            r for (r,) in db.session
-                .query(BinaryPackageModel.version)
+            r for (r, _) in db.session
+                .query(BinaryPackageModel.version,
+                    BinaryPackageModel.version_key)
                 .filter_by(repo_name=repo)
                 .filter_by(name=name)
                 .distinct()
+                .order_by(BinaryPackageModel.version_key)
         ]
 
         ######################################################################
@@ -172,7 +174,7 @@ class BinaryPackage(Resource):
         s1 = db.aliased(BinaryPackageModel)
         s2 = db.aliased(BinaryPackageModel)
 
-        subquery = db.session.query(db.func.max(s1.sortkey))\
+        subquery = db.session.query(db.func.max(s1.version_key))\
                 .filter_by(repo_name=repo)\
                 .filter_by(libc=libc)\
                 .filter_by(arch=arch)\
@@ -189,7 +191,7 @@ class BinaryPackage(Resource):
             query = query.filter(s2.name.like("%"+search+"%"))
 
         return query\
-                .filter_by(sortkey=subquery)\
+                .filter_by(version_key=subquery)\
                 .limit(items)\
                 .all()
     #end function
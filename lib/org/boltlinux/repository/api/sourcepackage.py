@@ -89,7 +89,7 @@ class SourcePackage(Resource):
         s1 = db.aliased(SourcePackageModel)
         s2 = db.aliased(SourcePackageModel)
 
-        subquery = db.session.query(db.func.max(s1.sortkey))\
+        subquery = db.session.query(db.func.max(s1.version_key))\
                 .filter_by(repo_name=repo)\
                 .filter_by(name=s2.name)
 
@@ -103,7 +103,7 @@ class SourcePackage(Resource):
             query = query.filter(s2.name.like("%"+search+"%"))
 
         return query\
-                .filter_by(sortkey=subquery)\
+                .filter_by(version_key=subquery)\
                 .limit(items)\
                 .all()
     #end function
@@ -25,7 +25,6 @@
 
 import os
 import logging
-import functools
 
 from org.boltlinux.package.appconfig import AppConfig
 from org.boltlinux.repository.flaskinit import app, db
@@ -33,7 +32,7 @@ from org.boltlinux.repository.models import SourcePackage, BinaryPackage
 from org.boltlinux.repository.boltpackageslist import BoltPackagesList
 from org.boltlinux.repository.repotask import RepoTask
 from org.boltlinux.error import RepositoryError
-from org.boltlinux.package.xpkg import BaseXpkg
+from org.boltlinux.package.versionkey import sort_versions
 
 class BoltPackages(RepoTask):
 
@@ -244,10 +243,7 @@ class BoltPackages(RepoTask):
                     if self.is_stopped():
                         return
 
-                    versions = list(entries.keys())
-                    versions.sort(
-                        key=functools.cmp_to_key(BaseXpkg.compare_versions)
-                    )
+                    versions = sort_versions(entries.keys())
 
                     for i, v in enumerate(versions, start=1):
                         entries[v].sortkey = i
@@ -25,7 +25,6 @@
 
 import os
 import logging
-import functools
 import json
 
 from org.boltlinux.package.appconfig import AppConfig
@@ -36,7 +35,7 @@ from org.boltlinux.repository.models import SourcePackage, UpstreamSource, \
 from org.boltlinux.repository.boltpackagerules import BoltPackageRules
 from org.boltlinux.repository.repotask import RepoTask
 from org.boltlinux.error import MalformedSpecfile, RepositoryError
-from org.boltlinux.package.xpkg import BaseXpkg
+from org.boltlinux.package.versionkey import sort_versions
 
 class BoltSources(RepoTask):
 
@@ -306,10 +305,7 @@ class BoltSources(RepoTask):
             if self.is_stopped():
                 break
 
-            versions = list(entries.keys())
-            versions.sort(key=functools.cmp_to_key(BaseXpkg.compare_versions))
-
-            for i, v in enumerate(versions, start=1):
+            for i, v in enumerate(sort_versions(entries.keys()), start=1):
                 entries[v].sortkey = i
         #end for
     #end function
@@ -345,14 +341,13 @@ class BoltSources(RepoTask):
                 if not ref_obj.upstream_version:
                     continue
 
-                comp_result = BaseXpkg.compare_versions(
-                    ref_obj.upstream_version,
-                    upstream_ref_obj.version
-                )
+                # The encoded keys sort like the versions they stand for.
+                own_key = ref_obj.upstream_version_key
+                ref_key = upstream_ref_obj.version_key
 
-                if comp_result < 0:
+                if own_key < ref_key:
                     ref_obj.status = SourcePackage.STATUS_BEHIND
-                elif comp_result > 0:
+                elif own_key > ref_key:
                     ref_obj.status = SourcePackage.STATUS_AHEAD
                 else:
                     ref_obj.status = SourcePackage.STATUS_CURRENT
@@ -27,7 +27,7 @@ import os
 import logging
 
 from org.boltlinux.package.appconfig import AppConfig
-from org.boltlinux.package.xpkg import BaseXpkg
+from org.boltlinux.package.versionkey import encode_version
 from org.boltlinux.repository.flaskinit import app, db
 from org.boltlinux.repository.models import UpstreamSource
 from org.boltlinux.repository.debiansourceslist import DebianSourcesList
@@ -174,12 +174,8 @@ class DebianSources(RepoTask):
             else:
                 source_pkg = stored_pkg_index[pkg_name]
 
-                old_version = source_pkg.version
-                new_version = pkg_info["Version"]
-
-                if BaseXpkg.compare_versions(
-                        new_version, old_version) > 0:
-                    source_pkg.version = new_version
+                if encode_version(pkg_version) > source_pkg.version_key:
+                    source_pkg.version = pkg_version
             #end if
         #end for
     #end function
@@ -26,6 +26,7 @@
 import os
 
 from org.boltlinux.repository.flaskinit import app, api, db, app_init
+from org.boltlinux.repository.models import upgrade_schema
 from org.boltlinux.package.appconfig import AppConfig
 
 ###############################################################################
@@ -59,6 +60,7 @@ db.init_app(app)
 
 with app.app_context():
     db.create_all()
+    upgrade_schema()
 
 ###############################################################################
 #
@@ -5,5 +5,6 @@ from .binarypackage  import BinaryPackage
 from .upstreamsource import UpstreamSource
 from .packageentry   import PackageEntry
 from .setting        import Setting
+from .schemaupgrade  import upgrade_schema
 
 # flake8: noqa
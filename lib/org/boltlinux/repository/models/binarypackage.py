@@ -23,7 +23,10 @@
 # THE SOFTWARE.
 #
 
+from sqlalchemy.orm import validates
+
 from org.boltlinux.repository.flaskinit import db
+from org.boltlinux.package.versionkey import encode_version
 
 class BinaryPackage(db.Model):
     __tablename__ = "binary_package"
@@ -42,6 +45,8 @@ class BinaryPackage(db.Model):
     arch       = db.Column(db.String(10), nullable=False)
     name       = db.Column(db.String(50), nullable=False)
     version    = db.Column(db.String(50), nullable=False)
+    # encode_version(version), sorts like dpkg in plain byte order
+    version_key = db.Column(db.String(255), nullable=False, default="")
     component  = db.Column(db.String(10), nullable=False, index=True)
     filename   = db.Column(db.Text,       nullable=False)
     arch_indep = db.Column(db.Boolean(),  nullable=False, default=False)
@@ -52,6 +57,15 @@ class BinaryPackage(db.Model):
     __table_args__ = (
         db.Index("ix_binary_package_repo_name_name_version",
                     "repo_name", "name", "version"),
+        db.Index("ix_binary_package_repo_name_libc_arch_name_version_key",
+                    "repo_name", "libc", "arch", "name", "version_key"),
         db.UniqueConstraint("repo_name", "libc", "arch", "name", "version")
     )
+
+    @validates("version")
+    def _update_version_key(self, key, version):
+        self.version_key = encode_version(version)
+        return version
+    #end function
+
 #end class
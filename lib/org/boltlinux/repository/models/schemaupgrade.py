@@ -0,0 +1,81 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+
+from sqlalchemy import inspect, text
+
+from org.boltlinux.repository.flaskinit import db
+from org.boltlinux.package.versionkey import encode_version
+from org.boltlinux.repository.models.sourcepackage import SourcePackage
+from org.boltlinux.repository.models.binarypackage import BinaryPackage
+from org.boltlinux.repository.models.upstreamsource import UpstreamSource
+
+# model -> [(key column, version column, column DDL)]
+VERSION_KEY_COLUMNS = [
+    (SourcePackage, [
+        ("version_key", "version", "VARCHAR(255) NOT NULL DEFAULT ''"),
+        ("upstream_version_key", "upstream_version", "VARCHAR(255)")
+    ]),
+    (BinaryPackage, [
+        ("version_key", "version", "VARCHAR(255) NOT NULL DEFAULT ''")
+    ]),
+    (UpstreamSource, [
+        ("version_key", "version", "VARCHAR(255) NOT NULL DEFAULT ''")
+    ]),
+]
+
+def upgrade_schema():
+    # db.create_all() does not touch existing tables. Add the version key
+    # columns and their indexes to databases created before they existed
+    # and fill them in. Must be called inside an app context.
+    inspector = inspect(db.engine)
+
+    for model, columns in VERSION_KEY_COLUMNS:
+        table = model.__tablename__
+        existing = set([c["name"] for c in inspector.get_columns(table)])
+        missing = [c for c in columns if c[0] not in existing]
+
+        if not missing:
+            continue
+
+        for key_column, version_column, ddl in missing:
+            db.session.execute(text("ALTER TABLE {} ADD COLUMN {} {}"
+                .format(table, key_column, ddl)))
+        #end for
+
+        for obj in model.query.all():
+            for key_column, version_column, ddl in missing:
+                version = getattr(obj, version_column)
+                setattr(obj, key_column,
+                        encode_version(version) if version else None)
+            #end for
+        #end for
+
+        db.session.commit()
+
+        for index in model.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    #end for
+#end function
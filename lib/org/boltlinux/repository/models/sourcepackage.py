@@ -23,7 +23,10 @@
 # THE SOFTWARE.
 #
 
+from sqlalchemy.orm import validates
+
 from org.boltlinux.repository.flaskinit import db
+from org.boltlinux.package.versionkey import encode_version
 
 class SourcePackage(db.Model):
     __tablename__ = "source_package"
@@ -42,6 +45,10 @@ class SourcePackage(db.Model):
     name             = db.Column(db.String(50), nullable=False)
     version          = db.Column(db.String(50), nullable=False)
     upstream_version = db.Column(db.String(50), nullable=True)
+    # encode_version() of the above, sort like dpkg in plain byte order
+    version_key          = db.Column(db.String(255), nullable=False,
+                                     default="")
+    upstream_version_key = db.Column(db.String(255), nullable=True)
     git_hash         = db.Column(db.String(8),  nullable=True)
     sortkey          = db.Column(db.Integer,    nullable=False, default=0)
     status           = db.Column(db.Integer,    nullable=False,
@@ -53,6 +60,22 @@ class SourcePackage(db.Model):
     __table_args__ = (
         db.Index("ix_source_package_repo_name_name_version",
                     "repo_name", "name", "version"),
+        db.Index("ix_source_package_repo_name_name_version_key",
+                    "repo_name", "name", "version_key"),
         db.UniqueConstraint("repo_name", "name", "version")
     )
+
+    @validates("version")
+    def _update_version_key(self, key, version):
+        self.version_key = encode_version(version)
+        return version
+    #end function
+
+    @validates("upstream_version")
+    def _update_upstream_version_key(self, key, upstream_version):
+        self.upstream_version_key = encode_version(upstream_version) \
+                if upstream_version else None
+        return upstream_version
+    #end function
+
 #end class
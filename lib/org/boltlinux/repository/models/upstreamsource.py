@@ -23,7 +23,10 @@
 # THE SOFTWARE.
 #
 
+from sqlalchemy.orm import validates
+
 from org.boltlinux.repository.flaskinit import db
+from org.boltlinux.package.versionkey import encode_version
 
 class UpstreamSource(db.Model):
     __tablename__ = "upstream_source"
@@ -31,10 +34,21 @@ class UpstreamSource(db.Model):
     id_       = db.Column(db.Integer, primary_key=True, index=True)
     name      = db.Column(db.String(50), nullable=False)
     version   = db.Column(db.String(50), nullable=False)
+    # encode_version(version), sorts like dpkg in plain byte order
+    version_key = db.Column(db.String(255), nullable=False, default="")
     component = db.Column(db.String(10), nullable=False)
 
     __table_args__ = (
         db.Index("ix_upstream_source_name_version", "name", "version"),
+        db.Index("ix_upstream_source_name_version_key", "name",
+                    "version_key"),
         db.UniqueConstraint("name", "version")
     )
+
+    @validates("version")
+    def _update_version_key(self, key, version):
+        self.version_key = encode_version(version)
+        return version
+    #end function
+
 #end class
@@ -0,0 +1,238 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+
+import os
+import stat
+import json
+import time
+
+from tempfile import NamedTemporaryFile
+
+class RepoIndexCache:
+
+    CACHE_FILE = ".bolt-repo-index.cache"
+    CACHE_VERSION = 1
+
+    # Directories modified less than this many seconds before the walk may
+    # still change within the same timestamp granularity. Their listing is
+    # not trusted on the next run.
+    RACY_INTERVAL = 2
+
+    def __init__(self, repo_dir):
+        self._repo_dir   = repo_dir
+        self._cache_file = os.path.join(repo_dir, RepoIndexCache.CACHE_FILE)
+        self._files = {}
+        self._dirs  = {}
+        self._seen_files = {}
+        self._seen_dirs  = set()
+    #end function
+
+    def load(self):
+        try:
+            with open(self._cache_file, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return
+
+        if not isinstance(data, dict) or \
+                data.get("version") != RepoIndexCache.CACHE_VERSION:
+            return
+
+        self._files = data.get("files", {})
+        self._dirs  = data.get("dirs",  {})
+
+        # Until the next walk, all entries are considered current.
+        self._seen_files = dict([
+            (rel_path, entry["key"]) for rel_path, entry in self._files.items()
+        ])
+        self._seen_dirs  = set(self._dirs.keys())
+    #end function
+
+    def store(self):
+        # Entries for files and directories that have disappeared from the
+        # pool are dropped.
+        data = {
+            "version": RepoIndexCache.CACHE_VERSION,
+            "files": dict([(k, v) for k, v in self._files.items()
+                if k in self._seen_files]),
+            "dirs": dict([(k, v) for k, v in self._dirs.items()
+                if k in self._seen_dirs]),
+        }
+
+        tempfile = None
+
+        try:
+            with NamedTemporaryFile(mode="w+", encoding="utf-8",
+                    dir=self._repo_dir, delete=False) as tempfile:
+                json.dump(data, tempfile, separators=(",", ":"))
+
+            os.chmod(tempfile.name, stat.S_IRUSR | stat.S_IWUSR |
+                stat.S_IRGRP | stat.S_IROTH)
+            os.rename(tempfile.name, self._cache_file)
+        finally:
+            if tempfile and os.path.exists(tempfile.name):
+                os.unlink(tempfile.name)
+        #end try
+    #end function
+
+    def walk(self):
+        # Yields (rel_path, stat_key) for every .bolt file in the pool. The
+        # listing of directories with unchanged mtime is taken from the
+        # cache, but every file is still stat'ed, since overwriting a file
+        # in place does not change the mtime of its directory.
+        self._seen_files.clear()
+        self._seen_dirs.clear()
+
+        now = time.time()
+        todo = [""]
+
+        while todo:
+            rel_dir = todo.pop()
+            abs_dir = os.path.join(self._repo_dir, rel_dir)
+
+            try:
+                dir_mtime = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+
+            self._seen_dirs.add(rel_dir)
+            dir_entry = self._dirs.get(rel_dir)
+
+            if dir_entry is not None and dir_entry["mtime"] == dir_mtime:
+                pkg_files = dir_entry["files"]
+                sub_dirs  = dir_entry["dirs"]
+                file_keys = {}
+            else:
+                pkg_files, sub_dirs, file_keys = self._scan_dir(abs_dir)
+
+                if now - dir_mtime / 1e9 < RepoIndexCache.RACY_INTERVAL:
+                    dir_mtime = None
+
+                self._dirs[rel_dir] = {
+                    "mtime": dir_mtime,
+                    "files": pkg_files,
+                    "dirs":  sub_dirs
+                }
+            #end if
+
+            for filename in pkg_files:
+                rel_path = os.path.join(rel_dir, filename)
+                stat_key = file_keys.get(filename)
+
+                if stat_key is None:
+                    try:
+                        stat_key = self.make_key(os.stat(
+                            os.path.join(abs_dir, filename)))
+                    except OSError:
+                        continue
+                #end if
+
+                self._seen_files[rel_path] = stat_key
+                yield rel_path, stat_key
+            #end for
+
+            # reversed, so that directories are popped in sorted order
+            for dirname in reversed(sub_dirs):
+                todo.append(os.path.join(rel_dir, dirname))
+        #end while
+    #end function
+
+    def get(self, rel_path, stat_key):
+        entry = self._files.get(rel_path)
+
+        if entry is None or entry["key"] != stat_key:
+            return None
+
+        return entry["control"]
+    #end function
+
+    def is_modified(self, rel_path, stat_key):
+        # True if the file was indexed before and has changed since.
+        entry = self._files.get(rel_path)
+        return entry is not None and entry["key"] != stat_key
+    #end function
+
+    def put(self, rel_path, stat_key, control, contents=None):
+        entry = {
+            "key": stat_key,
+            "control": control
+        }
+
+        if contents is not None:
+            entry["contents"] = contents
+
+        self._files[rel_path] = entry
+        self._seen_files[rel_path] = stat_key
+    #end function
+
+    def get_contents(self, rel_path):
+        # Only valid for files seen during the last walk.
+        entry = self._files.get(rel_path)
+        stat_key = self._seen_files.get(rel_path)
+
+        if entry is None or stat_key is None or entry["key"] != stat_key:
+            return None
+
+        return entry.get("contents")
+    #end function
+
+    def stat_key(self, rel_path):
+        return self._seen_files.get(rel_path)
+
+    def make_key(self, stats):
+        return [stats.st_size, stats.st_mtime_ns, stats.st_ino]
+
+    # PRIVATE
+
+    def _scan_dir(self, abs_dir):
+        pkg_files = []
+        sub_dirs  = []
+        file_keys = {}
+
+        try:
+            entries = list(os.scandir(abs_dir))
+        except OSError:
+            return pkg_files, sub_dirs, file_keys
+
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    sub_dirs.append(entry.name)
+                elif entry.name.endswith(".bolt") and entry.is_file():
+                    pkg_files.append(entry.name)
+                    file_keys[entry.name] = self.make_key(entry.stat())
+                #end if
+            except OSError:
+                continue
+        #end for
+
+        pkg_files.sort()
+        sub_dirs.sort()
+
+        return pkg_files, sub_dirs, file_keys
+    #end function
+
+#end class
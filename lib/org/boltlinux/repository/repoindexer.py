@@ -26,52 +26,158 @@
 import os
 import re
 import stat
-import shlex
-import subprocess
+import fcntl
 import hashlib
-import functools
-import locale
+import shutil
+import collections
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import org.boltlinux.toolbox.libarchive as libarchive
 
-from tempfile import TemporaryDirectory, NamedTemporaryFile
+from tempfile import NamedTemporaryFile
 from org.boltlinux.toolbox.libarchive import ArchiveFileReader, \
         ArchiveFileWriter, ArchiveEntry
-from org.boltlinux.error import NotFound, BoltSyntaxError, BoltError
-from org.boltlinux.package.xpkg import BaseXpkg
+from org.boltlinux.error import NotFound, BoltSyntaxError, \
+        BoltValueError
+from org.boltlinux.package.versionkey import sort_versions, \
+        compare_versions
 from org.boltlinux.package.debianpackagemetadata import DebianPackageMetaData
+from org.boltlinux.repository.repoindexcache import RepoIndexCache
+from org.boltlinux.toolbox.usign import UsignSigner
 
 class RepoIndexer:
 
-    def __init__(self, repo_dir, force_full=False, sign_with=None):
+    BUF_SIZE = 64 * 1024
+
+    # name -> (file suffix, libarchive filter, filter options)
+    COMPRESSIONS = {
+        "gzip": (".gz",  libarchive.COMPRESSION_GZIP,
+            [("gzip", "timestamp", None)]),
+        "xz":   (".xz",  libarchive.COMPRESSION_XZ,   None),
+        "zstd": (".zst", libarchive.COMPRESSION_ZSTD, None),
+    }
+
+    # Number of previous index generations kept in by-hash/.
+    BY_HASH_KEEP = 4
+
+    # Number of index diffs kept in Packages.diff/.
+    PDIFF_KEEP = 32
+
+    # Serializes index updates between indexer runs and the ingester.
+    LOCK_FILE = ".bolt-repo-index.lock"
+
+    class RepoLock:
+
+        def __init__(self, filename):
+            self._filename = filename
+            self._fp = None
+        #end function
+
+        def __enter__(self):
+            self._fp = open(self._filename, "a+")
+            try:
+                fcntl.flock(self._fp.fileno(), fcntl.LOCK_EX)
+            except OSError:
+                self._fp.close()
+                raise
+            #end try
+            return self
+        #end function
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+            self._fp.close()
+            self._fp = None
+        #end function
+
+    #end class
+
+    class HashingReader:
+
+        def __init__(self, fileobj, digest):
+            self._fileobj = fileobj
+            self._digest  = digest
+        #end function
+
+        def read(self, size=-1):
+            chunk = self._fileobj.read(size)
+            self._digest.update(chunk)
+            return chunk
+        #end function
+
+    #end class
+
+    class MemberReader:
+
+        # Exposes the data of the current archive member as a file-like
+        # object, so that nested archives can be read without a copy.
+        def __init__(self, archive):
+            self._archive = archive
+
+        def read(self, size=-1):
+            return self._archive.read_data(size if size > 0 else 0)
+
+    #end class
+
+    def __init__(self, repo_dir, force_full=False, sign_with=None, jobs=1,
+            use_cache=True, compressions=None, by_hash=False,
+            streaming=False, contents=False, pdiff=False):
         if not os.path.isdir(repo_dir):
             raise NotFound("path '%s' does not exists or is not a directory."
                     % repo_dir)
 
+        compressions = compressions or ["gzip"]
+
+        for c in compressions:
+            if c not in RepoIndexer.COMPRESSIONS:
+                raise BoltValueError("unsupported index compression '%s'."
+                        % c)
+        #end for
+
+        # Packages.gz is what clients fall back to, always write it.
+        if "gzip" not in compressions:
+            compressions = ["gzip"] + compressions
+
         self._force_full = force_full
         self._repo_dir   = repo_dir
         self._sign_with  = sign_with
+        self._signer     = UsignSigner(sign_with) if sign_with else None
+        self._jobs       = max(1, int(jobs))
+        self._cache      = RepoIndexCache(repo_dir) if use_cache else None
+        self._by_hash    = by_hash
+        self._streaming  = streaming
+        self._contents   = contents
+        self._pdiff      = pdiff
+        self._compressions = sorted(set(compressions),
+                key=lambda c: list(RepoIndexer.COMPRESSIONS).index(c))
     #end function
 
-    def update_package_index(self):
-        if self._force_full:
-            index, digest = {}, ""
-        else:
-            index, digest = self.load_package_index()
-
-        for meta_data in self.scan(index=index):
-            name    = meta_data["Package"]
-            version = meta_data["Version"]
-
-            index\
-                .setdefault(name, {})\
-                .setdefault(version, meta_data)
-        #end for
-
-        if not self._force_full:
-            self.prune_package_index(index)
+    @property
+    def repo_dir(self):
+        return self._repo_dir
+
+    def lock(self):
+        return RepoIndexer.RepoLock(os.path.join(self._repo_dir,
+            RepoIndexer.LOCK_FILE))
+
+    def __getstate__(self):
+        # Worker processes only extract control data, don't ship the cache
+        # or the secret signing key.
+        state = self.__dict__.copy()
+        state["_cache"]  = None
+        state["_signer"] = None
+        return state
+    #end function
 
-        self.store_package_index(index, current_digest=digest)
+    def update_package_index(self):
+        with self.lock():
+            if self._streaming:
+                self.merge_package_index()
+            else:
+                self._update_package_index()
+        #end with
     #end function
 
     def load_package_index(self):
@@ -80,19 +186,10 @@ class RepoIndexer:
         if not os.path.exists(packages_file):
             return {}, ""
 
-        buf = ""
-
-        with ArchiveFileReader(packages_file, raw=True) as archive:
-            for entry in archive:
-                buf = archive.read_data()
-
         h = hashlib.sha256()
-        h.update(buf)
-
-        text = buf.decode("utf-8")
         index = {}
 
-        for entry in re.split(r"\n\n+", text, flags=re.MULTILINE):
+        for entry in self._iter_package_index(packages_file, digest=h):
             meta_data = DebianPackageMetaData(entry)
 
             try:
@@ -107,13 +204,218 @@ class RepoIndexer:
         return index, h.hexdigest()
     #end function
 
-    def prune_package_index(self, index):
+    def merge_package_index(self):
+        # Low-memory variant of update_package_index. Only the new entries
+        # are held in memory. The existing index is streamed twice, once to
+        # collect the keys it contains and once to merge the sorted new
+        # entries into it, dropping entries whose files have disappeared.
+        packages_file = os.path.join(self._repo_dir, "Packages.gz")
+        merge_existing = not self._force_full and \
+                os.path.exists(packages_file)
+
+        known, digest = {}, ""
+
+        if merge_existing:
+            h = hashlib.sha256()
+
+            for entry in self._iter_package_index(packages_file, digest=h):
+                meta_data = DebianPackageMetaData(entry)
+
+                try:
+                    name    = meta_data["Package"]
+                    version = meta_data["Version"]
+                except KeyError:
+                    continue
+
+                known.setdefault(name, set()).add(version)
+            #end for
+
+            digest = h.hexdigest()
+        #end if
+
+        if self._cache:
+            self._cache.load()
+
+        pool_files = set()
+        modified = set()
+        new_entries = {}
+
+        for meta_data in self.scan(index=known, pool_files=pool_files,
+                modified=modified):
+            new_entries\
+                .setdefault(meta_data["Package"], {})\
+                .setdefault(meta_data["Version"], meta_data)
+        #end for
+
+        known = None
+
+        # Names of the packages added, replaced or pruned, for the contents
+        # index.
+        affected = set(new_entries.keys()) if merge_existing else None
+
+        delta = collections.deque(
+            new_entries[name][version]
+                for name in sorted(new_entries.keys())
+                    for version in sort_versions(new_entries[name].keys())
+        )
+        new_entries = None
+
+        # (name, architecture, filename) of every entry written, for the
+        # contents index.
+        packages = []
+
+        with NamedTemporaryFile(dir=self._repo_dir) as tmp:
+            h = hashlib.sha256()
+            separator = b""
+
+            def emit(text, meta_data):
+                nonlocal separator
+                data = separator + text.encode("utf-8")
+                separator = b"\n"
+                h.update(data)
+                tmp.write(data)
+
+                if self._contents:
+                    packages.append((meta_data["Package"],
+                        meta_data["Architecture"], meta_data["Filename"]))
+            #end inline function
+
+            if merge_existing:
+                for entry in self._iter_package_index(packages_file):
+                    meta_data = DebianPackageMetaData(entry)
+
+                    try:
+                        name    = meta_data["Package"]
+                        version = meta_data["Version"]
+                    except KeyError:
+                        continue
+
+                    while delta and self._sorts_before(delta[0], name,
+                            version):
+                        new_entry = delta.popleft()
+                        emit(str(new_entry), new_entry)
+                    #end while
+
+                    m = re.search(r"^Filename:\s*(.*?)\s*$", entry,
+                            flags=re.MULTILINE)
+                    # Entries of files overwritten in place are replaced by
+                    # the new ones.
+                    in_pool = m is not None and m.group(1) in pool_files \
+                            and m.group(1) not in modified
+
+                    # Like in update_package_index, an existing entry wins
+                    # over a new one for the same package version.
+                    if delta and self._compare_keys((delta[0]["Package"],
+                            delta[0]["Version"]), (name, version)) == 0:
+                        new_entry = delta.popleft()
+                        if not in_pool:
+                            emit(str(new_entry), new_entry)
+                            continue
+                    #end if
+
+                    if not in_pool:
+                        if affected is not None:
+                            affected.add(name)
+                        continue
+                    #end if
+
+                    emit(entry.strip("\n") + "\n", meta_data)
+                #end for
+            #end if
+
+            while delta:
+                new_entry = delta.popleft()
+                emit(str(new_entry), new_entry)
+            #end while
+
+            tmp.flush()
+
+            def read_payload():
+                with open(tmp.name, "rb") as f:
+                    yield from iter(lambda: f.read(RepoIndexer.BUF_SIZE), b"")
+            #end inline function
+
+            if tmp.tell() > 0:
+                self._publish_index(read_payload, h.hexdigest(), tmp.tell(),
+                        current_digest=digest)
+        #end with
+
+        if self._contents:
+            self.store_contents_index(packages, affected=affected)
+
+        if self._cache:
+            self._cache.store()
+    #end function
+
+    def store_ingested(self, index, added, current_digest=None):
+        # Publishes index after packages were moved into the pool by the
+        # ingester. added holds the (meta_data, contents) of the new files.
+        # They are recorded in the cache, and the Contents files are updated
+        # like in a regular run. Returns the digest of the new index.
+        if self._cache:
+            self._cache.load()
+
+            for meta_data, contents in added:
+                rel_path = meta_data["Filename"]
+
+                try:
+                    stat_key = self._cache.make_key(os.stat(
+                        os.path.join(self._repo_dir, rel_path)))
+                except OSError:
+                    continue
+
+                self._cache.put(rel_path, stat_key, str(meta_data), contents)
+            #end for
+        #end if
+
+        filenames_before = self._filenames_by_name(index)
+
+        # Don't publish entries whose files have been removed meanwhile.
+        self.prune_package_index(index)
+
+        digest = self.store_package_index(index,
+                current_digest=current_digest)
+
+        if self._contents:
+            filenames_after = self._filenames_by_name(index)
+
+            affected = set([meta_data["Package"]
+                for meta_data, contents in added])
+            for name in set(filenames_before) | set(filenames_after):
+                if filenames_before.get(name) != filenames_after.get(name):
+                    affected.add(name)
+            #end for
+
+            self.store_contents_index(
+                (
+                    (name, meta_data["Architecture"], meta_data["Filename"])
+                        for name in index.keys()
+                            for meta_data in index[name].values()
+                ),
+                affected=affected
+            )
+        #end if
+
+        if self._cache:
+            self._cache.store()
+
+        return digest
+    #end function
+
+    def prune_package_index(self, index, pool_files=None):
         for name in list(index.keys()):
             for version, meta_data in list(index[name].items()):
-                abspath  = os.path.join(self._repo_dir, meta_data["Filename"])
+                if pool_files is not None:
+                    if meta_data["Filename"] in pool_files:
+                        continue
+                else:
+                    abspath = os.path.join(self._repo_dir,
+                            meta_data["Filename"])
+                    if os.path.exists(abspath):
+                        continue
+                #end if
 
-                if not os.path.exists(abspath):
-                    del index[name][version]
+                del index[name][version]
             #end for
         #end for
     #end function
@@ -122,8 +424,7 @@ class RepoIndexer:
         meta_data_list = []
 
         for name in sorted(index.keys()):
-            for version in sorted(index[name].keys(), key=functools.cmp_to_key(
-                    BaseXpkg.compare_versions)):
+            for version in sort_versions(index[name].keys()):
                 meta_data_list.append(index[name][version])
             #end for
         #end for
@@ -134,154 +435,788 @@ class RepoIndexer:
         output = "\n".join([str(entry) for entry in meta_data_list])
         output = output.encode("utf-8")
 
+        h = hashlib.sha256()
+        h.update(output)
+
+        return self._publish_index(lambda: [output], h.hexdigest(),
+                len(output), current_digest=current_digest)
+    #end function
+
+    def _publish_index(self, read_payload, digest, size, current_digest=None):
+        # read_payload returns an iterable over the uncompressed index. It
+        # may be called repeatedly and from several threads.
         changed = True
 
-        if current_digest is not None:
-            h = hashlib.sha256()
-            h.update(output)
-            if h.hexdigest() == current_digest:
-                changed = False
+        if current_digest is not None and digest == current_digest:
+            changed = False
+
+        index_files = [
+            ("Packages" + RepoIndexer.COMPRESSIONS[c][0], c)
+                for c in self._compressions
+        ]
+
+        for name in [name for name, c in index_files] + ["Release"]:
+            if not os.path.exists(os.path.join(self._repo_dir, name)):
+                changed = True
+        #end for
 
-        packages_gz  = os.path.join(self._repo_dir, "Packages.gz")
-        tempfile_gz  = None
         packages_sig = os.path.join(self._repo_dir, "Packages.sig")
-        tempfile_sig = None
+        tempfiles    = []
 
         try:
             if changed:
-                with NamedTemporaryFile(dir=self._repo_dir, delete=False) \
-                        as tempfile_gz:
-                    pass
-
-                options = [("gzip", "timestamp", None)]
-
-                with ArchiveFileWriter(
-                        tempfile_gz.name,
-                        libarchive.FORMAT_RAW,
-                        libarchive.COMPRESSION_GZIP,
-                        options=options) as archive:
-
-                    with ArchiveEntry() as archive_entry:
-                        archive_entry.filetype = stat.S_IFREG
-                        archive.write_entry(archive_entry)
-                        archive.write_data(output)
-                    #end with
+                # libarchive releases the GIL, so the compressors run
+                # concurrently on the same payload.
+                for name, compression in index_files:
+                    tempfiles.append((name, self._write_tempfile(b"")))
+
+                with ThreadPoolExecutor(max_workers=len(index_files)) \
+                        as executor:
+                    jobs = [
+                        executor.submit(self._write_compressed, tmp,
+                            read_payload, compression)
+                        for (name, compression), (_, tmp) in
+                            zip(index_files, tempfiles)
+                    ]
+
+                    for job in jobs:
+                        job.result()
                 #end with
+            #end if
 
-                os.chmod(
-                    tempfile_gz.name,
-                    stat.S_IRUSR |
-                    stat.S_IWUSR |
-                    stat.S_IRGRP |
-                    stat.S_IROTH
-                )
+            # Needs the previous Packages.gz, so has to run before the
+            # renames.
+            if changed and self._pdiff:
+                index_diff = self._generate_pdiff(read_payload, digest, size)
+                if index_diff is not None:
+                    tempfiles.append(("Packages.diff/Index",
+                        self._write_tempfile(index_diff)))
             #end if
 
             if self._sign_with and \
                     (changed or not os.path.exists(packages_sig)):
-                signature = self._create_usign_signature(output)
-                with NamedTemporaryFile(dir=self._repo_dir, delete=False) \
-                        as tempfile_sig:
-                    tempfile_sig.write(signature)
-
-                os.chmod(
-                    tempfile_sig.name,
-                    stat.S_IRUSR |
-                    stat.S_IWUSR |
-                    stat.S_IRGRP |
-                    stat.S_IROTH
-                )
+                signature = self._create_usign_signature(read_payload)
+                tempfiles.append(
+                    ("Packages.sig", self._write_tempfile(signature)))
             #end if
 
-            if tempfile_gz:
-                os.rename(tempfile_gz.name, packages_gz)
-            if tempfile_sig:
-                os.rename(tempfile_sig.name, packages_sig)
+            if changed:
+                release = self._generate_release(digest, size, tempfiles)
+                tempfiles.append(("Release", self._write_tempfile(release)))
+
+                if self._sign_with:
+                    signature = self._create_usign_signature(
+                        lambda: [release])
+                    tempfiles.append(
+                        ("Release.sig", self._write_tempfile(signature)))
+                #end if
+            #end if
+
+            # By-hash copies have to be in place before the index files
+            # referencing them are.
+            if changed and self._by_hash:
+                self._publish_by_hash([
+                    (name, tmp) for name, tmp in tempfiles
+                        if name.startswith("Packages.") and
+                            not name.endswith(".sig") and
+                            not name.startswith("Packages.diff/")
+                ])
+            #end if
+
+            for name, tmp in tempfiles:
+                os.rename(tmp, os.path.join(self._repo_dir, name))
+
+            if changed and self._by_hash:
+                self._prune_by_hash()
+            if changed and self._pdiff:
+                self._prune_pdiff()
         finally:
-            if tempfile_gz and os.path.exists(tempfile_gz.name):
-                os.unlink(tempfile_gz.name)
-            if tempfile_sig and os.path.exists(tempfile_sig.name):
-                os.unlink(tempfile_sig.name)
+            for name, tmp in tempfiles:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
         #end try
+
+        return digest
     #end function
 
-    def scan(self, index=None):
+    def verify_package_index(self):
+        # Checks the pool against Packages.gz and returns a list of
+        # (status, filename, expected, actual) tuples, one per problem.
+        # status is one of "missing", "size", "sha256" or "orphan".
+        packages_file = os.path.join(self._repo_dir, "Packages.gz")
+
+        if not os.path.exists(packages_file):
+            raise NotFound("no Packages.gz in '%s'." % self._repo_dir)
+
+        entries = []
+
+        for entry in self._iter_package_index(packages_file):
+            meta_data = DebianPackageMetaData(entry)
+
+            try:
+                entries.append((meta_data["Filename"],
+                    int(meta_data["Size"]), meta_data["SHA256"]))
+            except (KeyError, ValueError):
+                continue
+        #end for
+
+        if self._cache:
+            self._cache.load()
+
+        pool_files = set([rel_path for rel_path, _ in self._walk_pool()])
+        problems = []
+        to_hash  = []
+
+        for filename, size, sha256 in entries:
+            if filename not in pool_files:
+                problems.append(("missing", filename, sha256, None))
+                continue
+
+            try:
+                stats = os.stat(os.path.join(self._repo_dir, filename))
+            except OSError:
+                problems.append(("missing", filename, sha256, None))
+                continue
+
+            if stats.st_size != size:
+                problems.append(("size", filename, str(size),
+                    str(stats.st_size)))
+                continue
+            #end if
+
+            digest = None
+
+            # Cached digests are only trusted if the file looks untouched.
+            if self._cache:
+                control = self._cache.get(filename,
+                        self._cache.make_key(stats))
+                if control is not None:
+                    digest = DebianPackageMetaData(control).get("SHA256")
+            #end if
+
+            if digest is None:
+                to_hash.append((filename, sha256))
+            elif digest != sha256:
+                problems.append(("sha256", filename, sha256, digest))
+        #end for
+
+        # hashlib releases the GIL on large buffers, threads are enough to
+        # keep several disks busy.
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            digests = executor.map(self._hash_file, [
+                os.path.join(self._repo_dir, filename)
+                    for filename, sha256 in to_hash
+            ])
+
+            for (filename, sha256), digest in zip(to_hash, digests):
+                if digest is None:
+                    problems.append(("missing", filename, sha256, None))
+                elif digest != sha256:
+                    problems.append(("sha256", filename, sha256, digest))
+            #end for
+        #end with
+
+        indexed = set([filename for filename, size, sha256 in entries])
+
+        for filename in sorted(pool_files - indexed):
+            problems.append(("orphan", filename, None, None))
+
+        return problems
+    #end function
+
+    def scan(self, index=None, pool_files=None, modified=None):
+        # Yields the control data of pool files that are not in the index
+        # yet. Files that changed since they were indexed are yielded again
+        # and their paths added to modified.
         if index is None:
             index = {}
 
-        for path, dirs, files in os.walk(self._repo_dir, followlinks=True):
-            for filename in files:
-                if not filename.endswith(".bolt"):
-                    continue
+        pkg_files = []
+        cache_misses = []
+        known = {}
 
-                try:
-                    name, version, arch = filename[:-5].rsplit("_")
-                except ValueError:
-                    continue
+        for rel_path, stat_key in self._walk_pool():
+            if pool_files is not None:
+                pool_files.add(rel_path)
 
-                entry = index.get(name, {}).get(version, None)
+            filename = os.path.basename(rel_path)
 
-                if entry is not None:
-                    continue
+            try:
+                name, version, arch = filename[:-5].rsplit("_")
+            except ValueError:
+                continue
 
-                abs_path = os.path.join(path, filename)
+            is_modified = self._cache is not None and stat_key is not None \
+                    and self._cache.is_modified(rel_path, stat_key)
 
-                try:
-                    control_data = self.extract_control_data(abs_path)
-                except BoltSyntaxError:
-                    continue
+            if is_modified and modified is not None:
+                modified.add(rel_path)
+
+            # File names leave out the epoch of the control Version.
+            if name not in known:
+                known[name] = set(re.sub(r"^\d+:", "", v)
+                        for v in index.get(name, {}))
+            if version in known[name] and not is_modified:
+                continue
+
+            control_data = None
+            if self._cache and stat_key is not None and not self._force_full:
+                control_data = self._cache.get(rel_path, stat_key)
+
+            if control_data is None:
+                cache_misses.append(os.path.join(self._repo_dir, rel_path))
+            else:
+                control_data = DebianPackageMetaData(control_data)
+
+            pkg_files.append((rel_path, stat_key, control_data))
+        #end for
+
+        yield from self._merge_extracted(pkg_files,
+                self._extract_all(cache_misses))
+    #end function
 
-                yield control_data
+    def store_contents_index(self, packages, affected=None):
+        # packages yields (name, architecture, filename) for every entry of
+        # the published index. affected holds the names of the packages that
+        # were added, changed or pruned. Only their lines are updated in the
+        # existing Contents files, which are streamed over otherwise. If
+        # affected is None, or a Contents file does not exist yet, it is
+        # written from scratch.
+        packages = list(packages)
+
+        # Architecture independent packages are listed for every
+        # architecture in the repository.
+        archs = set([arch for name, arch, rel_path in packages
+            if arch != "all"]) or set(["all"])
+
+        rebuild = set([
+            arch for arch in archs
+                if affected is None or
+                    not os.path.exists(self._contents_file(arch))
+        ])
+
+        wanted = dict([(arch, []) for arch in archs])
+
+        for name, arch, rel_path in packages:
+            for target in (archs if arch == "all" else [arch]):
+                if target in rebuild or name in affected:
+                    wanted[target].append((name, rel_path))
             #end for
         #end for
+
+        pkg_contents = self._load_contents(set([
+            rel_path for entries in wanted.values()
+                for name, rel_path in entries
+        ]))
+
+        for arch in sorted(archs):
+            additions = {}
+
+            for name, rel_path in wanted[arch]:
+                for path in pkg_contents[rel_path]:
+                    additions.setdefault(path, set()).add(name)
+            #end for
+
+            self._publish_contents(arch, additions,
+                    removed=None if arch in rebuild else affected)
+        #end for
+
+        for entry in os.scandir(self._repo_dir):
+            m = re.match(r"^Contents-(.+)\.gz$", entry.name)
+            if m and m.group(1) not in archs:
+                os.unlink(entry.path)
+        #end for
     #end function
 
     def extract_control_data(self, filename):
+        return self.extract_package_data(filename)[0]
+
+    def extract_package_data(self, filename, with_contents=False):
+        # Returns the control data and, if requested, the list of files
+        # shipped in the data member. Only the headers of the data member
+        # are looked at.
         meta_data = None
+        contents  = None
+        h = hashlib.sha256()
 
-        with TemporaryDirectory() as tmpdir:
-            with ArchiveFileReader(filename) as archive:
+        # Read the package exactly once: everything libarchive consumes goes
+        # through the hashing reader, and whatever it leaves behind after the
+        # control member is hashed by draining the reader.
+        with open(filename, "rb") as f:
+            reader = RepoIndexer.HashingReader(f, h)
+
+            with ArchiveFileReader(reader, buf_size=RepoIndexer.BUF_SIZE) \
+                    as archive:
                 for entry in archive:
-                    if not entry.pathname.startswith("control.tar."):
+                    if entry.pathname.startswith("control.tar."):
+                        pool_path = re.sub(
+                            r"^" + re.escape(self._repo_dir) + r"/*",
+                            "",
+                            filename
+                        )
+
+                        meta_data = DebianPackageMetaData(
+                            self._extract_control_data(archive.read_data()))
+
+                        meta_data["Filename"] = pool_path
+                    elif with_contents and \
+                            entry.pathname.startswith("data.tar."):
+                        contents = self._extract_contents(
+                            RepoIndexer.MemberReader(archive))
+                    else:
                         continue
+                    #end if
 
-                    data_file = os.path.join(tmpdir, entry.pathname)
+                    if meta_data is not None and \
+                            (contents is not None or not with_contents):
+                        break
+                #end for
+            #end with
+
+            for chunk in iter(lambda: reader.read(RepoIndexer.BUF_SIZE), b""):
+                pass
+
+            file_size = os.fstat(f.fileno()).st_size
+        #end with
 
-                    with open(data_file, "wb+") as outfile:
-                        while True:
-                            buf = archive.read_data(4096)
-                            if not buf:
-                                break
-                            outfile.write(buf)
-                        #end while
-                    #end with
+        if meta_data is None:
+            raise BoltSyntaxError("package '%s' has no control data."
+                    % filename)
 
-                    pool_path = re.sub(
-                        r"^" + re.escape(self._repo_dir) + r"/*",
-                        "",
-                        filename
-                    )
+        meta_data["SHA256"] = h.hexdigest()
+        meta_data["Size"]   = file_size
+
+        if with_contents and contents is None:
+            contents = []
+
+        return meta_data, contents
+    #end function
 
-                    meta_data = DebianPackageMetaData(
-                        self._extract_control_data(data_file))
+    # PRIVATE
+
+    def _update_package_index(self):
+        if self._force_full:
+            index, digest = {}, ""
+        else:
+            index, digest = self.load_package_index()
 
-                    meta_data["Filename"] = pool_path
+        if self._cache:
+            self._cache.load()
+
+        filenames_before = self._filenames_by_name(index)
+        pool_files = set()
+        modified   = set()
+        affected   = set()
+
+        refreshed = {}
+
+        for meta_data in self.scan(index=index, pool_files=pool_files,
+                modified=modified):
+            name     = meta_data["Package"]
+            version  = meta_data["Version"]
+            versions = index.setdefault(name, {})
+            existing = versions.get(version)
+
+            # Entries of files overwritten in place are stale.
+            if existing is not None and existing["Filename"] in modified:
+                versions[version] = meta_data
+            else:
+                versions.setdefault(version, meta_data)
+
+            if meta_data["Filename"] in modified:
+                refreshed[meta_data["Filename"]] = meta_data
+        #end for
+
+        # Drop stale entries that were not replaced above, e.g. because
+        # the file now holds a different package.
+        for name in list(index.keys()):
+            for version, meta_data in list(index[name].items()):
+                filename = meta_data["Filename"]
+                if filename in modified and \
+                        refreshed.get(filename) is not meta_data:
+                    del index[name][version]
+                    affected.add(name)
+            #end for
+        #end for
 
-                    break
+        affected.update(m["Package"] for m in refreshed.values())
+
+        if not self._force_full:
+            self.prune_package_index(index, pool_files=pool_files)
+
+        self.store_package_index(index, current_digest=digest)
+
+        if self._contents:
+            filenames_after = self._filenames_by_name(index)
+
+            for name in set(filenames_before) | set(filenames_after):
+                if filenames_before.get(name) != filenames_after.get(name):
+                    affected.add(name)
+            #end for
+
+            self.store_contents_index(
+                (
+                    (name, meta_data["Architecture"], meta_data["Filename"])
+                        for name in index.keys()
+                            for meta_data in index[name].values()
+                ),
+                affected=None if self._force_full else affected
+            )
+        #end if
+
+        if self._cache:
+            self._cache.store()
+    #end function
+
+    def _filenames_by_name(self, index):
+        return dict([
+            (name, set([m["Filename"] for m in index[name].values()]))
+                for name in index.keys()
+        ])
+    #end function
+
+    def _iter_package_index(self, packages_file, digest=None):
+        # Yields the stanzas of a compressed index one at a time.
+        yield from self._iter_stanzas(
+            self._iter_uncompressed(packages_file, digest=digest))
+
+    def _iter_uncompressed(self, filename, digest=None):
+        with ArchiveFileReader(filename, raw=True) as archive:
+            for entry in archive:
+                for chunk in iter(
+                        lambda: archive.read_data(RepoIndexer.BUF_SIZE), b""):
+                    if digest is not None:
+                        digest.update(chunk)
+                    yield chunk
                 #end for
-            #end with
+            #end for
         #end with
+    #end function
+
+    def _iter_stanzas(self, chunks):
+        buf = b""
 
-        meta_data["SHA256"] = self._file_sha256_sum(filename)
-        meta_data["Size"]   = os.path.getsize(filename)
+        for chunk in chunks:
+            buf += chunk
+            stanzas = buf.split(b"\n\n")
+            buf = stanzas.pop()
 
-        return meta_data
+            for stanza in stanzas:
+                stanza = stanza.strip(b"\n")
+                if stanza:
+                    yield stanza.decode("utf-8")
+            #end for
+        #end for
+
+        buf = buf.strip(b"\n")
+        if buf:
+            yield buf.decode("utf-8")
     #end function
 
-    # PRIVATE
+    def _iter_lines(self, chunks):
+        buf = b""
+
+        for chunk in chunks:
+            buf += chunk
+            lines = buf.split(b"\n")
+            buf = lines.pop()
+
+            for line in lines:
+                if line:
+                    yield line.decode("utf-8")
+            #end for
+        #end for
+
+        if buf:
+            yield buf.decode("utf-8")
+    #end function
+
+    def _iter_keyed_stanzas(self, stanzas):
+        for stanza in stanzas:
+            meta_data = DebianPackageMetaData(stanza)
+
+            try:
+                yield (meta_data["Package"], meta_data["Version"]), stanza
+            except KeyError:
+                continue
+        #end for
+    #end function
+
+    def _generate_pdiff(self, read_payload, digest, size):
+        # Compares the published index against the new one and records the
+        # difference as a patch in Packages.diff/. A patch starts with a
+        # "Remove:" field listing the "<name> <version>" entries to delete,
+        # followed by the stanzas to add. Applying it and sorting the result
+        # like the indexer does reproduces the new index byte by byte.
+        packages_file = os.path.join(self._repo_dir, "Packages.gz")
+
+        if not os.path.exists(packages_file):
+            return None
+
+        old_digest = hashlib.sha256()
+        old_size   = 0
+
+        def old_chunks():
+            nonlocal old_size
+            for chunk in self._iter_uncompressed(packages_file,
+                    digest=old_digest):
+                old_size += len(chunk)
+                yield chunk
+        #end inline function
+
+        old_iter = self._iter_keyed_stanzas(self._iter_stanzas(old_chunks()))
+        new_iter = self._iter_keyed_stanzas(self._iter_stanzas(read_payload()))
+
+        removed = []
+        added   = []
+
+        old_entry = next(old_iter, None)
+        new_entry = next(new_iter, None)
+
+        while old_entry is not None or new_entry is not None:
+            if new_entry is None:
+                rval = -1
+            elif old_entry is None:
+                rval = 1
+            else:
+                rval = self._compare_keys(old_entry[0], new_entry[0])
+            #end if
+
+            if rval < 0:
+                removed.append(old_entry[0])
+                old_entry = next(old_iter, None)
+            elif rval > 0:
+                added.append(new_entry[1])
+                new_entry = next(new_iter, None)
+            else:
+                if old_entry[1] != new_entry[1]:
+                    removed.append(old_entry[0])
+                    added.append(new_entry[1])
+                #end if
+
+                old_entry = next(old_iter, None)
+                new_entry = next(new_iter, None)
+            #end if
+        #end while
+
+        old_digest = old_digest.hexdigest()
+
+        if old_digest == digest:
+            return None
+
+        diff_dir = os.path.join(self._repo_dir, "Packages.diff")
+        os.makedirs(diff_dir, exist_ok=True)
+
+        current, history = self._load_pdiff_index()
+
+        # A broken chain is worse than no history at all.
+        if current is None or current[0] != old_digest:
+            history = []
+
+        patch = "Remove:\n"
+        patch += "".join([" {} {}\n".format(name, version)
+            for name, version in removed])
+        patch += "".join(["\n" + stanza + "\n" for stanza in added])
+        patch = patch.encode("utf-8")
+
+        base_name  = time.strftime("%Y-%m-%d-%H%M.%S", time.gmtime())
+        patch_name = base_name
+        suffix     = 0
+
+        while os.path.exists(os.path.join(diff_dir, patch_name + ".gz")):
+            suffix += 1
+            patch_name = "{}-{}".format(base_name, suffix)
+        #end while
+
+        tmp = self._write_tempfile(b"")
+
+        try:
+            self._write_compressed(tmp, lambda: [patch], "gzip")
+
+            h = hashlib.sha256()
+            with open(tmp, "rb") as f:
+                for chunk in iter(lambda: f.read(RepoIndexer.BUF_SIZE), b""):
+                    h.update(chunk)
+                download = (h.hexdigest(), f.tell())
+            #end with
+
+            os.rename(tmp, os.path.join(diff_dir, patch_name + ".gz"))
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        #end try
+
+        history.append((
+            patch_name,
+            (old_digest, old_size),
+            (hashlib.sha256(patch).hexdigest(), len(patch)),
+            download
+        ))
+        history = history[-RepoIndexer.PDIFF_KEEP:]
+
+        fields = [
+            ("SHA256-History", 1),
+            ("SHA256-Patches", 2),
+            ("SHA256-Download", 3)
+        ]
+
+        result = "SHA256-Current: {} {}\n".format(digest, size)
+
+        for field, i in fields:
+            result += field + ":\n"
+            for entry in history:
+                name = entry[0] + (".gz" if field == "SHA256-Download"
+                        else "")
+                result += " {} {:>16} {}\n".format(entry[i][0], entry[i][1],
+                        name)
+            #end for
+        #end for
+
+        return result.encode("utf-8")
+    #end function
+
+    def _load_pdiff_index(self):
+        # Returns the current (digest, size) and the history as a list of
+        # (name, (digest, size), (digest, size), (digest, size)) tuples for
+        # the old index, the patch and the compressed patch.
+        index_file = os.path.join(self._repo_dir, "Packages.diff", "Index")
+
+        current = None
+        entries = {}
+        field   = None
+
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.startswith(" "):
+                        field, value = [x.strip() for x in line.split(":", 1)]
+                        if field == "SHA256-Current":
+                            digest, size = value.split()
+                            current = (digest, int(size))
+                        #end if
+                        continue
+                    #end if
+
+                    digest, size, name = line.split()
+
+                    if field == "SHA256-Download":
+                        name = re.sub(r"\.gz$", "", name)
+
+                    entries.setdefault(name, {})[field] = (digest, int(size))
+                #end for
+            #end with
+        except (OSError, ValueError):
+            return None, []
+        #end try
+
+        history = []
+
+        for name in entries.keys():
+            try:
+                history.append((
+                    name,
+                    entries[name]["SHA256-History"],
+                    entries[name]["SHA256-Patches"],
+                    entries[name]["SHA256-Download"]
+                ))
+            except KeyError:
+                return None, []
+        #end for
+
+        return current, history
+    #end function
+
+    def _prune_pdiff(self):
+        diff_dir = os.path.join(self._repo_dir, "Packages.diff")
+
+        if not os.path.isdir(diff_dir):
+            return
+
+        current, history = self._load_pdiff_index()
+        keep = set([entry[0] + ".gz" for entry in history] + ["Index"])
+
+        for entry in os.scandir(diff_dir):
+            if entry.name not in keep:
+                os.unlink(entry.path)
+        #end for
+    #end function
+
+    def _compare_keys(self, key1, key2):
+        if key1[0] != key2[0]:
+            return -1 if key1[0] < key2[0] else 1
+
+        return compare_versions(key1[1], key2[1])
+    #end function
+
+    def _sorts_before(self, meta_data, name, version):
+        return self._compare_keys((meta_data["Package"],
+            meta_data["Version"]), (name, version)) < 0
+    #end function
+
+    def _walk_pool(self):
+        if self._cache:
+            yield from self._cache.walk()
+            return
+        #end if
+
+        for path, dirs, files in os.walk(self._repo_dir, followlinks=True):
+            dirs.sort()
+
+            for filename in sorted(files):
+                if not filename.endswith(".bolt"):
+                    continue
+
+                rel_path = os.path.relpath(os.path.join(path, filename),
+                        self._repo_dir)
+
+                yield rel_path, None
+            #end for
+        #end for
+    #end function
+
+    def _extract_all(self, filenames):
+        if self._jobs > 1 and len(filenames) > 1:
+            # Results are yielded in submission order, which keeps the
+            # index update deterministic regardless of worker scheduling.
+            with ProcessPoolExecutor(max_workers=self._jobs) as executor:
+                yield from executor.map(self._try_extract_package_data,
+                        filenames, chunksize=8)
+            #end with
+        else:
+            yield from map(self._try_extract_package_data, filenames)
+        #end if
+    #end function
+
+    def _merge_extracted(self, pkg_files, extracted):
+        # Cache hits and extraction results are handed out in pool order.
+        for rel_path, stat_key, control_data in pkg_files:
+            if control_data is None:
+                result = next(extracted)
+
+                if result is None:
+                    continue
 
-    def _extract_control_data(self, filename):
-        with ArchiveFileReader(filename) as archive:
+                control_data, contents = result
+
+                if self._cache and stat_key is not None:
+                    self._cache.put(rel_path, stat_key, str(control_data),
+                            contents)
+            #end if
+
+            yield control_data
+        #end for
+    #end function
+
+    def _try_extract_package_data(self, filename):
+        try:
+            return self.extract_package_data(filename,
+                    with_contents=self._contents)
+        except BoltSyntaxError:
+            return None
+    #end function
+
+    def _extract_control_data(self, control_tar):
+        with ArchiveFileReader(control_tar) as archive:
             for entry in archive:
                 if not entry.pathname == "control":
                     continue
@@ -298,44 +1233,266 @@ class RepoIndexer:
         #end with
     #end function
 
-    def _file_sha256_sum(self, filename):
+    def _extract_contents(self, data_tar):
+        contents = []
+
+        with ArchiveFileReader(data_tar, buf_size=RepoIndexer.BUF_SIZE) \
+                as archive:
+            for entry in archive:
+                if entry.is_directory:
+                    continue
+
+                pathname = re.sub(r"^(?:\.?/+)+", "", entry.pathname)
+                if pathname:
+                    contents.append(pathname)
+            #end for
+        #end with
+
+        return contents
+    #end function
+
+    def _contents_file(self, arch):
+        return os.path.join(self._repo_dir, "Contents-{}.gz".format(arch))
+
+    def _load_contents(self, rel_paths):
+        # Returns the file lists of the given pool files. Packages missing
+        # from the cache are read again.
+        pkg_contents = {}
+        cache_misses = []
+
+        for rel_path in sorted(rel_paths):
+            contents = None
+            if self._cache and not self._force_full:
+                contents = self._cache.get_contents(rel_path)
+
+            if contents is None:
+                cache_misses.append(rel_path)
+            pkg_contents[rel_path] = contents
+        #end for
+
+        extracted = self._extract_all([
+            os.path.join(self._repo_dir, rel_path)
+                for rel_path in cache_misses
+        ])
+
+        for rel_path, result in zip(cache_misses, extracted):
+            if result is None:
+                pkg_contents[rel_path] = []
+                continue
+
+            meta_data, contents = result
+            pkg_contents[rel_path] = contents
+
+            if self._cache:
+                stat_key = self._cache.stat_key(rel_path)
+                if stat_key is not None:
+                    self._cache.put(rel_path, stat_key, str(meta_data),
+                            contents)
+            #end if
+        #end for
+
+        return pkg_contents
+    #end function
+
+    def _publish_contents(self, arch, additions, removed=None):
+        # Writes the lines of the existing file with the names in removed
+        # taken out, merged with the sorted additions. With removed set to
+        # None, the file is written from additions alone.
+        target     = self._contents_file(arch)
+        old_digest = hashlib.sha256()
+        new_digest = hashlib.sha256()
+        new_paths  = sorted(additions.keys())
+
+        def existing_lines():
+            if removed is None:
+                return
+
+            for line in self._iter_lines(
+                    self._iter_uncompressed(target, digest=old_digest)):
+                path, _, names = line.rpartition(" ")
+                if path:
+                    yield path, set(names.split(",")) - removed
+            #end for
+        #end inline function
+
+        def merged_lines():
+            i = 0
+
+            for path, names in existing_lines():
+                while i < len(new_paths) and new_paths[i] < path:
+                    yield new_paths[i], additions[new_paths[i]]
+                    i += 1
+                #end while
+
+                if i < len(new_paths) and new_paths[i] == path:
+                    names |= additions[path]
+                    i += 1
+                #end if
+
+                if names:
+                    yield path, names
+            #end for
+
+            for path in new_paths[i:]:
+                yield path, additions[path]
+        #end inline function
+
+        def read_payload():
+            buf = []
+            buf_size = 0
+
+            for path, names in merged_lines():
+                data = "{} {}\n".format(path, ",".join(sorted(names)))\
+                        .encode("utf-8")
+                new_digest.update(data)
+                buf.append(data)
+                buf_size += len(data)
+
+                if buf_size >= RepoIndexer.BUF_SIZE:
+                    yield b"".join(buf)
+                    buf, buf_size = [], 0
+                #end if
+            #end for
+
+            if buf:
+                yield b"".join(buf)
+        #end inline function
+
+        tmp = self._write_tempfile(b"")
+
+        try:
+            self._write_compressed(tmp, read_payload, "gzip")
+
+            if os.path.exists(target):
+                if removed is None:
+                    for chunk in self._iter_uncompressed(target,
+                            digest=old_digest):
+                        pass
+                #end if
+
+                if old_digest.hexdigest() == new_digest.hexdigest():
+                    return
+            #end if
+
+            os.rename(tmp, target)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        #end try
+    #end function
+
+    def _hash_file(self, filename):
         h = hashlib.sha256()
-        with open(filename, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                h.update(chunk)
+
+        try:
+            with open(filename, "rb") as f:
+                for chunk in iter(
+                        lambda: f.read(16 * RepoIndexer.BUF_SIZE), b""):
+                    h.update(chunk)
+            #end with
+        except OSError:
+            return None
+
         return h.hexdigest()
     #end function
 
-    def _create_usign_signature(self, data):
-        signature = None
+    def _write_tempfile(self, data):
+        with NamedTemporaryFile(dir=self._repo_dir, delete=False) as f:
+            f.write(data)
 
-        with NamedTemporaryFile(dir=self._repo_dir) as tempfile:
-            tempfile.write(data)
-            tempfile.flush()
+        os.chmod(
+            f.name,
+            stat.S_IRUSR |
+            stat.S_IWUSR |
+            stat.S_IRGRP |
+            stat.S_IROTH
+        )
 
-            sign_cmd = shlex.split(
-                "usign -S -m '{}' -s '{}' -x -".format(
-                    tempfile.name, self._sign_with
-                )
-            )
-            try:
-                proc = subprocess.run(
-                    sign_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    check=True
-                )
-                signature = proc.stdout
-            except subprocess.CalledProcessError as e:
-                raise BoltError(
-                    "failed to sign Packages file: {}"
-                    .format(e.stderr.decode(locale.getpreferredencoding())
-                        .strip())
-                )
-            #end try
+        return f.name
+    #end function
+
+    def _write_compressed(self, filename, read_payload, compression):
+        _, compression_id, options = RepoIndexer.COMPRESSIONS[compression]
+
+        with ArchiveFileWriter(
+                filename,
+                libarchive.FORMAT_RAW,
+                compression_id,
+                options=options) as archive:
+
+            with ArchiveEntry() as archive_entry:
+                archive_entry.filetype = stat.S_IFREG
+                archive.write_entry(archive_entry)
+                for chunk in read_payload():
+                    archive.write_data(chunk)
+            #end with
         #end with
+    #end function
+
+    def _generate_release(self, digest, size, tempfiles):
+        checksums = [(digest, size, "Packages")]
+
+        for name, tmp in tempfiles:
+            if not name.startswith("Packages.") or name.endswith(".sig"):
+                continue
+            with open(tmp, "rb") as f:
+                h = hashlib.sha256()
+                for chunk in iter(lambda: f.read(RepoIndexer.BUF_SIZE), b""):
+                    h.update(chunk)
+                checksums.append((h.hexdigest(), f.tell(), name))
+            #end with
+        #end for
 
-        return signature
+        release  = "Date: {}\n".format(time.strftime(
+            "%a, %d %b %Y %H:%M:%S UTC", time.gmtime()))
+        if self._by_hash:
+            release += "Acquire-By-Hash: yes\n"
+        release += "SHA256:\n"
+
+        for digest, size, name in checksums:
+            release += " {} {:>16} {}\n".format(digest, size, name)
+
+        return release.encode("utf-8")
     #end function
 
+    def _publish_by_hash(self, index_files):
+        by_hash_dir = os.path.join(self._repo_dir, "by-hash", "SHA256")
+        os.makedirs(by_hash_dir, exist_ok=True)
+
+        for name, tmp in index_files:
+            h = hashlib.sha256()
+            with open(tmp, "rb") as f:
+                for chunk in iter(lambda: f.read(RepoIndexer.BUF_SIZE), b""):
+                    h.update(chunk)
+
+            target = os.path.join(by_hash_dir, h.hexdigest())
+
+            # An index may return to earlier content. Refresh the old copy,
+            # so that pruning by age doesn't remove the current one.
+            if os.path.exists(target):
+                os.utime(target)
+                continue
+            #end if
+
+            try:
+                os.link(tmp, target)
+            except OSError:
+                shutil.copy2(tmp, target)
+        #end for
+    #end function
+
+    def _prune_by_hash(self):
+        by_hash_dir = os.path.join(self._repo_dir, "by-hash", "SHA256")
+
+        entries = sorted(os.scandir(by_hash_dir),
+                key=lambda e: e.stat().st_mtime, reverse=True)
+        keep = RepoIndexer.BY_HASH_KEEP * len(self._compressions)
+
+        for entry in entries[keep:]:
+            os.unlink(entry.path)
+    #end function
+
+    def _create_usign_signature(self, read_payload):
+        return self._signer.sign(read_payload)
+
 #end class
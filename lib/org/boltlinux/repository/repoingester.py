@@ -0,0 +1,211 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+
+import os
+import time
+import shutil
+import logging
+import threading
+
+import org.boltlinux.toolbox.inotify as inotify
+
+from org.boltlinux.toolbox.inotify import Inotify
+from org.boltlinux.error import NotFound
+
+class RepoIngester:
+
+    # Uploads that cannot be indexed are moved here, below incoming.
+    REJECTED_DIR = "rejected"
+
+    def __init__(self, indexer, incoming_dir, debounce=2.0, max_delay=30.0):
+        if not os.path.isdir(incoming_dir):
+            raise NotFound("path '%s' does not exists or is not a directory."
+                    % incoming_dir)
+
+        self._indexer      = indexer
+        self._incoming_dir = incoming_dir
+        self._debounce     = debounce
+        self._max_delay    = max(debounce, max_delay)
+        self._stop_flag    = threading.Event()
+        self._index        = {}
+        self._digest       = ""
+        self._index_key    = None
+
+        self.log = logging.getLogger("org.boltlinux.repository")
+    #end function
+
+    def run(self):
+        # The index is kept in memory between batches and reloaded when
+        # the published index was replaced by someone else, e.g. a regular
+        # indexer run.
+        with Inotify() as watcher:
+            watcher.add_watch(self._incoming_dir,
+                    inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO |
+                    inotify.IN_ONLYDIR)
+
+            # pick up whatever arrived while we weren't watching
+            pending = set(self._list_incoming())
+            first_event = last_event = time.monotonic() if pending else None
+
+            while not self._stop_flag.is_set():
+                events = watcher.read_events(timeout=0.250)
+                now = time.monotonic()
+
+                for event in events:
+                    if event.is_overflow:
+                        pending.update(self._list_incoming())
+                    elif event.name.endswith(".bolt"):
+                        pending.add(event.name)
+                    else:
+                        continue
+
+                    if first_event is None:
+                        first_event = now
+                    last_event = now
+                #end for
+
+                if not pending:
+                    continue
+                if now - last_event < self._debounce and \
+                        now - first_event < self._max_delay:
+                    continue
+
+                self.ingest(sorted(pending))
+
+                pending.clear()
+                first_event = last_event = None
+            #end while
+        #end with
+    #end function
+
+    def stop(self, *args):
+        self._stop_flag.set()
+
+    def ingest(self, filenames):
+        with self._indexer.lock():
+            return self._ingest(filenames)
+
+    def pool_path(self, pkg_name, filename):
+        if pkg_name.startswith("lib") and len(pkg_name) > 3:
+            first_letter = pkg_name[3]
+        else:
+            first_letter = pkg_name[0]
+
+        return os.path.join(first_letter, pkg_name, filename)
+    #end function
+
+    # PRIVATE
+
+    def _ingest(self, filenames):
+        if self._index_key != self._packages_key():
+            self._index, self._digest = self._indexer.load_package_index()
+            self._index_key = self._packages_key()
+        #end if
+
+        added = []
+
+        for filename in filenames:
+            src_path = os.path.join(self._incoming_dir, filename)
+
+            if not os.path.isfile(src_path):
+                continue
+
+            # Whatever is wrong with an upload must not stop the daemon.
+            try:
+                meta_data, contents = self._indexer.extract_package_data(
+                    src_path, with_contents=True)
+
+                name     = meta_data["Package"]
+                version  = meta_data["Version"]
+                rel_path = self.pool_path(name, filename)
+            except Exception as e:
+                self.log.error("Rejecting '%s': %s" % (filename, str(e)))
+                self._reject(filename)
+                continue
+            #end try
+
+            dst_path = os.path.join(self._indexer.repo_dir, rel_path)
+
+            try:
+                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                shutil.move(src_path, dst_path)
+            except OSError as e:
+                self.log.error("Failed to move '%s' into the pool: %s" %
+                        (filename, str(e)))
+                continue
+            #end try
+
+            meta_data["Filename"] = rel_path
+
+            # a re-upload replaces the existing entry
+            self._index.setdefault(name, {})[version] = meta_data
+
+            added.append((meta_data, contents))
+        #end for
+
+        if not added:
+            return 0
+
+        self._digest = self._indexer.store_ingested(self._index, added,
+                current_digest=self._digest)
+        self._index_key = self._packages_key()
+
+        self.log.info("Published index with %d new package(s)." % len(added))
+        return len(added)
+    #end function
+
+    def _reject(self, filename):
+        # Moves a broken upload out of the way, so that it isn't picked up
+        # again on the next start.
+        rejected_dir = os.path.join(self._incoming_dir,
+                RepoIngester.REJECTED_DIR)
+
+        try:
+            os.makedirs(rejected_dir, exist_ok=True)
+            os.replace(os.path.join(self._incoming_dir, filename),
+                    os.path.join(rejected_dir, filename))
+        except OSError as e:
+            self.log.error("Failed to move '%s' aside: %s" %
+                    (filename, str(e)))
+        #end try
+    #end function
+
+    def _packages_key(self):
+        try:
+            st = os.stat(os.path.join(self._indexer.repo_dir, "Packages.gz"))
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+    #end function
+
+    def _list_incoming(self):
+        return [
+            entry.name for entry in os.scandir(self._incoming_dir)
+                if entry.name.endswith(".bolt") and entry.is_file()
+        ]
+    #end function
+
+#end class
@@ -0,0 +1,455 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import mmap
+import struct
+
+from org.boltlinux.error import BoltValueError
+
+################################## CONSTANTS ##################################
+
+ELFMAG = b"\x7fELF"
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+ET_REL  = 1
+ET_EXEC = 2
+ET_DYN  = 3
+ET_CORE = 4
+
+PT_LOAD    = 1
+PT_DYNAMIC = 2
+PT_INTERP  = 3
+PT_NOTE    = 4
+
+SHT_SYMTAB  = 2
+SHT_DYNAMIC = 6
+SHT_NOTE    = 7
+
+PN_XNUM = 0xffff
+
+DT_NULL    = 0
+DT_NEEDED  = 1
+DT_STRTAB  = 5
+DT_SONAME  = 14
+DT_RPATH   = 15
+DT_RUNPATH = 29
+
+NT_GNU_BUILD_ID = 3
+
+# Struct layouts after e_ident, per ELF class.
+EHDR_FORMAT = {
+    ELFCLASS32: "HHIIIIIHHHHHH",
+    ELFCLASS64: "HHIQQQIHHHHHH"
+}
+
+PHDR_FORMAT = {
+    ELFCLASS32: "IIIIIIII",
+    ELFCLASS64: "IIQQQQQQ"
+}
+
+SHDR_FORMAT = {
+    ELFCLASS32: "IIIIIIIIII",
+    ELFCLASS64: "IIQQQQIIQQ"
+}
+
+DYN_FORMAT = {
+    ELFCLASS32: "iI",
+    ELFCLASS64: "qQ"
+}
+
+# Reads the identification, dynamic section and build-id of an ELF object
+# without running any external tools. The file is memory-mapped only for the
+# duration of the constructor and of delete_rpath.
+class ElfFile:
+
+    __slots__ = [
+        "filename", "word_size", "byte_order", "elf_type", "machine",
+        "interp", "needed", "soname", "rpath", "runpath", "build_id",
+        "has_symtab", "_class", "_endian", "_has_dynamic", "_dynamic"
+    ]
+
+    class ProgramHeader:
+
+        __slots__ = ["p_type", "p_offset", "p_vaddr", "p_filesz", "p_align"]
+
+        def __init__(self, p_type, p_offset, p_vaddr, p_filesz, p_align):
+            self.p_type   = p_type
+            self.p_offset = p_offset
+            self.p_vaddr  = p_vaddr
+            self.p_filesz = p_filesz
+            self.p_align  = p_align
+        #end function
+
+    #end class
+
+    class SectionHeader:
+
+        __slots__ = ["sh_type", "sh_offset", "sh_size", "sh_link", "sh_info",
+                "sh_addralign"]
+
+        def __init__(self, sh_type, sh_offset, sh_size, sh_link, sh_info,
+                sh_addralign):
+            self.sh_type      = sh_type
+            self.sh_offset    = sh_offset
+            self.sh_size      = sh_size
+            self.sh_link      = sh_link
+            self.sh_info      = sh_info
+            self.sh_addralign = sh_addralign
+        #end function
+
+    #end class
+
+    @staticmethod
+    def is_elf(filename):
+        try:
+            with open(filename, "rb") as fp:
+                return fp.read(4) == ELFMAG
+        except OSError:
+            return False
+    #end function
+
+    def __init__(self, filename):
+        self.filename   = filename
+        self.word_size  = None
+        self.byte_order = None
+        self.elf_type   = None
+        self.machine    = None
+        self.interp     = None
+        self.needed     = []
+        self.soname     = None
+        self.rpath      = None
+        self.runpath    = None
+        self.build_id   = None
+        self.has_symtab = False
+
+        with open(filename, "rb") as fp:
+            try:
+                buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise BoltValueError("'%s' is not an ELF file." % filename)
+
+            try:
+                self._parse(buf)
+            except (struct.error, IndexError, UnicodeDecodeError):
+                raise BoltValueError("'%s' is a truncated or corrupt ELF "
+                        "file." % filename)
+            finally:
+                buf.close()
+            #end try
+        #end with
+    #end function
+
+    @property
+    def is_shared_object(self):
+        return self.elf_type == ET_DYN
+
+    @property
+    def is_executable(self):
+        return self.elf_type == ET_EXEC or \
+                (self.elf_type == ET_DYN and self.interp is not None)
+
+    @property
+    def is_dynamically_linked(self):
+        return self._has_dynamic
+
+    def delete_rpath(self):
+        # Removes DT_RPATH and DT_RUNPATH from the dynamic section in place
+        # like chrpath -d does: the remaining entries move up and the table
+        # is padded with DT_NULL. Returns True if the file was modified.
+        if self._dynamic is None or \
+                (self.rpath is None and self.runpath is None):
+            return False
+
+        offset, size = self._dynamic
+        entsize = struct.calcsize(DYN_FORMAT[self._class])
+        fmt     = self._endian + DYN_FORMAT[self._class]
+
+        with open(self.filename, "r+b") as fp:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_WRITE)
+
+            try:
+                entries = []
+                removed = 0
+
+                for i in range(size // entsize):
+                    d_tag, d_val = struct.unpack_from(fmt, buf,
+                            offset + i * entsize)
+                    if d_tag == DT_NULL:
+                        break
+                    if d_tag in (DT_RPATH, DT_RUNPATH):
+                        removed += 1
+                    else:
+                        entries.append((d_tag, d_val))
+                #end for
+
+                if removed:
+                    entries.extend([(DT_NULL, 0)] * removed)
+                    for i, entry in enumerate(entries):
+                        struct.pack_into(fmt, buf, offset + i * entsize,
+                                *entry)
+                    buf.flush()
+                #end if
+            except struct.error:
+                raise BoltValueError("'%s' is a truncated or corrupt ELF "
+                        "file." % self.filename)
+            finally:
+                buf.close()
+            #end try
+        #end with
+
+        self.rpath   = None
+        self.runpath = None
+
+        return removed > 0
+    #end function
+
+    # PRIVATE
+
+    def _parse(self, buf):
+        if buf[0:4] != ELFMAG:
+            raise BoltValueError("'%s' is not an ELF file." % self.filename)
+
+        ei_class, ei_data = buf[4], buf[5]
+
+        if ei_class not in (ELFCLASS32, ELFCLASS64) or \
+                ei_data not in (ELFDATA2LSB, ELFDATA2MSB):
+            raise BoltValueError("'%s' has an unknown ELF class or data "
+                    "encoding." % self.filename)
+        #end if
+
+        self.word_size  = 32 if ei_class == ELFCLASS32 else 64
+        self.byte_order = "little" if ei_data == ELFDATA2LSB else "big"
+
+        self._class  = ei_class
+        self._endian = "<" if ei_data == ELFDATA2LSB else ">"
+
+        e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags, \
+            e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum, \
+            e_shstrndx = self._unpack(EHDR_FORMAT, buf, 16)
+
+        self.elf_type = e_type
+        self.machine  = e_machine
+
+        sections = self._read_section_headers(buf, e_shoff, e_shentsize,
+                e_shnum)
+
+        # With more than PN_XNUM program headers the real count is kept in
+        # the first section header.
+        if e_phnum == PN_XNUM and sections:
+            e_phnum = sections[0].sh_info
+
+        segments = self._read_program_headers(buf, e_phoff, e_phentsize,
+                e_phnum)
+
+        self.has_symtab = any(shdr.sh_type == SHT_SYMTAB for shdr in sections)
+
+        for phdr in segments:
+            if phdr.p_type == PT_INTERP:
+                self.interp = bytes(
+                    buf[phdr.p_offset:phdr.p_offset + phdr.p_filesz]
+                ).rstrip(b"\0").decode("utf-8")
+            #end if
+        #end for
+
+        self._has_dynamic = False
+        self._dynamic     = None
+        self._parse_dynamic(buf, sections, segments)
+        self._parse_build_id(buf, sections, segments)
+    #end function
+
+    def _unpack(self, formats, buf, offset):
+        return struct.unpack_from(self._endian + formats[self._class],
+                buf, offset)
+
+    def _read_program_headers(self, buf, offset, entsize, count):
+        result = []
+
+        if not offset:
+            return result
+
+        for i in range(count):
+            if self._class == ELFCLASS32:
+                p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, \
+                    p_flags, p_align = self._unpack(PHDR_FORMAT, buf,
+                            offset + i * entsize)
+            else:
+                p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, \
+                    p_memsz, p_align = self._unpack(PHDR_FORMAT, buf,
+                            offset + i * entsize)
+            #end if
+
+            result.append(ElfFile.ProgramHeader(p_type, p_offset, p_vaddr,
+                p_filesz, p_align))
+        #end for
+
+        return result
+    #end function
+
+    def _read_section_headers(self, buf, offset, entsize, count):
+        result = []
+
+        if not offset:
+            return result
+
+        # With SHN_LORESERVE or more sections, the real count is kept in
+        # the first section header.
+        if count == 0:
+            count = self._unpack(SHDR_FORMAT, buf, offset)[5]
+
+        for i in range(count):
+            sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, \
+                sh_link, sh_info, sh_addralign, sh_entsize = \
+                    self._unpack(SHDR_FORMAT, buf, offset + i * entsize)
+
+            result.append(ElfFile.SectionHeader(sh_type, sh_offset, sh_size,
+                sh_link, sh_info, sh_addralign))
+        #end for
+
+        return result
+    #end function
+
+    def _vaddr_to_offset(self, segments, vaddr):
+        for phdr in segments:
+            if phdr.p_type != PT_LOAD:
+                continue
+            if phdr.p_vaddr <= vaddr < phdr.p_vaddr + phdr.p_filesz:
+                return vaddr - phdr.p_vaddr + phdr.p_offset
+        #end for
+
+        return None
+    #end function
+
+    def _parse_dynamic(self, buf, sections, segments):
+        dynamic = None
+        strtab  = None
+
+        # Prefer the section table, it points at .dynstr directly. Fall back
+        # to PT_DYNAMIC for objects stripped of their section headers.
+        for shdr in sections:
+            if shdr.sh_type != SHT_DYNAMIC:
+                continue
+            dynamic = (shdr.sh_offset, shdr.sh_size)
+            if 0 < shdr.sh_link < len(sections):
+                strtab = sections[shdr.sh_link].sh_offset
+            break
+        #end for
+
+        if dynamic is None:
+            for phdr in segments:
+                if phdr.p_type == PT_DYNAMIC:
+                    dynamic = (phdr.p_offset, phdr.p_filesz)
+                    break
+            #end for
+        #end if
+
+        if dynamic is None:
+            return
+
+        self._has_dynamic = True
+        self._dynamic     = dynamic
+
+        offset, size = dynamic
+        entsize = struct.calcsize(DYN_FORMAT[self._class])
+        entries = []
+
+        for i in range(size // entsize):
+            d_tag, d_val = self._unpack(DYN_FORMAT, buf, offset + i * entsize)
+            if d_tag == DT_NULL:
+                break
+            if d_tag == DT_STRTAB and strtab is None:
+                strtab = self._vaddr_to_offset(segments, d_val)
+            entries.append((d_tag, d_val))
+        #end for
+
+        if strtab is None:
+            return
+
+        def get_string(index):
+            start = strtab + index
+            end   = buf.find(b"\0", start)
+            if end < 0:
+                raise IndexError("unterminated string")
+            return bytes(buf[start:end]).decode("utf-8")
+        #end inline function
+
+        for d_tag, d_val in entries:
+            if d_tag == DT_NEEDED:
+                self.needed.append(get_string(d_val))
+            elif d_tag == DT_SONAME:
+                self.soname = get_string(d_val)
+            elif d_tag == DT_RPATH:
+                self.rpath = get_string(d_val)
+            elif d_tag == DT_RUNPATH:
+                self.runpath = get_string(d_val)
+        #end for
+    #end function
+
+    def _parse_build_id(self, buf, sections, segments):
+        notes = [(shdr.sh_offset, shdr.sh_size, shdr.sh_addralign)
+                for shdr in sections if shdr.sh_type == SHT_NOTE]
+
+        if not notes:
+            notes = [(phdr.p_offset, phdr.p_filesz, phdr.p_align)
+                    for phdr in segments if phdr.p_type == PT_NOTE]
+        #end if
+
+        note_header = self._endian + "III"
+
+        for offset, size, align in notes:
+            end = offset + size
+
+            # Notes are 4-byte aligned, unless the segment or section asks
+            # for 8 bytes, e.g. .note.gnu.property on 64-bit objects. Fields
+            # are aligned relative to the start of the note.
+            mask = 7 if align == 8 else 3
+
+            def align_up(n):
+                return (n + mask) & ~mask
+
+            while offset + 12 <= end:
+                n_namesz, n_descsz, n_type = struct.unpack_from(note_header,
+                        buf, offset)
+
+                desc_off   = align_up(12 + n_namesz)
+                name_start = offset + 12
+                desc_start = offset + desc_off
+                offset    += align_up(desc_off + n_descsz)
+
+                if n_type == NT_GNU_BUILD_ID and \
+                        buf[name_start:name_start + n_namesz] == b"GNU\0":
+                    self.build_id = \
+                        bytes(buf[desc_start:desc_start + n_descsz]).hex()
+                    return
+                #end if
+            #end while
+        #end for
+    #end function
+
+#end class
@@ -0,0 +1,167 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+
+import os
+import struct
+import ctypes
+import select
+
+from ctypes.util import find_library
+
+libc = ctypes.CDLL(find_library("c"), use_errno=True)
+
+libc.inotify_init1.argtypes = [ctypes.c_int]
+libc.inotify_init1.restype = ctypes.c_int
+libc.inotify_add_watch.argtypes = \
+    [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+libc.inotify_add_watch.restype = ctypes.c_int
+libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+libc.inotify_rm_watch.restype = ctypes.c_int
+
+################################## CONSTANTS ##################################
+
+IN_ACCESS        = 0x00000001
+IN_MODIFY        = 0x00000002
+IN_ATTRIB        = 0x00000004
+IN_CLOSE_WRITE   = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN          = 0x00000020
+IN_MOVED_FROM    = 0x00000040
+IN_MOVED_TO      = 0x00000080
+IN_CREATE        = 0x00000100
+IN_DELETE        = 0x00000200
+IN_DELETE_SELF   = 0x00000400
+IN_MOVE_SELF     = 0x00000800
+
+IN_UNMOUNT       = 0x00002000
+IN_Q_OVERFLOW    = 0x00004000
+IN_IGNORED       = 0x00008000
+
+IN_ONLYDIR       = 0x01000000
+IN_ISDIR         = 0x40000000
+
+IN_NONBLOCK      = 0o4000
+IN_CLOEXEC       = 0o2000000
+
+############################### IMPLEMENTATION ################################
+
+class InotifyEvent:
+
+    def __init__(self, wd, mask, cookie, name):
+        self.wd     = wd
+        self.mask   = mask
+        self.cookie = cookie
+        self.name   = name
+    #end function
+
+    @property
+    def is_overflow(self):
+        return self.mask & IN_Q_OVERFLOW != 0
+
+#end class
+
+class Inotify:
+
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            self._raise_from_errno()
+        self._watches = {}
+    #end function
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fileno(self):
+        return self._fd
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+    #end function
+
+    def add_watch(self, path, mask):
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            self._raise_from_errno(path)
+        self._watches[wd] = path
+        return wd
+    #end function
+
+    def rm_watch(self, wd):
+        if libc.inotify_rm_watch(self._fd, wd) < 0:
+            self._raise_from_errno()
+        self._watches.pop(wd, None)
+    #end function
+
+    def path_of(self, wd):
+        return self._watches.get(wd)
+
+    def read_events(self, timeout=None):
+        rlist, _, _ = select.select([self._fd], [], [], timeout)
+        if not rlist:
+            return []
+
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        header_size = Inotify.EVENT_HEADER.size
+
+        while offset + header_size <= len(buf):
+            wd, mask, cookie, length = \
+                Inotify.EVENT_HEADER.unpack_from(buf, offset)
+            offset += header_size
+
+            name = buf[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            events.append(InotifyEvent(wd, mask, cookie, os.fsdecode(name)))
+        #end while
+
+        return events
+    #end function
+
+    # PRIVATE
+
+    def _raise_from_errno(self, filename=None):
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), filename)
+    #end function
+
+#end class
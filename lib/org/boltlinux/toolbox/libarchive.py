@@ -57,9 +57,11 @@ COMPRESSION_GZIP = 16
 COMPRESSION_LZMA = 17
 COMPRESSION_XZ = 18
 COMPRESSION_NONE = 19
+COMPRESSION_ZSTD = 20
 
 STATUS_OK = 0
 STATUS_EOF = 1
+STATUS_FATAL = -30
 
 ################################### CTYPES ####################################
 
@@ -94,6 +96,7 @@ _compression_functions = {
     COMPRESSION_LZMA: "archive_write_add_filter_lzma",
     COMPRESSION_XZ: "archive_write_add_filter_xz",
     COMPRESSION_NONE: "archive_write_add_filter_none",
+    COMPRESSION_ZSTD: "archive_write_add_filter_zstd",
     None: "archive_write_add_filter_none"
 }
 
@@ -211,6 +214,13 @@ lib.archive_write_open_filename.restype = ctypes.c_int
 lib.archive_write_data.argtypes = \
     [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t]
 lib.archive_write_data.restype = ctypes.c_ssize_t
+lib.archive_write_open.argtypes = \
+    [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+        ctypes.c_void_p]
+lib.archive_write_open.restype = ctypes.c_int
+lib.archive_write_set_bytes_in_last_block.argtypes = \
+    [ctypes.c_void_p, ctypes.c_int]
+lib.archive_write_set_bytes_in_last_block.restype = ctypes.c_int
 
 lib.archive_read_free.argtypes = [ctypes.c_void_p]
 lib.archive_write_free.restype = ctypes.c_int
@@ -224,6 +234,13 @@ lib.archive_read_next_header2.restype = ctypes.c_int
 lib.archive_read_open_filename.argtypes = \
     [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_ulong]
 lib.archive_read_open_filename.restype = ctypes.c_int
+lib.archive_read_open_memory.argtypes = \
+    [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t]
+lib.archive_read_open_memory.restype = ctypes.c_int
+lib.archive_read_open.argtypes = \
+    [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+        ctypes.c_void_p]
+lib.archive_read_open.restype = ctypes.c_int
 lib.archive_read_support_filter_all.argtypes = [ctypes.c_void_p]
 lib.archive_read_support_filter_all.restype = ctypes.c_int
 lib.archive_read_support_filter_program.argtypes = \
@@ -240,6 +257,11 @@ lib.archive_write_set_option.argtypes = \
     [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p]
 lib.archive_write_set_option.restype = ctypes.c_int
 
+_read_callback_type = ctypes.CFUNCTYPE(ctypes.c_ssize_t, ctypes.c_void_p,
+        ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p))
+_write_callback_type = ctypes.CFUNCTYPE(ctypes.c_ssize_t, ctypes.c_void_p,
+        ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t)
+
 ############################### IMPLEMENTATION ################################
 
 def error_string(c_archive_p):
@@ -526,8 +548,12 @@ class ArchiveFileWriter:
 
     def __init__(self, filename, archive_format, compression=None,
             options=None):
+        # `filename` may also be a file-like object, which then receives
+        # the archive through its write method.
         self._c_archive_p = lib.archive_write_new()
         self._hardlinks = {}
+        self._target = None
+        self._write_callback = None
 
         try:
             func = getattr(lib, _compression_functions[compression])
@@ -550,8 +576,22 @@ class ArchiveFileWriter:
                 self.__set_filter_option(mod, key, val)
         #end if
 
-        if lib.archive_write_open_filename(
-                self._c_archive_p, filename.encode("utf-8")) != STATUS_OK:
+        if hasattr(filename, "write"):
+            self._target = filename
+            self._write_callback = _write_callback_type(
+                    self.__write_callback)
+
+            # Don't pad the output to a full block, there is no tape.
+            lib.archive_write_set_bytes_in_last_block(self._c_archive_p, 1)
+
+            rval = lib.archive_write_open(self._c_archive_p, None, None,
+                    ctypes.cast(self._write_callback, ctypes.c_void_p), None)
+        else:
+            rval = lib.archive_write_open_filename(self._c_archive_p,
+                    filename.encode("utf-8"))
+        #end if
+
+        if rval != STATUS_OK:
             msg = error_string(self._c_archive_p)
             self.close()
             raise ArchiveError(msg)
@@ -629,6 +669,15 @@ class ArchiveFileWriter:
         #end with
     #end function
 
+    def __write_callback(self, c_archive_p, client_data, buf, length):
+        try:
+            self._target.write(ctypes.string_at(buf, length))
+        except OSError:
+            return STATUS_FATAL
+
+        return length
+    #end function
+
     def __set_filter_option(self, mod, key, val):
         m = mod.encode("utf-8") if mod is not None else None
         k = key.encode("utf-8") if key is not None else None
@@ -650,7 +699,14 @@ class ArchiveFileWriter:
 class ArchiveFileReader:
 
     def __init__(self, filename, cmd=None, raw=False, buf_size=4096):
+        # `filename` may also be a bytes object holding the whole archive or
+        # a file-like object, which is then read sequentially in chunks of
+        # `buf_size` bytes.
         self._c_archive_p = lib.archive_read_new()
+        self._buf_size = buf_size
+        self._source = None
+        self._read_buf = None
+        self._read_callback = None
 
         try:
             self.__init_helper(filename, cmd=cmd, raw=raw)
@@ -685,9 +741,27 @@ class ArchiveFileReader:
                 raise Exception()
         #end if
 
-        if lib.archive_read_open_filename(self._c_archive_p,
-                filename.encode("utf-8"), 4096) != STATUS_OK:
-            raise Exception()
+        if isinstance(filename, bytes):
+            # libarchive does not copy the buffer, keep a reference.
+            self._source = filename
+
+            if lib.archive_read_open_memory(self._c_archive_p,
+                    filename, len(filename)) != STATUS_OK:
+                raise Exception()
+        elif hasattr(filename, "read"):
+            self._source = filename
+            self._read_buf = ctypes.create_string_buffer(self._buf_size)
+            self._read_callback = _read_callback_type(self.__read_callback)
+
+            if lib.archive_read_open(self._c_archive_p, None, None,
+                    ctypes.cast(self._read_callback, ctypes.c_void_p),
+                    None) != STATUS_OK:
+                raise Exception()
+        else:
+            if lib.archive_read_open_filename(self._c_archive_p,
+                    filename.encode("utf-8"), self._buf_size) != STATUS_OK:
+                raise Exception()
+        #end if
     #end function
 
     def __del__(self):
@@ -789,6 +863,18 @@ class ArchiveFileReader:
         #end for
     #end function
 
+    def __read_callback(self, c_archive_p, client_data, buf_p):
+        try:
+            chunk = self._source.read(self._buf_size)
+        except (OSError, ArchiveError):
+            return STATUS_FATAL
+
+        ctypes.memmove(self._read_buf, chunk, len(chunk))
+        buf_p[0] = ctypes.addressof(self._read_buf)
+
+        return len(chunk)
+    #end function
+
     def __read_data(self, size):
         buf = ctypes.create_string_buffer(size)
 
@@ -0,0 +1,179 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+
+import base64
+import hashlib
+import struct
+
+from org.boltlinux.error import BoltError
+
+################################## CONSTANTS ##################################
+
+COMMENT_PREFIX = "untrusted comment: "
+
+# struct seckey from usign's main.c
+SECKEY_FORMAT = ">2s2sI16s8s8s64s"
+
+############################# ED25519 ARITHMETIC ##############################
+
+# Plain RFC 8032 Ed25519 in extended homogeneous coordinates. Signing is
+# deterministic, so the result matches usign's edsign byte for byte.
+
+_P = 2**255 - 19
+_L = 2**252 + 27742317777372353535851937790883648493
+_D = -121665 * pow(121666, _P - 2, _P) % _P
+
+def _recover_x(y, sign):
+    x2 = (y * y - 1) * pow(_D * y * y + 1, _P - 2, _P)
+    x  = pow(x2, (_P + 3) // 8, _P)
+    if (x * x - x2) % _P != 0:
+        x = x * pow(2, (_P - 1) // 4, _P) % _P
+    if x & 1 != sign:
+        x = _P - x
+    return x
+#end function
+
+
+_BY = 4 * pow(5, _P - 2, _P) % _P
+_BX = _recover_x(_BY, 0)
+_B  = (_BX, _BY, 1, _BX * _BY % _P)
+
+def _point_add(p1, p2):
+    x1, y1, z1, t1 = p1
+    x2, y2, z2, t2 = p2
+
+    a = (y1 - x1) * (y2 - x2) % _P
+    b = (y1 + x1) * (y2 + x2) % _P
+    c = 2 * t1 * t2 * _D % _P
+    d = 2 * z1 * z2 % _P
+    e, f, g, h = b - a, d - c, d + c, b + a
+
+    return (e * f % _P, g * h % _P, f * g % _P, e * h % _P)
+#end function
+
+def _scalar_mult(s, p):
+    q = (0, 1, 1, 0)
+
+    while s > 0:
+        if s & 1:
+            q = _point_add(q, p)
+        p = _point_add(p, p)
+        s >>= 1
+    #end while
+
+    return q
+#end function
+
+def _point_compress(p):
+    x, y, z, t = p
+    zinv = pow(z, _P - 2, _P)
+    x = x * zinv % _P
+    y = y * zinv % _P
+    return int.to_bytes(y | ((x & 1) << 255), 32, "little")
+#end function
+
+def _sha512_int(*parts):
+    h = hashlib.sha512()
+    for part in parts:
+        if isinstance(part, bytes):
+            h.update(part)
+        else:
+            for chunk in part():
+                h.update(chunk)
+    #end for
+    return int.from_bytes(h.digest(), "little")
+#end function
+
+############################### IMPLEMENTATION ################################
+
+class UsignSigner:
+
+    def __init__(self, keyfile):
+        try:
+            with open(keyfile, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            raise BoltError("failed to read secret key '{}': {}"
+                    .format(keyfile, e.strerror))
+        #end try
+
+        if lines and lines[0].startswith(COMMENT_PREFIX):
+            lines = lines[1:]
+
+        try:
+            data = base64.b64decode("".join(lines).strip(), validate=True)
+            pkalg, kdfalg, kdfrounds, salt, checksum, fingerprint, seckey = \
+                struct.unpack(SECKEY_FORMAT, data)
+        except (ValueError, struct.error):
+            raise BoltError("failed to decode secret key '{}'."
+                    .format(keyfile))
+        #end try
+
+        if pkalg != b"Ed":
+            raise BoltError("failed to decode secret key '{}'."
+                    .format(keyfile))
+        if kdfrounds:
+            raise BoltError("password protected secret keys are not "
+                    "supported.")
+        if hashlib.sha512(seckey).digest()[:8] != checksum:
+            raise BoltError("checksum mismatch in secret key '{}'."
+                    .format(keyfile))
+
+        # Derive the key material once, so that signing many payloads only
+        # costs two hashing passes and two scalar multiplications each.
+        h = hashlib.sha512(seckey[:32]).digest()
+        a = int.from_bytes(h[:32], "little")
+        a &= (1 << 254) - 8
+        a |= (1 << 254)
+
+        self._fingerprint = fingerprint
+        self._scalar      = a
+        self._prefix      = h[32:]
+        self._pubkey      = _point_compress(_scalar_mult(a, _B))
+    #end function
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint.hex()
+
+    def sign(self, read_payload):
+        # read_payload returns an iterable over the message in chunks, it is
+        # called twice. Returns the contents of the .sig file.
+        r = _sha512_int(self._prefix, read_payload) % _L
+        R = _point_compress(_scalar_mult(r, _B))
+        k = _sha512_int(R, self._pubkey, read_payload) % _L
+        S = (r + k * self._scalar) % _L
+
+        sig = b"Ed" + self._fingerprint + R + int.to_bytes(S, 32, "little")
+
+        return "{}signed by key {}\n{}\n".format(
+            COMMENT_PREFIX,
+            self.fingerprint,
+            base64.b64encode(sig).decode("ascii")
+        ).encode("utf-8")
+    #end function
+
+#end class
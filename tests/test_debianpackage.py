@@ -0,0 +1,185 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+from collections import OrderedDict
+
+sys.path.insert(1, os.path.normpath(os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "lib")))
+
+from org.boltlinux.error import PackagingError  # noqa: E402
+from org.boltlinux.toolbox.libarchive import ArchiveFileReader  # noqa: E402
+from org.boltlinux.package.debianpackage import DebianPackage  # noqa: E402
+from org.boltlinux.package.debianpackagemetadata import \
+        DebianPackageMetaData  # noqa: E402
+
+CONTROL = """\
+Package: hello
+Version: 1.0-1
+Architecture: x86_64
+Maintainer: Jane Doe <jane@example.com>
+Description: test package
+"""
+
+
+def make_package(basedir, cls=DebianPackage):
+    # DebianPackage is normally set up from a package spec, only the parts
+    # needed to assemble a package are filled in here.
+    pkg = cls.__new__(cls)
+    pkg._basedir = basedir
+    pkg.collect_py_cache_files = True
+    pkg.architecture = "x86_64"
+    pkg.maintainer_scripts = {"postinst": "#!/bin/sh\nexit 0\n"}
+    pkg.content_spec = OrderedDict([
+        ("/usr", DebianPackage.EntryAttributes({"deftype": "file"}))
+    ])
+    pkg.generate_file_list()
+    return pkg
+#end function
+
+
+def read_members(filename):
+    with ArchiveFileReader(filename) as archive:
+        return [(entry.pathname, archive.read_data()) for entry in archive]
+
+
+def read_tarball(data):
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(data)
+        f.flush()
+
+        with ArchiveFileReader(f.name) as archive:
+            return dict([(entry.pathname, archive.read_data())
+                for entry in archive])
+    #end with
+#end function
+
+
+class OddSizedPackage(DebianPackage):
+
+    # Members with odd sizes, which must be padded to an even offset.
+
+    def write_control_part(self, meta_data, pkg_contents, ctrl_fileobj):
+        ctrl_fileobj.write(b"c" * 7)
+
+    def write_data_part(self, pkg_contents, data_fileobj):
+        data_fileobj.write(b"d" * 13)
+
+#end class
+
+
+class DebianPackageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.basedir = os.path.join(self.tmp_dir, "root")
+        self.deb_file = os.path.join(self.tmp_dir, "hello_1.0-1_amd64.deb")
+
+        os.makedirs(os.path.join(self.basedir, "usr", "bin"))
+        os.makedirs(os.path.join(self.basedir, "usr", "share", "doc"))
+
+        with open(os.path.join(self.basedir, "usr", "bin", "hello"),
+                "wb") as f:
+            f.write(b"#!/bin/sh\necho hello\n")
+        with open(os.path.join(self.basedir, "usr", "share", "doc",
+                "README"), "wb") as f:
+            f.write(b"odd")
+        os.symlink("hello", os.path.join(self.basedir, "usr", "bin", "hi"))
+    #end function
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assemble(self, cls=DebianPackage):
+        pkg = make_package(self.basedir, cls=cls)
+        pkg.assemble_parts(DebianPackageMetaData(CONTROL), pkg.contents,
+                self.deb_file)
+    #end function
+
+    def test_read_back(self):
+        self.assemble()
+
+        members = read_members(self.deb_file)
+        self.assertEqual([name for name, data in members],
+                ["debian-binary", "control.tar.gz", "data.tar.gz"])
+        self.assertEqual(members[0][1], b"2.0\n")
+
+        control = read_tarball(members[1][1])
+        self.assertEqual(sorted(control.keys()), ["control", "postinst"])
+        self.assertIn(b"Package: hello\n", control["control"])
+        self.assertIn(b"Installed-Size: ", control["control"])
+
+        data = read_tarball(members[2][1])
+        self.assertEqual(data["./usr/bin/hello"], b"#!/bin/sh\necho hello\n")
+        self.assertEqual(data["./usr/share/doc/README"], b"odd")
+        self.assertIn("./usr/bin/hi", data)
+    #end function
+
+    def test_odd_sized_members(self):
+        self.assemble(cls=OddSizedPackage)
+
+        self.assertEqual(read_members(self.deb_file), [
+            ("debian-binary", b"2.0\n"),
+            ("control.tar.gz", b"c" * 7),
+            ("data.tar.gz", b"d" * 13),
+        ])
+
+        # Every member starts at an even offset, the archive ends on one.
+        self.assertEqual(os.path.getsize(self.deb_file) % 2, 0)
+    #end function
+
+    @unittest.skipUnless(shutil.which("ar"), "ar is not installed")
+    def test_ar_listing(self):
+        for cls in [DebianPackage, OddSizedPackage]:
+            self.assemble(cls=cls)
+
+            output = subprocess.run(["ar", "t", self.deb_file],
+                    stdout=subprocess.PIPE, check=True).stdout
+            self.assertEqual(output,
+                    b"debian-binary\ncontrol.tar.gz\ndata.tar.gz\n")
+        #end for
+    #end function
+
+    def test_member_size_limit(self):
+        pkg = make_package(self.basedir)
+
+        header = pkg._ar_member_header("data.tar.gz", 10**10 - 1, 0)
+        self.assertEqual(len(header), 60)
+
+        with self.assertRaises(PackagingError):
+            pkg._ar_member_header("data.tar.gz", 10**10, 0)
+    #end function
+
+#end class
+
+
+if __name__ == "__main__":
+    unittest.main()
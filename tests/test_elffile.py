@@ -0,0 +1,258 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import sys
+import shutil
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(1, os.path.normpath(os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "lib")))
+
+from org.boltlinux.error import BoltValueError  # noqa: E402
+from org.boltlinux.toolbox.elffile import ElfFile, ELFMAG, ELFCLASS32, \
+        ELFCLASS64, ELFDATA2LSB, ELFDATA2MSB, ET_DYN, PT_LOAD, PT_DYNAMIC, \
+        PT_NOTE, SHT_DYNAMIC, SHT_NOTE, DT_NULL, DT_NEEDED, DT_STRTAB, \
+        DT_SONAME, DT_RPATH, DT_RUNPATH, NT_GNU_BUILD_ID, \
+        DYN_FORMAT  # noqa: E402
+
+BUILD_ID = bytes(range(1, 21))
+
+STRTAB = b"\0libc.so.6\0libfoo.so.1\0/opt/lib\0$ORIGIN/../lib\0libbar.so.2\0"
+
+SHT_STRTAB = 3
+
+
+def strtab_index(s):
+    return STRTAB.index(b"\0" + s + b"\0") + 1
+
+
+def align_up(n, align):
+    return (n + align - 1) & ~(align - 1)
+
+
+def make_note(endian, n_type, desc, align):
+    data = struct.pack(endian + "III", 4, len(desc), n_type) + b"GNU\0"
+    data += bytes(align_up(len(data), align) - len(data)) + desc
+    return data + bytes(align_up(len(data), align) - len(data))
+#end function
+
+
+def make_elf(elf_class, elf_data, note_align=4, with_sections=False):
+    """
+    Returns a shared object with one PT_LOAD segment mapping the whole file
+    at address 0, a dynamic section with NEEDED, RPATH, RUNPATH and SONAME
+    entries and a GNU property note followed by the build-id note.
+    """
+    e = "<" if elf_data == ELFDATA2LSB else ">"
+    is_64bit = elf_class == ELFCLASS64
+
+    ehsize    = 64 if is_64bit else 52
+    phentsize = 56 if is_64bit else 32
+    shentsize = 64 if is_64bit else 40
+    dyn_fmt   = e + ("qQ" if is_64bit else "iI")
+    phnum     = 3
+
+    strtab_off = ehsize + phnum * phentsize
+
+    dyn_entries = [
+        (DT_NEEDED,  strtab_index(b"libc.so.6")),
+        (DT_RPATH,   strtab_index(b"/opt/lib")),
+        (DT_NEEDED,  strtab_index(b"libfoo.so.1")),
+        (DT_RUNPATH, strtab_index(b"$ORIGIN/../lib")),
+        (DT_SONAME,  strtab_index(b"libbar.so.2")),
+        (DT_STRTAB,  strtab_off),
+        (DT_NULL,    0)
+    ]
+    dynamic = b"".join([struct.pack(dyn_fmt, d_tag, d_val)
+        for d_tag, d_val in dyn_entries])
+    dyn_off = align_up(strtab_off + len(STRTAB), 8)
+
+    # The property note has a descriptor of 12 bytes, so that the next
+    # note's offset depends on the alignment.
+    notes = make_note(e, 5, b"\xff" * 12, note_align) + \
+            make_note(e, NT_GNU_BUILD_ID, BUILD_ID, note_align)
+    note_off = align_up(dyn_off + len(dynamic), 8)
+
+    if with_sections:
+        sh_off = align_up(note_off + len(notes), 8)
+        shnum  = 4
+    else:
+        sh_off = 0
+        shnum  = 0
+    #end if
+
+    file_size = (sh_off + shnum * shentsize) if sh_off else \
+            note_off + len(notes)
+
+    def phdr(p_type, offset, size, align):
+        if is_64bit:
+            return struct.pack(e + "IIQQQQQQ", p_type, 4, offset, offset,
+                    offset, size, size, align)
+        return struct.pack(e + "IIIIIIII", p_type, offset, offset, offset,
+                size, size, 4, align)
+    #end inline function
+
+    def shdr(sh_type, offset, size, link, align):
+        fmt = "IIQQQQIIQQ" if is_64bit else "IIIIIIIIII"
+        return struct.pack(e + fmt, 0, sh_type, 0, offset, offset, size,
+                link, 0, align, 0)
+    #end inline function
+
+    buf = bytearray(file_size)
+
+    ident = ELFMAG + bytes([elf_class, elf_data, 1]) + bytes(9)
+    fmt = "HHIQQQIHHHHHH" if is_64bit else "HHIIIIIHHHHHH"
+    buf[0:ehsize] = ident + struct.pack(e + fmt, ET_DYN, 62, 1, 0, ehsize,
+            sh_off, 0, ehsize, phentsize, phnum, shentsize, shnum, 0)
+
+    buf[ehsize:strtab_off] = \
+        phdr(PT_LOAD, 0, file_size, 0x1000) + \
+        phdr(PT_DYNAMIC, dyn_off, len(dynamic), 8) + \
+        phdr(PT_NOTE, note_off, len(notes), note_align)
+
+    buf[strtab_off:strtab_off + len(STRTAB)] = STRTAB
+    buf[dyn_off:dyn_off + len(dynamic)] = dynamic
+    buf[note_off:note_off + len(notes)] = notes
+
+    if with_sections:
+        buf[sh_off:file_size] = \
+            shdr(0, 0, 0, 0, 0) + \
+            shdr(SHT_STRTAB, strtab_off, len(STRTAB), 0, 1) + \
+            shdr(SHT_DYNAMIC, dyn_off, len(dynamic), 1, 8) + \
+            shdr(SHT_NOTE, note_off, len(notes), 0, note_align)
+    #end if
+
+    return bytes(buf)
+#end function
+
+
+class ElfFileTest(unittest.TestCase):
+
+    LAYOUTS = [
+        (ELFCLASS32, ELFDATA2LSB),
+        (ELFCLASS32, ELFDATA2MSB),
+        (ELFCLASS64, ELFDATA2LSB),
+        (ELFCLASS64, ELFDATA2MSB)
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, data):
+        filename = os.path.join(self.tmp_dir, "libbar.so.2")
+        with open(filename, "wb") as f:
+            f.write(data)
+        return filename
+    #end function
+
+    def read_dynamic(self, filename, elf_class, elf_data):
+        elf = ElfFile(filename)
+        offset, size = elf._dynamic
+        fmt = ("<" if elf_data == ELFDATA2LSB else ">") + \
+                DYN_FORMAT[elf_class]
+
+        with open(filename, "rb") as f:
+            data = f.read()
+
+        return [d_tag for d_tag, d_val in struct.iter_unpack(fmt,
+            data[offset:offset + size])]
+    #end function
+
+    def test_headers(self):
+        for elf_class, elf_data in ElfFileTest.LAYOUTS:
+            for with_sections in [False, True]:
+                elf = ElfFile(self.write(make_elf(elf_class, elf_data,
+                    with_sections=with_sections)))
+
+                self.assertEqual(elf.word_size,
+                        32 if elf_class == ELFCLASS32 else 64)
+                self.assertEqual(elf.byte_order,
+                        "little" if elf_data == ELFDATA2LSB else "big")
+                self.assertEqual(elf.elf_type, ET_DYN)
+                self.assertEqual(elf.machine, 62)
+                self.assertTrue(elf.is_shared_object)
+                self.assertTrue(elf.is_dynamically_linked)
+                self.assertEqual(elf.needed, ["libc.so.6", "libfoo.so.1"])
+                self.assertEqual(elf.soname, "libbar.so.2")
+                self.assertEqual(elf.rpath, "/opt/lib")
+                self.assertEqual(elf.runpath, "$ORIGIN/../lib")
+                self.assertEqual(elf.build_id, BUILD_ID.hex())
+            #end for
+        #end for
+    #end function
+
+    def test_note_alignment(self):
+        for elf_class, elf_data in ElfFileTest.LAYOUTS:
+            for note_align in [4, 8]:
+                for with_sections in [False, True]:
+                    elf = ElfFile(self.write(make_elf(elf_class, elf_data,
+                        note_align=note_align, with_sections=with_sections)))
+                    self.assertEqual(elf.build_id, BUILD_ID.hex())
+                #end for
+            #end for
+        #end for
+    #end function
+
+    def test_delete_rpath(self):
+        for elf_class, elf_data in ElfFileTest.LAYOUTS:
+            filename = self.write(make_elf(elf_class, elf_data))
+
+            self.assertTrue(ElfFile(filename).delete_rpath())
+
+            # The remaining entries move up, the table is padded with
+            # DT_NULL and keeps its size.
+            self.assertEqual(self.read_dynamic(filename, elf_class,
+                elf_data), [DT_NEEDED, DT_NEEDED, DT_SONAME, DT_STRTAB,
+                    DT_NULL, DT_NULL, DT_NULL])
+
+            elf = ElfFile(filename)
+            self.assertIsNone(elf.rpath)
+            self.assertIsNone(elf.runpath)
+            self.assertEqual(elf.needed, ["libc.so.6", "libfoo.so.1"])
+            self.assertEqual(elf.soname, "libbar.so.2")
+            self.assertEqual(elf.build_id, BUILD_ID.hex())
+
+            self.assertFalse(elf.delete_rpath())
+        #end for
+    #end function
+
+    def test_not_an_elf_file(self):
+        with self.assertRaises(BoltValueError):
+            ElfFile(self.write(b"#!/bin/sh\n"))
+        with self.assertRaises(BoltValueError):
+            ElfFile(self.write(make_elf(ELFCLASS64, ELFDATA2LSB)[:100]))
+    #end function
+
+#end class
+
+
+if __name__ == "__main__":
+    unittest.main()
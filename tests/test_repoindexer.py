@@ -0,0 +1,403 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import sys
+import gzip
+import json
+import stat
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+sys.path.insert(1, os.path.normpath(os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "lib")))
+
+import org.boltlinux.toolbox.libarchive as libarchive  # noqa: E402
+from org.boltlinux.toolbox.libarchive import ArchiveEntry, \
+        ArchiveFileWriter  # noqa: E402
+from org.boltlinux.repository.repoindexer import RepoIndexer  # noqa: E402
+from org.boltlinux.repository.repoingester import \
+        RepoIngester  # noqa: E402
+from org.boltlinux.repository.repoindexcache import \
+        RepoIndexCache  # noqa: E402
+
+
+def write_tarball(filename, members):
+    with ArchiveFileWriter(filename, libarchive.FORMAT_TAR_USTAR,
+            libarchive.COMPRESSION_GZIP) as archive:
+        with ArchiveEntry() as entry:
+            for name, data in members:
+                entry.clear()
+                entry.pathname = name
+                entry.mode = stat.S_IFREG | 0o644
+                entry.size = len(data)
+                entry.uname = "root"
+                entry.gname = "root"
+                archive.write_entry(entry)
+                archive.write_data(data)
+            #end for
+        #end with
+    #end with
+#end function
+
+
+def make_package(pool_dir, name, version, description="test package",
+        files=None, arch="x86_64", control=None):
+    """
+    Writes a minimal .bolt file to pool_dir and returns its path. control
+    replaces the generated control file.
+    """
+    if files is None:
+        files = ["./usr/share/doc/{}/README".format(name)]
+
+    control = control or (
+        "Package: {}\n"
+        "Version: {}\n"
+        "Architecture: {}\n"
+        "Maintainer: Jane Doe <jane@example.com>\n"
+        "Description: {}\n"
+    ).format(name, version, arch, description).encode("utf-8")
+
+    pkg_dir  = os.path.join(pool_dir, name[0], name)
+    filename = os.path.join(pkg_dir, "{}_{}_{}.bolt".format(
+        name, version.split(":")[-1], arch.replace("_", "-")))
+    os.makedirs(pkg_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, "debian-binary"), "wb") as f:
+            f.write(b"2.0\n")
+
+        write_tarball(os.path.join(tmp_dir, "control.tar.gz"),
+                [("control", control)])
+        write_tarball(os.path.join(tmp_dir, "data.tar.gz"),
+                [(path, b"data") for path in files])
+
+        # Write through the existing file to keep its inode, like cp does.
+        with ArchiveFileWriter(filename, libarchive.FORMAT_AR_SVR4,
+                libarchive.COMPRESSION_NONE) as archive:
+            for member in ["debian-binary", "control.tar.gz", "data.tar.gz"]:
+                archive.add_file(os.path.join(tmp_dir, member),
+                        pathname=member)
+        #end with
+    #end with
+
+    return filename
+#end function
+
+
+def sha256sum(filename):
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def age_tree(path, seconds=3600):
+    # Move all timestamps into the past, so that directory listings are
+    # trusted by the index cache.
+    then = os.stat(path).st_mtime - seconds
+
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.utime(os.path.join(root, name), (then, then))
+    os.utime(path, (then, then))
+#end function
+
+
+class RepoIndexerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def index(self, **kwargs):
+        RepoIndexer(self.repo_dir, **kwargs).update_package_index()
+        return RepoIndexer(self.repo_dir).load_package_index()[0]
+
+    def check_overwrite_in_place(self, **kwargs):
+        make_package(self.repo_dir, "foo", "1.0-1")
+        filename = make_package(self.repo_dir, "bar", "1.0-2")
+        self.index(**kwargs)
+
+        age_tree(self.repo_dir)
+        inode = os.stat(filename).st_ino
+        make_package(self.repo_dir, "bar", "1.0-2",
+                description="rebuilt package")
+        self.assertEqual(os.stat(filename).st_ino, inode)
+
+        index = self.index(**kwargs)
+        meta_data = index["bar"]["1.0-2"]
+        self.assertEqual(meta_data["SHA256"], sha256sum(filename))
+        self.assertEqual(meta_data["Description"], "rebuilt package")
+        self.assertEqual(sorted(index.keys()), ["bar", "foo"])
+        self.assertEqual(len(index["bar"]), 1)
+    #end function
+
+    def test_overwrite_in_place(self):
+        self.check_overwrite_in_place()
+
+    def test_overwrite_in_place_streaming(self):
+        self.check_overwrite_in_place(streaming=True)
+
+    def check_overwrite_with_other_package(self, **kwargs):
+        make_package(self.repo_dir, "foo", "1.0-1")
+        filename = make_package(self.repo_dir, "bar", "1.0-2")
+        self.index(**kwargs)
+
+        age_tree(self.repo_dir)
+        other_dir = tempfile.mkdtemp()
+        try:
+            other = make_package(other_dir, "baz", "2.0-1")
+            with open(other, "rb") as f_in, open(filename, "wb") as f_out:
+                f_out.write(f_in.read())
+        finally:
+            shutil.rmtree(other_dir)
+        #end try
+
+        index = self.index(**kwargs)
+        self.assertEqual(sorted(index.keys()), ["baz", "foo"])
+        meta_data = index["baz"]["2.0-1"]
+        self.assertEqual(meta_data["SHA256"], sha256sum(filename))
+        self.assertEqual(meta_data["Filename"],
+                os.path.relpath(filename, self.repo_dir))
+    #end function
+
+    def test_overwrite_with_other_package(self):
+        self.check_overwrite_with_other_package()
+
+    def test_overwrite_with_other_package_streaming(self):
+        self.check_overwrite_with_other_package(streaming=True)
+
+    def test_force_full_bypasses_cache(self):
+        filename = make_package(self.repo_dir, "bar", "1.0-2")
+        self.index()
+
+        # Corrupt the cached control data, a full run must not use it.
+        cache_file = os.path.join(self.repo_dir, RepoIndexCache.CACHE_FILE)
+        with open(cache_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for entry in data["files"].values():
+            entry["control"] = entry["control"].replace("SHA256: ",
+                    "SHA256: 0")
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+        index = self.index(force_full=True)
+        self.assertEqual(index["bar"]["1.0-2"]["SHA256"], sha256sum(filename))
+    #end function
+
+#end class
+
+
+class RecordingRepoIndexer(RepoIndexer):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.extracted = []
+
+    def _try_extract_package_data(self, filename):
+        self.extracted.append(os.path.basename(filename))
+        return super()._try_extract_package_data(filename)
+
+#end class
+
+
+class ContentsIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+
+        make_package(self.repo_dir, "foo", "1.0-1",
+                files=["./usr/bin/foo", "./usr/lib/libfoo.so.1"])
+        make_package(self.repo_dir, "bar", "1.0-1",
+                files=["./usr/bin/bar", "./usr/share/man/bar.1"])
+        make_package(self.repo_dir, "data", "1.0-1", arch="all",
+                files=["./usr/share/data/file with spaces"])
+    #end function
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def index(self, **kwargs):
+        indexer = RecordingRepoIndexer(self.repo_dir, contents=True,
+                **kwargs)
+        indexer.update_package_index()
+        return indexer.extracted
+    #end function
+
+    def contents(self, arch="x86_64"):
+        with gzip.open(os.path.join(self.repo_dir,
+                "Contents-{}.gz".format(arch)), "rt") as f:
+            return f.read()
+    #end function
+
+    def check_incremental_update(self, **kwargs):
+        self.index(**kwargs)
+
+        self.assertEqual(self.contents(), (
+            "usr/bin/bar bar\n"
+            "usr/bin/foo foo\n"
+            "usr/lib/libfoo.so.1 foo\n"
+            "usr/share/data/file with spaces data\n"
+            "usr/share/man/bar.1 bar\n"
+        ))
+
+        # A second version of foo that drops and adds a file, a new
+        # package sharing a path with bar, then the first foo is pruned.
+        make_package(self.repo_dir, "foo", "1.1-1",
+                files=["./usr/bin/foo", "./usr/lib/libfoo.so.2"])
+        make_package(self.repo_dir, "baz", "1.0-1",
+                files=["./usr/bin/bar", "./usr/bin/baz"])
+        os.unlink(os.path.join(self.repo_dir, "f", "foo",
+            "foo_1.0-1_x86-64.bolt"))
+
+        extracted = self.index(use_cache=False, **kwargs)
+
+        self.assertEqual(self.contents(), (
+            "usr/bin/bar bar,baz\n"
+            "usr/bin/baz baz\n"
+            "usr/bin/foo foo\n"
+            "usr/lib/libfoo.so.2 foo\n"
+            "usr/share/data/file with spaces data\n"
+            "usr/share/man/bar.1 bar\n"
+        ))
+
+        # Only the new packages are read, the others are taken from the
+        # existing Contents file.
+        self.assertEqual(sorted(set(extracted)), [
+            "baz_1.0-1_x86-64.bolt",
+            "foo_1.1-1_x86-64.bolt"
+        ])
+
+        incremental = self.contents()
+        self.index(force_full=True, **kwargs)
+        self.assertEqual(self.contents(), incremental)
+    #end function
+
+    def test_incremental_update(self):
+        self.check_incremental_update()
+
+    def test_incremental_update_streaming(self):
+        self.check_incremental_update(streaming=True)
+
+    def test_architectures(self):
+        self.index()
+        self.assertEqual(sorted(f for f in os.listdir(self.repo_dir)
+            if f.startswith("Contents-")), ["Contents-x86_64.gz"])
+
+        make_package(self.repo_dir, "qux", "1.0-1", arch="aarch64",
+                files=["./usr/bin/qux"])
+        self.index()
+
+        self.assertEqual(self.contents("aarch64"), (
+            "usr/bin/qux qux\n"
+            "usr/share/data/file with spaces data\n"
+        ))
+        self.assertIn("usr/bin/foo foo\n", self.contents("x86_64"))
+    #end function
+
+#end class
+
+
+class RepoIngesterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+        self.incoming_dir = tempfile.mkdtemp()
+
+        make_package(self.repo_dir, "foo", "1.0-1", files=["./usr/bin/foo"])
+        RepoIndexer(self.repo_dir, contents=True).update_package_index()
+
+        self.ingester = RepoIngester(
+            RecordingRepoIndexer(self.repo_dir, contents=True),
+            self.incoming_dir
+        )
+    #end function
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+        shutil.rmtree(self.incoming_dir)
+
+    def upload(self, name, version, **kwargs):
+        filename = make_package(self.incoming_dir, name, version, **kwargs)
+        basename = os.path.basename(filename)
+        os.rename(filename, os.path.join(self.incoming_dir, basename))
+        shutil.rmtree(os.path.join(self.incoming_dir, name[0]))
+        return basename
+    #end function
+
+    def test_contents_and_cache(self):
+        filename = self.upload("qux", "1.0-1", files=["./usr/bin/qux"])
+        self.assertEqual(self.ingester.ingest([filename]), 1)
+
+        index = RepoIndexer(self.repo_dir).load_package_index()[0]
+        self.assertEqual(sorted(index.keys()), ["foo", "qux"])
+
+        with gzip.open(os.path.join(self.repo_dir, "Contents-x86_64.gz"),
+                "rt") as f:
+            self.assertEqual(f.read(),
+                    "usr/bin/foo foo\nusr/bin/qux qux\n")
+
+        # The next regular run finds everything in the cache.
+        indexer = RecordingRepoIndexer(self.repo_dir, contents=True)
+        indexer.update_package_index()
+        self.assertEqual(indexer.extracted, [])
+    #end function
+
+    def test_reject_malformed_uploads(self):
+        with open(os.path.join(self.incoming_dir, "junk_1.0_x86-64.bolt"),
+                "wb") as f:
+            f.write(b"not an archive")
+
+        uploads = [
+            "junk_1.0_x86-64.bolt",
+            self.upload("nameless", "1.0-1",
+                control=b"Version: 1.0-1\nArchitecture: x86_64\n"),
+            self.upload("latin", "1.0-1",
+                control=b"Package: latin\nDescription: \xe4\n"),
+            self.upload("qux", "1.0-1")
+        ]
+
+        with self.assertLogs("org.boltlinux.repository", "ERROR") as logs:
+            self.assertEqual(self.ingester.ingest(sorted(uploads)), 1)
+        self.assertEqual(len(logs.records), 3)
+
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.incoming_dir,
+                RepoIngester.REJECTED_DIR))),
+            sorted(uploads[:3])
+        )
+
+        index = RepoIndexer(self.repo_dir).load_package_index()[0]
+        self.assertEqual(sorted(index.keys()), ["foo", "qux"])
+    #end function
+
+#end class
+
+
+if __name__ == "__main__":
+    unittest.main()
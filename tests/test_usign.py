@@ -0,0 +1,176 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import sys
+import base64
+import hashlib
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(1, os.path.normpath(os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "lib")))
+
+from org.boltlinux.toolbox import usign  # noqa: E402
+from org.boltlinux.toolbox.usign import UsignSigner  # noqa: E402
+
+# (secret key, public key, message, signature) from RFC 8032, section 7.1.
+RFC8032_VECTORS = [
+    (
+        "9d61b19deffd5a60ba844af492ec2cc44449c5697b326919703bac031cae7f60",
+        "d75a980182b10ab7d54bfed3c964073a0ee172f3daa62325af021a68f707511a",
+        "",
+        "e5564300c360ac729086e2cc806e828a84877f1eb8e5d974d873e06522490155"
+        "5fb8821590a33bacc61e39701cf9b46bd25bf5f0595bbe24655141438e7a100b"
+    ),
+    (
+        "4ccd089b28ff96da9db6c346ec114e0f5b8a319f35aba624da8cf6ed4fb8a6fb",
+        "3d4017c3e843895a92b70aa74d1b7ebc9c982ccf2ec4968cc0cd55f12af4660c",
+        "72",
+        "92a009a9f0d4cab8720e820b5f642540a2b27b5416503f8fb3762223ebdb69da"
+        "085ac1e43e15996e458f3613d0f11d8c387b2eaeb4302aeeb00d291612bb0c00"
+    ),
+    (
+        "c5aa8df43f9f837bedb7442f31dcb7b166d38535076f094b85ce3a2e0b4458f7",
+        "fc51cd8e6218a1a38da47ed00230f0580816ed13ba3303ac5deb911548908025",
+        "af82",
+        "6291d657deec24024827e69c3abe01a30ce548a284743a445e3680d7db5ac3ac"
+        "18ff9b538d16f290ae67f760984dc6594a7c15e9716ed28dc027beceea1ec40a"
+    ),
+]
+
+FINGERPRINT = bytes.fromhex("0102030405060708")
+
+def write_seckey(filename, seed, pubkey, fingerprint=FINGERPRINT):
+    # Unencrypted secret key as written by `usign -G` with an empty
+    # password.
+    seckey = seed + pubkey
+    data = struct.pack(usign.SECKEY_FORMAT, b"Ed", b"BK", 0, bytes(16),
+            hashlib.sha512(seckey).digest()[:8], fingerprint, seckey)
+
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(usign.COMMENT_PREFIX + "test secret key\n")
+        f.write(base64.b64encode(data).decode("ascii") + "\n")
+#end function
+
+def pubkey_file(pubkey, fingerprint=FINGERPRINT):
+    # Public key as written by `usign -G`.
+    return usign.COMMENT_PREFIX + "test public key\n" + \
+        base64.b64encode(b"Ed" + fingerprint + pubkey).decode("ascii") + "\n"
+#end function
+
+def ed25519_verify(pubkey, message, signature):
+    # [S]B == R + [k]A, the check usign -V performs.
+    def decompress(data):
+        y = int.from_bytes(data, "little")
+        sign, y = y >> 255, y & ((1 << 255) - 1)
+        x = usign._recover_x(y, sign)
+        return (x, y, 1, x * y % usign._P)
+    #end inline function
+
+    R, S = signature[:32], int.from_bytes(signature[32:], "little")
+    k = int.from_bytes(hashlib.sha512(R + pubkey + message).digest(),
+            "little") % usign._L
+
+    lhs = usign._scalar_mult(S, usign._B)
+    rhs = usign._point_add(decompress(R),
+            usign._scalar_mult(k, decompress(pubkey)))
+
+    return usign._point_compress(lhs) == usign._point_compress(rhs)
+#end function
+
+class UsignSignerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.keyfile = os.path.join(self.tmpdir.name, "key.sec")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def sign(self, message):
+        sig_file = UsignSigner(self.keyfile).sign(lambda: [message])
+        comment, data = sig_file.decode("ascii").splitlines()
+        return comment, base64.b64decode(data, validate=True)
+    #end function
+
+    def test_rfc8032_vectors(self):
+        for seed, pubkey, message, signature in RFC8032_VECTORS:
+            write_seckey(self.keyfile, bytes.fromhex(seed),
+                    bytes.fromhex(pubkey))
+
+            comment, sig = self.sign(bytes.fromhex(message))
+
+            self.assertEqual(sig[:2], b"Ed")
+            self.assertEqual(sig[2:10], FINGERPRINT)
+            self.assertEqual(sig[10:].hex(), signature)
+        #end for
+    #end function
+
+    def test_usign_round_trip(self):
+        seed = hashlib.sha256(b"bolt").digest()
+
+        # Derive the public key the way usign does.
+        h = hashlib.sha512(seed).digest()
+        a = int.from_bytes(h[:32], "little") & ((1 << 254) - 8) | (1 << 254)
+        pubkey = usign._point_compress(usign._scalar_mult(a, usign._B))
+
+        write_seckey(self.keyfile, seed, pubkey)
+
+        message = b"Package: foo\nVersion: 1.0-1\n" * 1000
+        comment, sig = self.sign(message)
+
+        self.assertEqual(comment, usign.COMMENT_PREFIX +
+                "signed by key " + FINGERPRINT.hex())
+
+        # Check the signature against the key from the .pub file, like
+        # `usign -V -p key.pub -m Packages` would.
+        pub_data = base64.b64decode(pubkey_file(pubkey).splitlines()[1])
+
+        self.assertEqual(pub_data[:2], sig[:2])
+        self.assertEqual(pub_data[2:10], sig[2:10])
+        self.assertTrue(ed25519_verify(pub_data[10:], message, sig[10:]))
+        self.assertFalse(ed25519_verify(pub_data[10:], message + b"x",
+            sig[10:]))
+    #end function
+
+    def test_chunked_payload(self):
+        seed, pubkey, message, signature = RFC8032_VECTORS[2]
+        write_seckey(self.keyfile, bytes.fromhex(seed),
+                bytes.fromhex(pubkey))
+
+        message = bytes.fromhex(message)
+        signer  = UsignSigner(self.keyfile)
+
+        self.assertEqual(signer.sign(lambda: [message]),
+                signer.sign(lambda: [message[:1], message[1:]]))
+    #end function
+
+#end class
+
+
+if __name__ == "__main__":
+    unittest.main()
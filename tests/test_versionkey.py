@@ -0,0 +1,129 @@
+# -*- encoding: utf-8 -*-
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2016-2018 Tobias Koch <tobias.koch@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+
+import os
+import sys
+import shutil
+import subprocess
+import unittest
+
+sys.path.insert(1, os.path.normpath(os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "lib")))
+
+from org.boltlinux.package.versionkey import compare_versions, \
+        encode_version  # noqa: E402
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+        "data", "dpkg-versions.txt")
+
+
+def load_corpus():
+    """
+    Returns a list of (version, rank) tuples in ascending dpkg order. Equal
+    versions share the same rank.
+    """
+    corpus = []
+    rank   = -1
+
+    with open(CORPUS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+
+            if not line or line.startswith("#"):
+                continue
+
+            if line.startswith("= "):
+                line = line[2:]
+            else:
+                rank += 1
+
+            corpus.append((line, rank))
+        #end for
+    #end with
+
+    return corpus
+#end function
+
+
+def dpkg_compare(a, op, b):
+    return subprocess.run(["dpkg", "--compare-versions", a, op, b],
+            stderr=subprocess.DEVNULL).returncode == 0
+#end function
+
+
+class VersionKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = load_corpus()
+
+    def test_compare_versions(self):
+        for a, rank_a in self.corpus:
+            for b, rank_b in self.corpus:
+                expected = (rank_a > rank_b) - (rank_a < rank_b)
+                result   = compare_versions(a, b)
+                self.assertEqual((result > 0) - (result < 0), expected,
+                        "{} vs {}".format(a, b))
+            #end for
+        #end for
+    #end function
+
+    def test_encode_version(self):
+        for a, rank_a in self.corpus:
+            key_a = encode_version(a)
+
+            for b, rank_b in self.corpus:
+                key_b    = encode_version(b)
+                expected = (rank_a > rank_b) - (rank_a < rank_b)
+                self.assertEqual((key_a > key_b) - (key_a < key_b), expected,
+                        "{} vs {}".format(a, b))
+            #end for
+        #end for
+    #end function
+
+    def test_encode_long_numbers(self):
+        versions = ["1." + "9" * 254, "1." + "1" * 255, "1." + "9" * 255,
+                "1." + "1" * 256, "1." + "1" * 4000]
+        keys = [encode_version(v) for v in versions]
+        self.assertEqual(keys, sorted(keys))
+        # Keys of shorter numbers must not change.
+        self.assertEqual(encode_version("1.42"),
+                "00002011130002024200200002000020000200")
+    #end function
+
+    @unittest.skipUnless(shutil.which("dpkg"), "dpkg is not installed")
+    def test_corpus_matches_dpkg(self):
+        # The order is total, so checking neighbours covers every pair.
+        for (a, rank_a), (b, rank_b) in zip(self.corpus, self.corpus[1:]):
+            op = "eq" if rank_a == rank_b else "lt"
+            self.assertTrue(dpkg_compare(a, op, b),
+                    "dpkg disagrees: {} {} {}".format(a, op, b))
+        #end for
+    #end function
+
+#end class
+
+
+if __name__ == "__main__":
+    unittest.main()